@@ -4,6 +4,8 @@
 from abc import ABC, abstractmethod
 from typing import List
 
+import numpy as np
+
 from sweetpea._internal.primitive import Factor
 
 
@@ -51,5 +53,22 @@ class Constraint(ABC):
         """
         pass
 
+    def potential_prefix_conforms(self, sample: dict, block, start: int, end: int) -> bool:
+        """Like :func:`potential_sample_conforms`, but for a sample that so
+        far has only its first `end` trials, where the first `start` trials
+        have already been checked. Reports False only when no continuation of
+        the sample can conform, so that rejection sampling can abandon a
+        candidate early.
+        """
+        return True
+
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block) -> np.ndarray:
+        """Like :func:`potential_sample_conforms`, but checks a batch of
+        samples that are coded as a (samples, trials, factors) array by a
+        :class:`.SampleCoding`, and returns an array of booleans with one
+        result per sample.
+        """
+        return np.array([self.potential_sample_conforms(coding.decode(c), block) for c in codes], dtype=bool)
+
     def set_within_block(self) -> None:
         pass
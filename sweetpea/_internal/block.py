@@ -3,11 +3,12 @@ a factorial experimental design.
 """
 
 from abc import abstractmethod
-from functools import reduce
-from itertools import accumulate, combinations, product, repeat
+from itertools import combinations, product
 from typing import List, Union, Tuple, Optional, cast, Any, Dict, Set, Callable, TypeVar
 from math import ceil
 from networkx import has_path
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
 
 from sweetpea._internal.backend import BackendRequest
 from sweetpea._internal.level import get_all_levels
@@ -18,11 +19,67 @@ from sweetpea._internal.logic import to_cnf_tseitin
 from sweetpea._internal.base_constraint import Constraint
 from sweetpea._internal.design_graph import DesignGraph
 from sweetpea._internal.iter import chunk_dict
+from sweetpea._internal.layout import VariableLayout, TrialMajorLayout
 from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.argcheck import argcheck, make_islistof
 
 T = TypeVar('T')
-            
+
+
+class _ExclusionTrieNode:
+    """A node in the trie of derived exclusions. A path from the root to a
+    node marked as `excluded` spells out a partial combination of factor
+    levels that is excluded, with factors in a consistent order."""
+
+    def __init__(self) -> None:
+        self.excluded = False
+        self.children = cast(Dict[Factor, Dict[Level, '_ExclusionTrieNode']], {})
+
+
+class _ExclusionIndex:
+    """Indexes a block's `exclude` and `excluded_derived` lists, so that
+    checking a combination costs time proportional to the number of factors
+    in the combination instead of the number of exclusions."""
+
+    def __init__(self,
+                 exclude: List[Tuple[Factor, Union[SimpleLevel, DerivedLevel]]],
+                 excluded_derived: List[Dict[Factor, SimpleLevel]]) -> None:
+        self.sizes = (len(exclude), len(excluded_derived))
+        self.levels = cast(Dict[Factor, Set[Level]], {})
+        for f, l in exclude:
+            self.levels.setdefault(f, set()).add(l)
+        # Number factors in order of first appearance, and insert each
+        # derived exclusion along a path that follows that order:
+        order = cast(Dict[Factor, int], {})
+        self.root = _ExclusionTrieNode()
+        for e in excluded_derived:
+            for f in e:
+                order.setdefault(f, len(order))
+            node = self.root
+            for f in sorted(e.keys(), key=lambda f: order[f]):
+                node = node.children.setdefault(f, {}).setdefault(e[f], _ExclusionTrieNode())
+            node.excluded = True
+
+    def is_excluded_level(self, f: Factor, l: Level) -> bool:
+        levels = self.levels.get(f, None)
+        return levels is not None and l in levels
+
+    def is_excluded_combination(self, di: Dict[Factor, SimpleLevel]) -> bool:
+        for f, l in di.items():
+            if self.is_excluded_level(f, l):
+                return True
+        nodes = [self.root]
+        while nodes:
+            node = nodes.pop()
+            if node.excluded:
+                return True
+            for f, by_level in node.children.items():
+                child = by_level.get(di[f], None) if f in di else None
+                if child:
+                    nodes.append(child)
+        return False
+
+
 class Block:
     """Abstract class for Blocks. Contains the required data, and defines
     abstract methods that other blocks _must_ implement in order to work
@@ -51,8 +108,10 @@ class Block:
         self.within_block_preamble = cast(Optional[int], None)
         self._simple_tuples = cast(Optional[List[Tuple[Factor, Union[SimpleLevel, DerivedLevel]]]], None)
         self._variables_per_trial = None
+        self._exclusion_index = cast(Optional[_ExclusionIndex], None)
+        self.variable_layout = cast(VariableLayout, TrialMajorLayout())
+        self._layout_shape = cast(Optional[Tuple[int, int, int]], None)
         self.__validate(who)
-        self._cached_previous_count = cast(Dict[Tuple[Factor, int], int], {})
 
     def show_errors(self) -> bool:
         failed = False
@@ -150,7 +209,8 @@ class Block:
         Alternatively stated, this returns the number of variables in the
         formula that constitute the independent support.
         """
-        return reduce(lambda sum, f: sum + self.variables_for_factor(f), self.act_design, 0)
+        trial_count = self.trials_per_sample()
+        return sum([len(f.levels) * f.applicable_trials_through(trial_count) for f in self.act_design])
 
     def support_variables(self) -> List[int]:
         """Returns the variables for all non-derived factors for all trials.
@@ -166,8 +226,46 @@ class Block:
                              start: int = 0,
                              end: Optional[int] = None) -> int:
         """Indicates the number of variables needed to encode this factor."""
-        trial_list = range(1 + start, (end if end else self.trials_per_sample()) + 1)
-        return reduce(lambda sum, t: sum + len(f.levels) if f.applies_to_trial(t) else sum, trial_list, 0)
+        end = end if end else self.trials_per_sample()
+        if end <= start:
+            return 0
+        return len(f.levels) * (f.applicable_trials_through(end) - f.applicable_trials_through(start))
+
+    def use_variable_layout(self, layout: VariableLayout) -> None:
+        """Selects how grid variables are numbered in the formula that is
+        passed to a solver. See :mod:`sweetpea._internal.layout`."""
+        self.variable_layout = layout
+        self._layout_shape = None
+
+    def __grid_shape(self) -> Tuple[int, int, int]:
+        # The grid size, trial count, and trial size, which are fixed once
+        # variables are being laid out
+        if self._layout_shape is None:
+            self._layout_shape = (self.grid_variables(), self.trials_per_sample(), self.variables_per_trial())
+        return self._layout_shape
+
+    def layout_variable(self, variable: Any) -> Any:
+        """Converts a 1-based variable in the canonical, trial-major
+        numbering to the variable used in the formula. The argument can be an
+        integer or a NumPy integer array."""
+        if type(self.variable_layout) is TrialMajorLayout:
+            return variable
+        grid, trial_count, trial_size = self.__grid_shape()
+        formula = self.variable_layout.to_formula(variable - 1, trial_count, trial_size) + 1
+        if isinstance(variable, np.ndarray):
+            return np.where(variable <= grid, formula, variable)
+        return formula if variable <= grid else variable
+
+    def canonical_variable(self, variable: int) -> int:
+        """Converts a 1-based variable used in the formula back to the
+        canonical, trial-major numbering. This is the inverse of
+        :func:`.Block.layout_variable`."""
+        if type(self.variable_layout) is TrialMajorLayout:
+            return variable
+        grid, trial_count, trial_size = self.__grid_shape()
+        if variable > grid:
+            return variable
+        return self.variable_layout.from_formula(variable - 1, trial_count, trial_size) + 1
 
     def has_factor(self, factor: Factor) -> Factor:
         """Determines whether a given factor is in this block."""
@@ -201,24 +299,9 @@ class Block:
             return simple_levels.index((factor, level))
 
     def _get_previous_trials_variable_count(self, f: Factor, trial: int):
-        """The `trial` argument is 1-based."""
-        t = trial
-        while True:
-            maybe_count = cast(Optional[int], 0)
-            if t == 1:
-                maybe_count = 0
-            else:
-                key = (f, t)
-                maybe_count = self._cached_previous_count.get(key, None)
-            if maybe_count is not None:
-                count = maybe_count
-                while t < trial:
-                    if (f.applies_to_trial(t)):
-                        count += 1
-                    t += 1
-                    self._cached_previous_count[(f, t)] = count
-                return count
-            t -= 1
+        """The number of trials before `trial` to which `f` applies. The
+        `trial` argument is 1-based."""
+        return f.applicable_trials_through(trial - 1)
 
     def factor_variables_for_trial(self, f: Factor, t: int) -> List[int]:
         """Given a factor and a trial number (1-based) this function will
@@ -230,15 +313,16 @@ class Block:
 
         previous_trials = self._get_previous_trials_variable_count(f, t)
         # this could be computed once per factor after self.exclude is in place
+        exclusions = self._get_exclusion_index()
         initial_sequence = list(map(lambda l: self.first_variable_for_level(f, l),
-                                    list(filter(lambda l: (f, l) not in self.exclude,
+                                    list(filter(lambda l: not exclusions.is_excluded_level(f, l),
                                                 f.levels))))
         offset = 0
         if f.has_complex_window:
             offset = len(f.levels) * previous_trials
         else:
             offset = self.variables_per_trial() * previous_trials
-        return list(map(lambda n: n + offset + 1, initial_sequence))
+        return list(map(lambda n: self.layout_variable(n + offset + 1), initial_sequence))
 
     def variable_list_for_trial(self, t: int) -> List[List[int]]:
         """Given a trial number (1-based) this function will return a list of
@@ -272,7 +356,7 @@ class Block:
             offset += len(f.levels) * previous_trials
         else:
             offset += self.variables_per_trial() * previous_trials
-        return offset + 1
+        return self.layout_variable(offset + 1)
 
     def encode_combination(self, combination: Dict[Factor, Level], trial: int):
         return tuple([self._encode_variable(f, l, trial) for f, l in combination.items()])
@@ -281,6 +365,11 @@ class Block:
         """Given a variable number from the SAT formula, this method will
         return the associated factor and level name.
         """
+        return self.decode_canonical_variable(self.canonical_variable(variable))
+
+    def decode_canonical_variable(self, variable: int) -> Tuple[Factor, Union[SimpleLevel, DerivedLevel]]:
+        """Like :func:`.Block.decode_variable`, but for a variable in the
+        canonical, trial-major numbering."""
         # Shift to zero-based index
         variable -= 1
 
@@ -305,13 +394,19 @@ class Block:
     def is_excluded_combination(self, di: Dict[Factor, SimpleLevel]) -> bool:
         """Given a combination of levels, reports whether this combination has been excluded,
         either explicitly or implicitly by the definition of a derived level."""
-        # Check based on excluded simple levels:
-        if any([t[0] in di and di[t[0]] == t[1] for t in self.exclude]):
-            return True
-        # Check based on excluded derived levels and derived-level definitions:
-        if any([all([e[ex_level] == di.get(ex_level, None) for ex_level in e]) for e in self.excluded_derived]):
-            return True
-        return False
+        # Checks both excluded simple levels and excluded derived levels (as
+        # combinations of simple levels) using an index:
+        return self._get_exclusion_index().is_excluded_combination(di)
+
+    def _get_exclusion_index(self) -> _ExclusionIndex:
+        """Returns an index of `self.exclude` and `self.excluded_derived`,
+        rebuilding it if constraint validation has added exclusions since the
+        index was last built."""
+        index = self._exclusion_index
+        if index is None or index.sizes != (len(self.exclude), len(self.excluded_derived)):
+            index = _ExclusionIndex(self.exclude, self.excluded_derived)
+            self._exclusion_index = index
+        return index
 
     def is_excluded_or_inconsistent_combination(self, di: Dict[Factor, SimpleLevel]) -> bool:
         """Like extends is_excluded_combination to also check for combinations that are
@@ -390,35 +485,86 @@ class Block:
     def add_implied_levels(self, results: dict) -> dict:
         """Given a dictionary for an experiment that maps all non-implied factors to their levels,
         adds level values for implied factors"""
-        n = len(list(results.values())[0])
-        for f in self.design:
-            if f not in self.act_design:
+        return self.add_implied_levels_to_samples([results])[0]
+
+    def add_implied_levels_to_samples(self, samples: List[dict]) -> List[dict]:
+        """Like :func:`.Block.add_implied_levels`, but for a batch of
+        experiments at once. The argument windows of each implied factor are
+        integer-coded across all experiments, so each level predicate is
+        evaluated once per distinct window instead of once per trial."""
+        implied = [f for f in self.design if f not in self.act_design]
+        if not implied or not samples:
+            return samples
+        # Fill in shallower factors first, in case an implied factor
+        # depends on another implied factor:
+        implied.sort(key=lambda f: f._get_depth())
+        by_length = cast(Dict[int, List[dict]], {})
+        for results in samples:
+            by_length.setdefault(len(list(results.values())[0]), []).append(results)
+        for n, group in by_length.items():
+            for f in implied:
+                self.__fill_implied_factor(f, group, n)
+        return samples
+
+    def __fill_implied_factor(self, f: Factor, group: List[dict], n: int) -> None:
+        w = cast(DerivedLevel, f.first_level).window
+        applies = [i for i in range(n) if f.applies_to_trial(i + 1)]
+        if not applies:
+            for results in group:
+                results[f.name] = [""] * n
+            return
+
+        # Code each window factor's level names as integers, where code
+        # `len(values)` stands for a trial before the first one:
+        windowss = []
+        decoders = []
+        for df in w.factors:
+            codes = cast(Dict[Any, int], {})
+            coded = np.array([[codes.setdefault(v, len(codes)) for v in results[df.name]] for results in group],
+                             dtype=np.int64).reshape(len(group), n)
+            values = cast(List[Any], list(codes.keys())) + [None]
+            padded = np.concatenate([np.full((len(group), w.width - 1), len(codes), dtype=np.int64), coded], axis=1)
+            windowss.append(sliding_window_view(padded, w.width, axis=1)[:, applies, :])
+            decoders.append(values)
+        keys = np.concatenate(windowss, axis=2).reshape(-1, len(w.factors) * w.width)
+        unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+
+        # Evaluate the level predicates once for each distinct window:
+        table = []
+        for key in unique_keys.tolist():
+            args = [decoders[idx][key[idx * w.width + j]] for idx in range(len(w.factors)) for j in range(w.width)]
+            if w.width > 1:
+                args = list(chunk_dict(args, w.width))
+            names = []
+            for l in f.levels:
+                if isinstance(l, ElseLevel):
+                    names.append(l.name)
+                elif isinstance(l, DerivedLevel):
+                    if l.window.predicate(*args):
+                        names.append(l.name)
+                else:
+                    raise RuntimeError("unexpected level in implied factor")
+            table.append(names)
+
+        selected = np.asarray(inverse).reshape(len(group), len(applies))
+        if all([len(names) == 1 for names in table]):
+            trials = np.full((len(group), n), "", dtype=object)
+            trials[:, applies] = np.array([names[0] for names in table], dtype=object)[selected]
+            for results, vals in zip(group, trials.tolist()):
+                results[f.name] = vals
+        else:
+            # Preserve the one-name-per-matching-level behavior for
+            # predicates that match zero or several levels:
+            for results, row in zip(group, selected.tolist()):
                 vals = []
-                for i in range(0, n):
-                    if f.applies_to_trial(i + 1):
-                        for l in f.levels:
-                            if isinstance(l, ElseLevel):
-                                vals.append(l.name)
-                            elif isinstance(l, DerivedLevel):
-                                w = l.window
-                                args = []
-                                for idx, df in enumerate(w.factors):
-                                    for j in range(w.width):
-                                        shift = w.width - j - 1
-                                        if i - shift >= 0:
-                                            args.append(results[df.name][i - shift])
-                                        else:
-                                            args.append(None)
-                                if w.width > 1:
-                                    args = list(chunk_dict(args, w.width))
-                                if w.predicate(*args):
-                                    vals.append(l.name)
-                            else:
-                                raise RuntimeError("unexpected level in implied factor")
+                k = 0
+                for i in range(n):
+                    if k < len(applies) and applies[k] == i:
+                        vals.extend(table[row[k]])
+                        k += 1
                     else:
                         vals.append("")
                 results[f.name] = vals
-        return results
 
     def map_block_trial_ranges(self, within_block: bool, proc: Callable[[int, int], T]) -> List[T]:
         num_trials = self.trials_per_sample()
@@ -447,10 +593,7 @@ class Block:
             nonlocal level
             design_var_count = self.variables_per_trial()
             first_variable = self.first_variable_for_level(level[0], level[1]) + 1 + (start * design_var_count)
-            # TODO: This should be reworked. It's an accumulating fold where the
-            #       folding function's second argument is just thrown away.
-            return list(accumulate(repeat(first_variable, end - start),
-                                   lambda acc, _: acc + design_var_count))
+            return self.layout_variable(first_variable + np.arange(end - start) * design_var_count).tolist()
         return self.map_block_trial_ranges(within_block, get_variables)
 
     def __build_complex_variable_lists(self,
@@ -462,7 +605,7 @@ class Block:
         def get_variables(start: int, end: int) -> List[int]:
             nonlocal factor, level_count, start_idx
             n = self.variables_for_factor(factor, start, end) // level_count
-            return reduce(lambda l, v: l + [start_idx + ((v + start) * level_count)], range(n), [])
+            return self.layout_variable(start_idx + (np.arange(n) + start) * level_count).tolist()
         return self.map_block_trial_ranges(within_block, get_variables)
 
     def get_trial_numbers(self, b_trial_no: int, within_block: bool = False) -> List[int]:
@@ -496,6 +639,10 @@ class Block:
     def sample_mismatch_constraints(self, sample: dict) -> list:
         pass
 
+    @abstractmethod
+    def samples_mismatch_constraints(self, samples: List[dict]) -> List[list]:
+        pass
+
     @abstractmethod
     def sample_mismatch_crossing(self, sample: dict, acceptable_error_per_crossing: int = 0) -> list:
         pass
@@ -0,0 +1,108 @@
+"""This module provides budgets that bound the work of a sampling job.
+
+A :class:`Budget` limits the wall-clock time, the number of candidate trial
+sequences, and the number of solver calls that a sampling strategy can use. A
+strategy that runs out of budget stops with the samples found so far, and it
+reports why it stopped in the ``stop_reason`` metric of its result. Limits are
+checked between candidates and between solver calls, so a solver call that
+has started runs to completion.
+"""
+
+
+import time
+
+from typing import Any, Dict, Optional, cast
+
+
+class Budget():
+    """Limits on a sampling job: at most `seconds` of wall-clock time, at
+    most `candidates` candidate trial sequences (including ones that are
+    rejected or that duplicate an earlier sequence), and at most
+    `solver_calls` calls to an external solver. A limit of None means no
+    limit."""
+
+    def __init__(self,
+                 seconds: Optional[float] = None,
+                 candidates: Optional[int] = None,
+                 solver_calls: Optional[int] = None) -> None:
+        self.seconds = seconds
+        self.candidates = candidates
+        self.solver_calls = solver_calls
+
+    def __repr__(self) -> str:
+        return f"Budget(seconds={self.seconds}, candidates={self.candidates}, solver_calls={self.solver_calls})"
+
+
+class BudgetMeter():
+    """Tracks the use of `budget`, which can be None for no limits, by a
+    sampling job that starts when the meter is created."""
+
+    def __init__(self, budget: Optional[Budget] = None) -> None:
+        self.budget = budget if budget is not None else Budget()
+        self.start_time = time.time()
+        self.candidates = 0
+        self.solver_calls = 0
+        self.stop_reason = cast(Optional[str], None)
+
+    def exhausted(self) -> bool:
+        """Reports whether any limit has been reached, recording the first
+        limit that is reached as the reason to stop."""
+        if self.stop_reason is None:
+            if self.budget.seconds is not None and self.elapsed() >= self.budget.seconds:
+                self.stop_reason = 'time_budget'
+            elif self.budget.candidates is not None and self.candidates >= self.budget.candidates:
+                self.stop_reason = 'candidate_budget'
+            elif self.budget.solver_calls is not None and self.solver_calls >= self.budget.solver_calls:
+                self.stop_reason = 'solver_call_budget'
+        return self.stop_reason is not None
+
+    def remaining_candidates(self, count: int) -> int:
+        """Returns `count`, reduced to the number of candidates that are
+        left in the budget."""
+        if self.budget.candidates is None:
+            return count
+        return max(0, min(count, self.budget.candidates - self.candidates))
+
+    def spend_candidates(self, count: int = 1) -> None:
+        self.candidates += count
+
+    def spend_solver_calls(self, count: int = 1) -> None:
+        self.solver_calls += count
+
+    def start_solver_call(self, candidates: int = 0) -> bool:
+        """Reports whether the budget allows another solver call that
+        considers up to `candidates` candidates, and counts the call and its
+        candidates if so."""
+        if self.exhausted():
+            return False
+        self.solver_calls += 1
+        self.candidates += candidates
+        return True
+
+    def elapsed(self) -> float:
+        return time.time() - self.start_time
+
+    def remaining(self) -> Budget:
+        """Returns a budget with the limits that are left, which can be given
+        to another strategy that continues the job."""
+        def left(limit: Any, used: Any) -> Any:
+            return None if limit is None else max(limit - used, 0)
+        return Budget(left(self.budget.seconds, self.elapsed()),
+                      left(self.budget.candidates, self.candidates),
+                      left(self.budget.solver_calls, self.solver_calls))
+
+    def record(self, metrics: Dict[str, Any], sampled: int, sample_count: int) -> None:
+        """Adds ``stop_reason`` and ``budget_used`` to `metrics` for a job
+        that produced `sampled` of `sample_count` requested samples. The
+        reason is ``'complete'`` if all samples were produced, the limit that
+        was reached if the budget ran out, and ``'exhausted'`` if the strategy
+        ran out of trial sequences."""
+        if sampled >= sample_count:
+            metrics['stop_reason'] = 'complete'
+        elif self.stop_reason is not None:
+            metrics['stop_reason'] = self.stop_reason
+        else:
+            metrics['stop_reason'] = 'exhausted'
+        metrics['budget_used'] = {'seconds': self.elapsed(),
+                                  'candidates': self.candidates,
+                                  'solver_calls': self.solver_calls}
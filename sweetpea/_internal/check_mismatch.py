@@ -1,4 +1,7 @@
 from typing import List, cast, Tuple, Dict
+
+import numpy as np
+
 from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.primitive import Level, Factor
 
@@ -17,3 +20,51 @@ def combinations_mismatched_weights(start: int, end: int, weight: int, crossing:
             delta = 0
         mismatch += abs(delta)
     return mismatch
+
+
+class CrossingBalance():
+    """Counts mismatches of frequencies against a crossing like
+    :func:`combinations_mismatched_weights`, but with each combination of
+    levels numbered in mixed radix and with the expected count of every
+    combination computed once, so that counting is a `bincount`."""
+
+    def __init__(self, crossing: List[Factor], weight: int) -> None:
+        self.crossing = crossing
+        self.__codes = [{l: j for j, l in enumerate(f.levels)} for f in crossing]
+        radices = [len(f.levels) for f in crossing]
+        self.__strides = np.array([int(np.prod(radices[i+1:], dtype=np.int64)) for i in range(len(radices))],
+                                  dtype=np.int64)
+        self.combination_count = int(np.prod(radices, dtype=np.int64))
+        expected = np.ones(radices, dtype=np.int64) * weight
+        for i, f in enumerate(crossing):
+            shape = [1] * len(radices)
+            shape[i] = radices[i]
+            expected = expected * np.array([l.weight for l in f.levels], dtype=np.int64).reshape(shape)
+        self.__expected = expected.reshape(-1)
+
+    def mismatches(self, start: int, end: int, sample: dict, or_less: bool) -> int:
+        """Counts mismatches in trials `start` (inclusive) through `end`
+        (exclusive) of a sample that maps factors to lists of levels."""
+        combos = np.zeros(max(end - start, 0), dtype=np.int64)
+        for f, codes, stride in zip(self.crossing, self.__codes, self.__strides.tolist()):
+            combos += np.array([codes[l] for l in sample[f][start:end]], dtype=np.int64) * stride
+        return int(self.__mismatches(combos.reshape(1, -1), or_less)[0])
+
+    def coded_mismatches(self, start: int, end: int, codes: np.ndarray, columns: List[int],
+                         or_less: bool) -> np.ndarray:
+        """Counts mismatches in trials `start` (inclusive) through `end`
+        (exclusive) for every sample in a batch of codes, where `columns`
+        holds the column of each crossed factor."""
+        combos = codes[:, start:end, columns] @ self.__strides
+        return self.__mismatches(combos, or_less)
+
+    def __mismatches(self, combos: np.ndarray, or_less: bool) -> np.ndarray:
+        sample_count = combos.shape[0]
+        offsets = (np.arange(sample_count, dtype=np.int64) * self.combination_count)[:, None]
+        counts = np.bincount((combos + offsets).reshape(-1),
+                             minlength=sample_count * self.combination_count).reshape(sample_count, -1)
+        delta = counts - self.__expected
+        if or_less:
+            delta = np.maximum(delta, 0)
+        # Only combinations that occur are counted as mismatched
+        return np.where(counts > 0, np.abs(delta), 0).sum(axis=1)
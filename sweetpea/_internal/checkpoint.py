@@ -0,0 +1,141 @@
+"""This module provides checkpoints for long-running sampling jobs.
+
+A :class:`Checkpoint` periodically saves the progress of a sampling strategy
+to a file, so that a job that is interrupted can be resumed where it left off.
+The file is replaced atomically, so it always holds either the previous or the
+new state, even if the process dies while saving. The state is pickled, so a
+checkpoint should be resumed only from a file that is trusted.
+"""
+
+
+import os
+import pickle
+import tempfile
+import time
+
+from typing import Any, Callable, Dict, Optional, cast
+
+from sweetpea._internal.block import Block
+from sweetpea._internal.constraint import Derivation
+from sweetpea._internal.primitive import Factor, HiddenName, Level
+
+
+# Incremented when the saved state changes in an incompatible way
+_FORMAT = 2
+
+
+class Checkpoint():
+    """Saves a sampling strategy's state to `path` at most once every
+    `interval` seconds, and provides the state saved by an earlier job to
+    the file `resume_from`, which can be the same as `path`. If
+    `resume_from` does not exist, the job starts from the beginning, so the
+    same call can both start a job and restart it after an interruption.
+
+    A job with a checkpoint gets its samples from a strategy's `sample_iter`,
+    which has no result to hold metrics, so the strategy records them in
+    `metrics`, instead."""
+
+    def __init__(self, path: str, interval: float = 60.0, resume_from: Optional[str] = None) -> None:
+        self.path = path
+        self.interval = interval
+        self.metrics = cast(Dict[str, Any], {})
+        self.__resumed = None
+        if resume_from is not None and os.path.exists(resume_from):
+            self.__resumed = _check_format(Checkpoint.__load(resume_from))
+        self.__last_save = time.time()
+
+    def resumed_state(self, strategy: str, block: Block) -> Optional[Dict[str, Any]]:
+        """Returns the state that was saved for `strategy` sampling `block`,
+        or None if the job is not resumed. Reports an error if the saved
+        state is for a different strategy or design."""
+        if self.__resumed is None:
+            return None
+        if self.__resumed['strategy'] != strategy:
+            raise ValueError(f"Checkpoint was saved by {self.__resumed['strategy']}, not {strategy}.")
+        if self.__resumed['design'] != design_fingerprint(block):
+            raise ValueError("Checkpoint was saved for a different design.")
+        return self.__resumed['state']
+
+    def save_if_due(self, strategy: str, block: Block, state: Callable[[], Dict[str, Any]]) -> None:
+        """Saves the result of `state` if `interval` seconds have passed
+        since the last save."""
+        if time.time() - self.__last_save >= self.interval:
+            self.save(strategy, block, state())
+
+    def save(self, strategy: str, block: Block, state: Dict[str, Any]) -> None:
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".checkpoint-", suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump({'format': _FORMAT,
+                             'strategy': strategy,
+                             'design': design_fingerprint(block),
+                             'state': state},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.unlink(temp_path)
+            raise
+        self.__last_save = time.time()
+
+    @staticmethod
+    def __load(path: str) -> Any:
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+def _check_format(saved: Any) -> Dict[str, Any]:
+    if not isinstance(saved, dict) or saved.get('format') != _FORMAT:
+        raise ValueError("Checkpoint file is not in a supported format.")
+    return saved
+
+
+def design_fingerprint(block: Block) -> tuple:
+    """Summarizes the parts of a block that determine its trial sequences
+    and that can be compared across processes: its factors and levels with
+    their weights and derivation windows, its crossings, its trial count,
+    and its constraints with their parameters. Derivation predicates cannot
+    be compared, so only the shapes of their windows are included."""
+    return (tuple([(_fingerprint_value(f), tuple([_level_fingerprint(l) for l in f.levels]))
+                   for f in block.design]),
+            tuple([tuple([_fingerprint_value(f) for f in crossing]) for crossing in block.crossings]),
+            block.trials_per_sample(),
+            tuple([_constraint_fingerprint(c) for c in block.constraints]))
+
+
+def _level_fingerprint(level: Level) -> tuple:
+    window = getattr(level, 'window', None)
+    if window is None:
+        return (level.name, level.weight)
+    return (level.name, level.weight,
+            (type(window).__name__, tuple([_fingerprint_value(f) for f in window.factors]),
+             window.width, window.stride, window.start))
+
+
+def _constraint_fingerprint(constraint: Any) -> tuple:
+    if isinstance(constraint, Derivation):
+        # Its variable indices follow from the derived factor, whose levels
+        # are included already
+        return (type(constraint).__name__, _fingerprint_value(constraint.factor))
+    return (type(constraint).__name__,
+            tuple([(name, _fingerprint_value(value)) for name, value in sorted(vars(constraint).items())
+                   if not name.startswith('_')]))
+
+
+def _fingerprint_value(value: Any) -> Any:
+    # Converts a constraint parameter to plain data, naming factors and
+    # levels instead of including them
+    if isinstance(value, HiddenName):
+        return value.name
+    if isinstance(value, Factor):
+        return _fingerprint_value(value.name)
+    if isinstance(value, Level):
+        return (_fingerprint_value(value.factor), value.name)
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return tuple([_fingerprint_value(v) for v in value])
+    return type(value).__name__
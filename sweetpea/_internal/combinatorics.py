@@ -1,10 +1,18 @@
 """This module provides combinatoric functionality."""
 
 
+import atexit
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
 from typing import List, Tuple, Dict, Any, Union, Optional, cast
 from math import factorial
 from functools import reduce
 
+import numpy as np
+
 
 def extract_components(sizes: List[int], n: int) -> List[int]:
     """Given a list of dimension sizes, and an integer less than the product of
@@ -22,6 +30,49 @@ def extract_components(sizes: List[int], n: int) -> List[int]:
 
     return components
 
+# Each step of `extract_components_batch` handles digits whose place values
+# stay below this bound, so that they can be decoded in int64 arrays
+_INT64_DIGITS_BOUND = 1 << 62
+
+def extract_components_batch(sizes: List[int], ns: List[int]) -> np.ndarray:
+    """Like :func:`extract_components`, but for every integer in ``ns`` at
+    once, returning an array with a row of components for each integer.
+
+    The integers can be too large for int64, so digits are peeled off in
+    groups whose combined size fits, with one Python ``divmod`` per integer
+    per group; the digits within a group are decoded with array operations
+    across all of the integers.
+    """
+    components = np.zeros((len(ns), len(sizes)), dtype=np.int64)
+    rest = list(ns)
+    start = 0
+    while start < len(sizes):
+        end = start + 1
+        group_size = sizes[start]
+        while end < len(sizes) and group_size * sizes[end] <= _INT64_DIGITS_BOUND:
+            group_size *= sizes[end]
+            end += 1
+        if end == len(sizes):
+            low = np.array(rest, dtype=np.int64)
+        else:
+            quotients_and_remainders = [divmod(n, group_size) for n in rest]
+            rest = [q for q, _ in quotients_and_remainders]
+            low = np.array([r for _, r in quotients_and_remainders], dtype=np.int64)
+        group = np.array(sizes[start:end], dtype=np.int64)
+        place_values = np.concatenate([[1], np.cumprod(group[:-1])])
+        components[:, start:end] = (low[:, None] // place_values) % group
+        start = end
+
+    return components
+
+def combine_components(sizes: List[int], components: List[int]) -> int:
+    """The inverse of :func:`extract_components`."""
+    n = 0
+    for s, c in zip(reversed(sizes), reversed(components)):
+        n = n * s + c
+
+    return n
+
 ##############################################################
 # Finding combinations by index
 #
@@ -42,6 +93,14 @@ def compute_jth_combination(l, n, j):
 
     return combination
 
+def rank_combination(n: int, combination: List[int]) -> int:
+    """The inverse of :func:`compute_jth_combination`."""
+    j = 0
+    for c in combination:
+        j = j * n + c
+
+    return j
+
 ##############################################################
 # Finding combinations without replacement by index
 #
@@ -98,6 +157,16 @@ def compute_jth_permutation_prefix(n, m, j):
     inversion_sequence = compute_jth_inversion_sequence(n, m, j)
     return construct_permutation(inversion_sequence, n)
 
+def rank_permutation_prefix(n: int, permutation: List[int]) -> int:
+    """The inverse of :func:`compute_jth_permutation_prefix`, where the
+    prefix's length is the length of ``permutation``."""
+    unused = _FenwickTree([1 for i in range(n)])
+    skips = []
+    for idx in permutation:
+        skips.append(unused.prefix(idx))
+        unused.add(idx, -1)
+    return combine_components(list(range(n, n - len(permutation), -1)), skips)
+
 def compute_jth_inversion_sequence(n, m, j):
     """The are ``n!`` permutations of ``n`` elements. Each permutation can be
     uniquely identified by and constructed from its "inversion sequence". This
@@ -119,31 +188,69 @@ def compute_jth_inversion_sequence(n, m, j):
     """
     inversion = []
     for k in range(n, n-m, -1):
-        result = j % k
+        j, result = divmod(j, k)
         inversion.append(result)
-        j //= k
 
     return inversion
 
 def construct_permutation(inversion_sequence: List[int], orig_n: int) -> List[int]:
     """Given an inversion sequence, construct the permutation."""
-    used = [False for i in range(orig_n)]
+    # Each element of the inversion sequence is a number of unused elements to skip
+    unused = _FenwickTree([1 for i in range(orig_n)])
     permutation = [-1 for i in inversion_sequence]
     for n, skip in enumerate(inversion_sequence):
-        idx = 0
-        while used[idx]:
-            idx += 1
-        while skip > 0:
-            if not used[idx]:
-                skip -= 1
-            idx += 1
-        while used[idx]:
-            idx += 1
+        idx, _ = unused.find(skip)
         permutation[n] = idx
-        used[idx] = True
+        unused.add(idx, -1)
 
     return permutation
 
+class _FenwickTree():
+    """A Fenwick tree (or binary indexed tree) over a list of non-negative
+    counts, which supports updating a count and finding an index by its
+    running total in O(log n) time."""
+
+    def __init__(self, counts: List[int]):
+        n = len(counts)
+        tree = [0] + list(counts)
+        for i in range(1, n + 1):
+            j = i + (i & -i)
+            if j <= n:
+                tree[j] += tree[i]
+        self.tree = tree
+        self.n = n
+        self.top = 1 << (n.bit_length() - 1) if n > 0 else 0
+
+    def add(self, idx: int, delta: int) -> None:
+        i = idx + 1
+        while i <= self.n:
+            self.tree[i] += delta
+            i += i & -i
+
+    def prefix(self, idx: int) -> int:
+        """Returns the running total of counts before `idx`."""
+        total = 0
+        i = idx
+        while i > 0:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def find(self, total: int) -> Tuple[int, int]:
+        """Returns the first index whose running total (including its own
+        count) exceeds `total`, along with the running total before that
+        index. The index is the number of counts if there is no such index."""
+        tree = self.tree
+        idx = 0
+        before = 0
+        step = self.top
+        while step > 0:
+            if idx + step <= self.n and before + tree[idx + step] <= total:
+                idx += step
+                before += tree[idx]
+            step >>= 1
+        return idx, before
+
 ##############################################################
 # Finding permutations with repetitions
 #
@@ -192,27 +299,29 @@ def construct_permutation(inversion_sequence: List[int], orig_n: int) -> List[in
 #     decrement the index by the number of solutions being skipped,
 #     and try the next non-empty counter.
 #
+# With P permutations for the current counters, which sum to T,
+# decrementing counter c[i] leaves P*c[i]/T permutations. So, instead
+# of counting from scratch for each counter, we find the first counter
+# where the running total of c[i] exceeds idx*T/P, using a Fenwick
+# tree over the counters, and update P incrementally.
+#
 def _construct_permutation_with_copies(idx: int, q: int, fill_n: int, counters: List[int]) -> List[int]:
     sequence = cast(List[int], [])
 
     # assert sum(counters) == fill_n
 
+    remaining = _FenwickTree(counters)
+    total = sum(counters)
+    perms = count_remaining_permutations(counters)
     while len(sequence) < fill_n:
-        i = 0
-        while i < q:
-            if counters[i] > 0:
-                counters[i] -= 1
-                n = count_remaining_permutations(counters)
-                if idx >= n:
-                    idx -= n
-                    counters[i] += 1
-                else:
-                    sequence.append(i)
-                    break
-                i += 1
-            else:
-                i += 1
+        i, before = remaining.find((idx * total) // perms)
         assert i < q
+        idx -= (perms * before) // total
+        perms = (perms * counters[i]) // total
+        counters[i] -= 1
+        remaining.add(i, -1)
+        total -= 1
+        sequence.append(i)
 
     return sequence
 
@@ -239,10 +348,11 @@ def count_permutations_with_copies(q: int, m: int, first_n: int) -> int:
         # We want only the first_n of the trials, so count permutations
         # that only use the different ways of having first_n distributed
         # among the q possibilities.
-        return cast(int, count_prefixes_of_permutations_with_copies(q, m, first_n, PermutationMemo()))
+        return cast(int, count_prefixes_of_permutations_with_copies(q, m, first_n, shared_permutation_memo(q, m)))
 
 def count_permutations_with_varying_copies(q: int, counters: List[int], first_n: int) -> int:
-    return cast(int, count_prefixes_of_permutations_with_copies(q, counters, first_n, PermutationMemo()))
+    return cast(int, count_prefixes_of_permutations_with_copies(q, counters, first_n,
+                                                                shared_permutation_memo(q, counters)))
 
 ##############################################################
 # Finding unique prefixes of permutations with repetitions
@@ -280,6 +390,148 @@ class PermutationMemo():
     def __init__(self):
         self.memo = {}
 
+##############################################################
+# Sharing memo tables
+#
+# The memo table's entries depend only on `q` and `m_or_counters`, not
+# on `first_n` (which is just the `need_n` of the starting entry), so
+# a single table can serve every enumerator for the same crossing shape
+# and every prefix length. A registry hands out one table per shape,
+# keeping tables in memory up to a size limit and discarding the least
+# recently used ones beyond it. When it has a directory, it also loads
+# tables from there, saves tables that have grown when they are
+# discarded and when the process exits, and discards the least recently
+# used files when the directory's files exceed the same size limit.
+
+#: The name of an environment variable that selects a directory where memo
+#: tables are saved for use by later processes. Tables are kept only in
+#: memory when the variable is not set.
+PERMUTATION_MEMO_DIR_ENV_VAR = 'SWEETPEA_PERMUTATION_MEMO_DIR'
+
+#: The name of an environment variable for the number of bytes that memo
+#: tables can occupy, both in memory and when saved; the default is 64MB.
+PERMUTATION_MEMO_MAX_BYTES_ENV_VAR = 'SWEETPEA_PERMUTATION_MEMO_MAX_BYTES'
+
+# An estimate of the memory used by each entry of a memo table: the dict
+# slot, the key tuple, and the count
+_MEMO_ENTRY_BYTES = 200
+
+class PermutationMemoRegistry():
+    def __init__(self, directory: Optional[Path] = None, max_bytes: int = 64 * 1024 * 1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.memos = cast('OrderedDict[Tuple[int, Any], PermutationMemo]', OrderedDict())
+        self.saved_sizes = cast(Dict[Tuple[int, Any], int], {})
+
+    def get(self, q: int, m_or_counters: Union[int, List[int]]) -> PermutationMemo:
+        key = self.__key(q, m_or_counters)
+        pmemo = self.memos.get(key, None)
+        if pmemo is None:
+            pmemo = PermutationMemo()
+            self.saved_sizes[key] = self.__load(key, pmemo)
+            self.memos[key] = pmemo
+            self.__evict_memos()
+        else:
+            self.memos.move_to_end(key)
+        return pmemo
+
+    def save(self) -> None:
+        """Saves tables that have grown since they were loaded or saved,
+        if the registry has a directory."""
+        if self.directory is None:
+            return
+        changed = False
+        for key, pmemo in self.memos.items():
+            changed = self.__save_memo(key, pmemo) or changed
+        if changed:
+            self.__evict_files()
+
+    def __key(self, q: int, m_or_counters: Union[int, List[int]]) -> Tuple[int, Any]:
+        return (q, m_or_counters if isinstance(m_or_counters, int) else tuple(m_or_counters))
+
+    def __path(self, key: Tuple[int, Any]) -> Path:
+        digest = hashlib.sha1(repr(key).encode()).hexdigest()
+        return cast(Path, self.directory) / f"permutations-{digest}.json"
+
+    def __load(self, key: Tuple[int, Any], pmemo: PermutationMemo) -> int:
+        if self.directory is None:
+            return 0
+        path = self.__path(key)
+        try:
+            with open(path) as f:
+                content = json.load(f)
+            if content['key'] != [key[0], key[1] if isinstance(key[1], int) else list(key[1])]:
+                return 0
+            for start_i, need_n, value in content['memo']:
+                pmemo.memo[(start_i, need_n)] = value
+            # Mark the file as recently used:
+            os.utime(path)
+        except (OSError, ValueError, KeyError, TypeError):
+            return 0
+        return len(pmemo.memo)
+
+    def __save_memo(self, key: Tuple[int, Any], pmemo: PermutationMemo) -> bool:
+        # Returns whether the table was written
+        if self.directory is None or len(pmemo.memo) <= self.saved_sizes[key]:
+            return False
+        entries = [[start_i, need_n, value] for (start_i, need_n), value in pmemo.memo.items()]
+        path = self.__path(key)
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+            with open(tmp_path, 'w') as f:
+                json.dump({'key': [key[0], key[1]], 'memo': entries}, f)
+            os.replace(tmp_path, path)
+        except OSError:
+            return False
+        self.saved_sizes[key] = len(pmemo.memo)
+        return True
+
+    def __evict_memos(self) -> None:
+        # Tables grow after they are handed out, so sizes are checked each
+        # time a table is added. The newest table is always kept, and an
+        # enumerator can keep using a discarded table, but it is no longer
+        # shared.
+        total = sum([len(pmemo.memo) for pmemo in self.memos.values()]) * _MEMO_ENTRY_BYTES
+        saved = False
+        while total > self.max_bytes and len(self.memos) > 1:
+            key, pmemo = self.memos.popitem(last=False)
+            saved = self.__save_memo(key, pmemo) or saved
+            del self.saved_sizes[key]
+            total -= len(pmemo.memo) * _MEMO_ENTRY_BYTES
+        if saved:
+            self.__evict_files()
+
+    def __evict_files(self) -> None:
+        try:
+            paths = [(p.stat().st_mtime, p.stat().st_size, p)
+                     for p in cast(Path, self.directory).glob("permutations-*.json")]
+            paths.sort()
+            total = sum([size for _, size, _ in paths])
+            for _, size, p in paths:
+                if total <= self.max_bytes:
+                    break
+                p.unlink()
+                total -= size
+        except OSError:
+            pass
+
+_shared_permutation_memos = PermutationMemoRegistry(
+    Path(os.environ[PERMUTATION_MEMO_DIR_ENV_VAR]) if PERMUTATION_MEMO_DIR_ENV_VAR in os.environ else None,
+    int(os.environ.get(PERMUTATION_MEMO_MAX_BYTES_ENV_VAR, 64 * 1024 * 1024)))
+
+def shared_permutation_memo(q: int, m_or_counters: Union[int, List[int]]) -> PermutationMemo:
+    """Returns the memo table shared within this process for `q` choices
+    with `m_or_counters` copies."""
+    return _shared_permutation_memos.get(q, m_or_counters)
+
+def save_shared_permutation_memos() -> None:
+    _shared_permutation_memos.save()
+
+# Tables are saved once, when the process exits, instead of each time an
+# enumerator is created
+atexit.register(save_shared_permutation_memos)
+
 def count_prefixes_of_permutations_with_copies(q: int, m_or_counters: Union[int, List[int]], first_n: int,
                                                pmemo: PermutationMemo) -> int:
     if isinstance(m_or_counters, list):
@@ -408,6 +660,35 @@ def count_interleavings(v: int, need_n: int) -> int:
     # combinations with `v_n` elements, interleaved with `v` elements:
     return count_remaining_permutations([v_n, v])
 
+##############################################################
+# Weighted sums over prefixes of permutations with repetitions
+#
+# Given a weight for each of the `q` choices, we sometimes need the sum,
+# over every prefix of `first_n` items, of the product of the weights
+# of the prefix's items. That product depends only on how many copies
+# of each choice a prefix uses, not on their order, so we allocate
+# slots one choice at a time: a table maps the number of slots filled
+# so far to the weighted number of ways to fill them, and adding `v`
+# copies of the next choice to `n` filled slots interleaves them in
+# `count_interleavings(v, n+v)` ways. The result is the same as
+# enumerating every prefix, but in O(q * first_n * m) steps.
+
+def sum_prefix_products_of_permutations_with_copies(q: int, m_or_counters: Union[int, List[int]], first_n: int,
+                                                    weights: List[int]) -> int:
+    table = [1] + [0 for n in range(first_n)]
+    for i in range(q):
+        m = m_or_counters if isinstance(m_or_counters, int) else m_or_counters[i]
+        new_table = [0 for n in range(first_n + 1)]
+        for n, ways in enumerate(table):
+            if ways == 0:
+                continue
+            weight_v = 1
+            for v in range(0, min(m, first_n - n) + 1):
+                new_table[n + v] += ways * count_interleavings(v, n + v) * weight_v
+                weight_v *= weights[i]
+        table = new_table
+    return table[first_n]
+
 # Converts the cons-style bucket representation of allocations
 # to the `q` choices into a mutable-array counter representation
 def buckets_to_counters(buckets: Any, q: int) -> List[int]:
@@ -3,12 +3,13 @@
 import operator as op
 from abc import abstractmethod
 from copy import deepcopy
-from typing import List, Tuple, Any, Union, cast, Dict, Callable
+from typing import List, Tuple, Any, Union, cast, Dict, Callable, Optional
 from itertools import chain, product
 from math import ceil
+import numpy as np
 
 from sweetpea._internal.base_constraint import Constraint
-from sweetpea._internal.iter import chunk, chunk_list
+from sweetpea._internal.iter import chunk, chunk_list, Windows
 from sweetpea._internal.block import Block
 from sweetpea._internal.cross_block import MultiCrossBlockRepeat
 from sweetpea._internal.backend import LowLevelRequest, BackendRequest
@@ -69,13 +70,14 @@ class Consistency(Constraint):
         for _ in range(block.trials_per_sample()):
             for f in filter(lambda f: not f.has_complex_window, block.act_design):
                 number_of_levels = len(f.levels)
-                new_request = LowLevelRequest("EQ", 1, list(range(next_var, next_var + number_of_levels)))
+                new_request = LowLevelRequest("EQ", 1, [block.layout_variable(v)
+                                                        for v in range(next_var, next_var + number_of_levels)])
                 backend_request.ll_requests.append(new_request)
                 next_var += number_of_levels
 
         for f in filter(lambda f: f.has_complex_window, block.act_design):
             variables_for_factor = block.variables_for_factor(f)
-            var_list = list(map(lambda n: n + next_var, range(variables_for_factor)))
+            var_list = list(map(lambda n: block.layout_variable(n + next_var), range(variables_for_factor)))
             chunks = list(chunk_list(var_list, len(f.levels)))
             backend_request.ll_requests += list(map(lambda v: LowLevelRequest("EQ", 1, v), chunks))
             next_var += variables_for_factor
@@ -84,6 +86,9 @@ class Consistency(Constraint):
         # conformance by construction in combinatoric
         return True
 
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        return np.ones(len(codes), dtype=bool)
+
 class Cross(Constraint):
     """We represent the fully crossed constraint by allocating additional
     boolean variables to represent each unique state. Only factors in crossing
@@ -201,6 +206,9 @@ class Cross(Constraint):
         # conformance by construction or direct checking in combinatoric
         return True
 
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        return np.ones(len(codes), dtype=bool)
+
 class Derivation(Constraint):
     """A derivation such as::
 
@@ -279,8 +287,9 @@ class Derivation(Constraint):
 
         iffs = []
         for n in range(cross_size):
-            or_clause = Or(list(And(list(map(lambda x: x + (n * trial_size) + 1, l))) for l in self.dependent_idxs))
-            iffs.append(Iff(self.derived_idx + (n * trial_size) + 1, or_clause))
+            or_clause = Or(list(And(list(map(lambda x: block.layout_variable(x + (n * trial_size) + 1), l)))
+                                for l in self.dependent_idxs))
+            iffs.append(Iff(block.layout_variable(self.derived_idx + (n * trial_size) + 1), or_clause))
 
         (cnf, new_fresh) = block.cnf_fn(And(iffs), backend_request.fresh)
 
@@ -299,7 +308,8 @@ class Derivation(Constraint):
             if not f.applies_to_trial(n + 1):
                 continue
             num_levels = len(f.levels)
-            get_trial_size = lambda x: trial_size if x < block.grid_variables() else len(block.decode_variable(x+1)[0].levels)
+            get_trial_size = lambda x: (trial_size if x < block.grid_variables()
+                                        else len(block.decode_canonical_variable(x+1)[0].levels))
 
             # Only keep clauses where all `BeforeStarts` apply and all indices are in range:
             ands = []
@@ -316,12 +326,12 @@ class Derivation(Constraint):
                         if new_x <= 0:
                             ok = False
                             break
-                        vars.append(new_x)
+                        vars.append(block.layout_variable(new_x))
                 if ok:
                     ands.append(And(vars))
 
             or_clause = Or(ands)
-            iffs.append(Iff(self.derived_idx + (t * num_levels) + 1, or_clause))
+            iffs.append(Iff(block.layout_variable(self.derived_idx + (t * num_levels) + 1), or_clause))
             t += 1
         (cnf, new_fresh) = block.cnf_fn(And(iffs), backend_request.fresh)
 
@@ -343,6 +353,9 @@ class Derivation(Constraint):
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
 
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        return np.ones(len(codes), dtype=bool)
+
 
 class _KInARow(Constraint):
     def __init__(self, k, level):
@@ -404,13 +417,11 @@ class _KInARow(Constraint):
 
     def _build_variable_sublistss(self, block: Block,
                                   level: Tuple[Factor, Union[SimpleLevel, DerivedLevel]],
-                                  sublist_length: int) -> List[List[List[int]]]:
+                                  sublist_length: int) -> List[Windows]:
+        # Each window is made only when a caller uses it, so building the
+        # windows takes time and space linear in the number of variables
         var_lists = block.build_variable_lists(level, self.within_block)
-        sublistss = cast(List[List[List[int]]], [])
-        for var_list in var_lists:
-            raw_sublists = [var_list[i:i+sublist_length] for i in range(0, len(var_list))]
-            sublistss.append(list(filter(lambda l: len(l) == sublist_length, raw_sublists)))
-        return sublistss
+        return [Windows(var_list, sublist_length) for var_list in var_lists]
 
     @abstractmethod
     def apply_to_backend_request(self, block: Block, level: Tuple[Factor, Union[SimpleLevel, DerivedLevel]], backend_request: BackendRequest) -> None:
@@ -437,10 +448,75 @@ class _KInARow(Constraint):
 
         return all(block.map_block_trial_ranges(self.within_block, check_sequence))
 
+    def potential_prefix_conforms(self, sample: dict, block: Block, start: int, end: int) -> bool:
+        level = self.level
+        level_list = sample[level.factor]
+
+        def check_sequence(range_start: int, range_end: int) -> bool:
+            # Check runs that include new trials, starting with a run that
+            # continues from before the new trials
+            stop = min(range_end, end)
+            first = max(range_start, start)
+            if first >= stop:
+                return True
+            while first > range_start and level_list[first - 1] == level:
+                first -= 1
+            counts = []
+            count = 0
+            for i in range(first, stop):
+                if level_list[i] == level:
+                    count += 1
+                elif count > 0:
+                    counts.append(count)
+                    count = 0
+            if count > 0:
+                counts.append(count)
+            open_run = count > 0 and stop < range_end
+            return self._potential_prefix_counts_conform(counts, open_run)
+
+        return all(block.map_block_trial_ranges(self.within_block, check_sequence))
+
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        factor = self.level.factor
+        matches = (codes[:, :, coding.column(factor)] == coding.level_code(factor, self.level)).astype(np.int8)
+        conforms = np.ones(len(codes), dtype=bool)
+        for start, end in block.map_block_trial_ranges(self.within_block, lambda start, end: (start, end)):
+            # Run lengths are the distances between rising and falling edges,
+            # which `nonzero` reports in the same order for every sample
+            edges = np.diff(matches[:, start:end], axis=1, prepend=0, append=0)
+            rows, starts = np.nonzero(edges == 1)
+            _, ends = np.nonzero(edges == -1)
+            conforms &= self._potential_coded_counts_conform(rows, ends - starts, len(codes))
+        return conforms
+
     @abstractmethod
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         pass
 
+    def _potential_prefix_counts_conform(self, counts: List[int], open_run: bool) -> bool:
+        # When `open_run`, the last run might continue, so it is not checked
+        return self._potential_counts_conform(counts[:-1] if open_run else counts)
+
+    def _potential_coded_counts_conform(self, rows: np.ndarray, counts: np.ndarray, sample_count: int) -> np.ndarray:
+        """Batch form of `_potential_counts_conform`, where `counts[i]` is the
+        length of a run in sample `rows[i]`."""
+        check = self._individual_count_check()
+        if check is not None:
+            conforms = np.ones(sample_count, dtype=bool)
+            conforms[rows[~check(counts, self.k)]] = False
+            return conforms
+        # Otherwise, gather each sample's runs, which are in order
+        sample_counts = cast(List[List[int]], [[] for _ in range(sample_count)])
+        for row, count in zip(rows.tolist(), counts.tolist()):
+            sample_counts[row].append(count)
+        return np.array([self._potential_counts_conform(c) for c in sample_counts], dtype=bool)
+
+    def _individual_count_check(self) -> Optional[Callable[[Any, int], Any]]:
+        """Returns a comparison that each run length must pass against `k`,
+        which works on arrays as well as numbers, or None if runs are not
+        checked individually."""
+        return None
+
     def _potential_counts_conform_individually(self, counts: List[int], fn: Callable[[int, int], bool]) -> bool:
         return all(map(lambda n: fn(n, self.k), counts))
 
@@ -486,6 +562,12 @@ class AtMostKInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return self._potential_counts_conform_individually(counts, op.le)
 
+    def _individual_count_check(self) -> Callable[[Any, int], Any]:
+        return op.le
+
+    def _potential_prefix_counts_conform(self, counts: List[int], open_run: bool) -> bool:
+        return self._potential_counts_conform(counts)
+
 
 class AtLeastKInARow(_KInARow):
     """This is more complicated that AtMostKInARow. We collect all the boolean
@@ -545,6 +627,9 @@ class AtLeastKInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return self._potential_counts_conform_individually(counts, op.ge)
 
+    def _individual_count_check(self) -> Callable[[Any, int], Any]:
+        return op.ge
+
 
 class ExactlyK(_KInARow):
     """Requires that if the given level exists at all, it must exist in a trial
@@ -571,6 +656,22 @@ class ExactlyK(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return sum(counts) == self.k
 
+    def _potential_coded_counts_conform(self, rows: np.ndarray, counts: np.ndarray, sample_count: int) -> np.ndarray:
+        return np.bincount(rows, weights=counts, minlength=sample_count) == self.k
+
+    def potential_prefix_conforms(self, sample: dict, block: Block, start: int, end: int) -> bool:
+        level = self.level
+        level_list = sample[level.factor]
+
+        def check_sequence(range_start: int, range_end: int) -> bool:
+            stop = min(range_end, end)
+            if max(range_start, start) >= stop:
+                return True
+            count = sum(1 for i in range(range_start, stop) if level_list[i] == level)
+            return count == self.k if stop == range_end else count <= self.k
+
+        return all(block.map_block_trial_ranges(self.within_block, check_sequence))
+
 
 class ExactlyKInARow(_KInARow):
     """Requires that if the given level exists at all, it must exist in a
@@ -606,7 +707,7 @@ class ExactlyKInARow(_KInARow):
                 tail = sublists[-1]
                 tail.reverse()
                 for idx in range(len(tail) - 1):
-                    implications.append(If(l[idx], l[idx + 1]))
+                    implications.append(If(tail[idx], tail[idx + 1]))
 
             (cnf, new_fresh) = block.cnf_fn(And(implications), backend_request.fresh)
             backend_request.cnfs.append(cnf)
@@ -624,6 +725,14 @@ class ExactlyKInARow(_KInARow):
     def _potential_counts_conform(self, counts: List[int]) -> bool:
         return self._potential_counts_conform_individually(counts, op.eq)
 
+    def _individual_count_check(self) -> Callable[[Any, int], Any]:
+        return op.eq
+
+    def _potential_prefix_counts_conform(self, counts: List[int], open_run: bool) -> bool:
+        if open_run:
+            return self._potential_counts_conform(counts[:-1]) and counts[-1] <= self.k
+        return self._potential_counts_conform(counts)
+
 def filter_level(who, level, factor_ok: bool = False):
     if factor_ok and isinstance(level, Factor):
         return level
@@ -729,6 +838,17 @@ class Exclude(Constraint):
                     return False
         return True
 
+    def potential_prefix_conforms(self, sample: dict, block: Block, start: int, end: int) -> bool:
+        if self.factor.has_complex_window:
+            return self.level not in sample[self.factor][start:end]
+        return True
+
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        if self.factor.has_complex_window:
+            return ~np.any(codes[:, :, coding.column(self.factor)] == coding.level_code(self.factor, self.level),
+                           axis=1)
+        return np.ones(len(codes), dtype=bool)
+
 class Pin(Constraint):
     def __init__(self, index, level):
         level = filter_level("Pin", level)
@@ -788,6 +908,25 @@ class Pin(Constraint):
         else:
             return False
 
+    def potential_prefix_conforms(self, sample: dict, block: Block, start: int, end: int) -> bool:
+        levels = sample[self.factor]
+        trial_nos = block.get_trial_numbers(self.index, self.within_block)
+        if trial_nos:
+            for trial_no in trial_nos:
+                if start <= trial_no < end and levels[trial_no] != self.level:
+                    return False
+            return True
+        else:
+            return False
+
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        trial_nos = block.get_trial_numbers(self.index, self.within_block)
+        if trial_nos:
+            return np.all(codes[:, trial_nos, coding.column(self.factor)] == coding.level_code(self.factor, self.level),
+                          axis=1)
+        else:
+            return np.zeros(len(codes), dtype=bool)
+
 class Reify(Constraint):
     """The only purpose of this constraint is to make a factor
     non-implied, so that it's exposed to a constraint solver."""
@@ -809,6 +948,9 @@ class Reify(Constraint):
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
 
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        return np.ones(len(codes), dtype=bool)
+
     def desugar(self, replacements: dict) -> List:
         factor = replacements.get(self.factor, self.factor)
         return [Reify(factor)]
@@ -845,3 +987,6 @@ class MinimumTrials(Constraint):
 
     def potential_sample_conforms(self, sample: dict, block: Block) -> bool:
         return True
+
+    def potential_coded_samples_conform(self, codes: np.ndarray, coding, block: Block) -> np.ndarray:
+        return np.ones(len(codes), dtype=bool)
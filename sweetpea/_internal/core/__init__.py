@@ -45,6 +45,7 @@ Functions
 
   * :func:`~sweetpea.core.generate.is_satisfiable.cnf_is_satisfiable`
   * :func:`~sweetpea.core.generate.sample_non_uniform.sample_non_uniform`
+  * :func:`~sweetpea.core.generate.sample_non_uniform.iterate_non_uniform`
   * :func:`~sweetpea.core.generate.sample_non_uniform.sample_non_uniform_from_specification`
   * :func:`~sweetpea.core.generate.sample_uniform.sample_uniform`
   * :func:`~sweetpea.core.generate.utility.combine_cnf_with_requests`
@@ -63,6 +64,6 @@ Classes
 from .cnf import Clause, CNF, Var
 from .generate import (
     AssertionType, GenerationRequest, Solution,
-    cnf_is_satisfiable, sample_non_uniform, sample_non_uniform_from_specification, sample_uniform,
+    cnf_is_satisfiable, sample_non_uniform, iterate_non_uniform, sample_non_uniform_from_specification, sample_uniform,
     combine_cnf_with_requests
 )
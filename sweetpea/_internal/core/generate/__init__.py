@@ -10,6 +10,6 @@ SweetPea offers three mechanisms for CNF interaction:
 
 
 from .is_satisfiable import cnf_is_satisfiable
-from .sample_non_uniform import sample_non_uniform, sample_non_uniform_from_specification
+from .sample_non_uniform import sample_non_uniform, iterate_non_uniform, sample_non_uniform_from_specification
 from .sample_uniform import sample_uniform
 from .utility import AssertionType, GenerationRequest, SampleType, ProblemSpecification, Solution, combine_cnf_with_requests
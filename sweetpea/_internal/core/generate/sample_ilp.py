@@ -1,5 +1,5 @@
 from io import TextIOWrapper
-from typing import List, Optional
+from typing import Callable, List, Optional
 from pathlib import Path
 
 from ..cnf import CNF
@@ -13,17 +13,19 @@ def sample_ilp_iterate(count: int,
                     initial_cnf: CNF,
                     support: int,
                     generation_requests: List[GenerationRequest],
+                    allow_call: Optional[Callable[[], bool]] = None
                     ) -> List[Solution]:
     with temporary_cnf_file(Path('.'), '.opb') as opb_file:
         combine_and_save_opb(opb_file, initial_cnf, support, generation_requests)
         print("Running Gurobi...")
-        solutions = compute_solutions(opb_file, support, count)
+        solutions = compute_solutions(opb_file, support, count, allow_call=allow_call)
         return [Solution(solution, 1) for solution in solutions]
 
 def compute_solutions(filename: Path,
                       support: int,
                       count: int,
-                      solutions: Optional[List[List[int]]] = None) -> List[List[int]]:
+                      solutions: Optional[List[List[int]]] = None,
+                      allow_call: Optional[Callable[[], bool]] = None) -> List[List[int]]:
     try:
         import gurobipy
     except ImportError as e:
@@ -39,7 +41,7 @@ def compute_solutions(filename: Path,
         while True:
             if solutions is None:
                 solutions = []
-            if count == 0:
+            if count == 0 or (allow_call is not None and not allow_call()):
                 return solutions
             model = gp.read(filename.name, env)
             model.optimize()
@@ -14,14 +14,14 @@
 
 
 from pathlib import Path
-from typing import List, Optional
+from typing import Callable, Iterator, List, Optional
 
 from ..cnf import CNF
 from .tools.cryptominisat import DEFAULT_DOCKER_MODE_ON, cryptominisat_solve
 from .utility import GenerationRequest, ProblemSpecification, Solution, combine_and_save_cnf, temporary_cnf_file
 
 
-__all__ = ['sample_non_uniform', 'sample_non_uniform_from_specification']
+__all__ = ['sample_non_uniform', 'iterate_non_uniform', 'sample_non_uniform_from_specification']
 
 
 def sample_non_uniform(count: int,
@@ -33,11 +33,31 @@ def sample_non_uniform(count: int,
     """Samples solutions to a CNF problem non-uniformly. Produces ``count``
     solutions, each with a support set of length ``support``.
     """
+    return list(iterate_non_uniform(count, initial_cnf, fresh, support, generation_requests))
+
+
+def iterate_non_uniform(count: int,
+                        initial_cnf: CNF,
+                        fresh: int,
+                        support: int,
+                        generation_requests: List[GenerationRequest],
+                        previous_solutions: Optional[List[List[int]]] = None,
+                        allow_call: Optional[Callable[[], bool]] = None
+                        ) -> Iterator[Solution]:
+    """Like :func:`sample_non_uniform`, but yields each solution as soon as
+    it is found. Any ``previous_solutions`` (each of length ``support``) are
+    excluded as if they had already been found, which lets an interrupted
+    search continue where it stopped. If ``allow_call`` is provided, it is
+    called before each call to CryptoMiniSAT, and the search stops when it
+    returns ``False``.
+    """
     with temporary_cnf_file() as cnf_file:
         combine_and_save_cnf(cnf_file, initial_cnf, fresh, support, generation_requests)
+        for solution in previous_solutions or []:
+            update_file(cnf_file, solution)
         print("Running CryptoMiniSat...")
-        solutions = compute_solutions(cnf_file, support, count)
-        return [Solution(solution, 1) for solution in solutions]
+        for solution in iterate_solutions(cnf_file, support, count, allow_call=allow_call):
+            yield Solution(solution, 1)
 
 
 def sample_non_uniform_from_specification(spec: ProblemSpecification) -> List[Solution]:
@@ -65,19 +85,30 @@ def compute_solutions(filename: Path,
     generate a solution, execution terminates and the existing list of
     solutions will be returned.
     """
-    # TODO: Implement iteratively instead of recursively.
-    while True:
-        if solutions is None:
-            solutions = []
-        if count == 0:
-            return solutions
+    if solutions is None:
+        solutions = []
+    solutions += iterate_solutions(filename, support, count, use_docker)
+    return solutions
+
+
+def iterate_solutions(filename: Path,
+                      support: int,
+                      count: int,
+                      use_docker: bool = DEFAULT_DOCKER_MODE_ON,
+                      allow_call: Optional[Callable[[], bool]] = None
+                      ) -> Iterator[List[int]]:
+    """Like :func:`compute_solutions`, but yields each solution as soon as it
+    is found, and stops early if ``allow_call`` returns ``False`` before a
+    call to CryptoMiniSAT.
+    """
+    while count > 0 and (allow_call is None or allow_call()):
         solution = cryptominisat_solve(filename, use_docker)
         if not solution:
-            return solutions
+            return
         solution = solution[:support]
         update_file(filename, solution)
         count -= 1
-        solutions += [solution]
+        yield solution
 
 
 def update_file(filename: Path, solution: List[int]):
@@ -9,6 +9,7 @@ from typing import List, Union, Tuple, Optional, cast, Any, Dict, Set
 from math import ceil
 from networkx import has_path
 import copy
+import numpy as np
 
 from sweetpea._internal.block import Block
 from sweetpea._internal.backend import BackendRequest
@@ -24,6 +25,7 @@ from sweetpea._internal.iter import chunk_list
 from sweetpea._internal.weight import combination_weight
 from sweetpea._internal.argcheck import argcheck, make_islistof
 from sweetpea._internal.sample_conversion import convert_sample_from_names_to_objects
+from sweetpea._internal.sample_coding import SampleCoding
 from sweetpea._internal.check_mismatch import combinations_mismatched_weights
 
 class MultiCrossBlockRepeat(Block):
@@ -105,13 +107,7 @@ class MultiCrossBlockRepeat(Block):
 
         This is a helper for :class:`.MultipleCrossBlock.trials_per_sample`.
         """
-        trial = 0
-        counter = 0
-        while counter != crossing_size:
-            trial += 1
-            if f.applies_to_trial(trial):
-                counter += 1
-        return trial
+        return f.nth_applicable_trial(crossing_size)
 
     def _trials_per_sample_for_crossing(self):
         """Result includes preamble trials."""
@@ -299,16 +295,37 @@ class MultiCrossBlockRepeat(Block):
 
     def sample_mismatch_constraints(self, sample: dict) -> list:
         """Test if the factors in a given sequence meet the criteria defined for this constraints"""
-        res = []
-        sample_objects = convert_sample_from_names_to_objects(sample, self.design)
-        for constraint in self.constraints:
-            if not constraint.potential_sample_conforms(sample_objects, self):
-                pretty_name = constraint.__class__.__name__
-                if hasattr(constraint, 'k'):
-                    pretty_name += f', {constraint.k}'  # type: ignore
-                if hasattr(constraint, 'level'):
-                    pretty_name += f', {constraint.level}'  # type: ignore
-                res.append(pretty_name)
+        return self.samples_mismatch_constraints([sample])[0]
+
+    def samples_mismatch_constraints(self, samples: List[dict]) -> List[list]:
+        """Like :func:`sample_mismatch_constraints`, but checks a list of
+        sequences together in integer-coded form. Sequences are coded in
+        groups that have the same factors and number of trials, so they
+        need not all have the same shape."""
+        samples_objects = [convert_sample_from_names_to_objects(sample, self.design) for sample in samples]
+        groups = cast(Dict[Tuple[frozenset, int], List[int]], {})
+        for i, sample_objects in enumerate(samples_objects):
+            trial_count = max([len(levels) for levels in sample_objects.values()], default=0)
+            groups.setdefault((frozenset(sample_objects.keys()), trial_count), []).append(i)
+        res = cast(List[list], [[] for _ in samples])
+        for (_, trial_count), indices in groups.items():
+            coding = SampleCoding(list(samples_objects[indices[0]].keys()))
+            codes = coding.empty(len(indices), trial_count)
+            for row, i in enumerate(indices):
+                # Trials without a level are converted to a placeholder level
+                # with an empty name, which is coded as no level
+                codes[row] = coding.encode({f: [(l if l.name else None) for l in levels]
+                                            for f, levels in samples_objects[i].items()},
+                                           trial_count)
+            for constraint in self.constraints:
+                conforms = constraint.potential_coded_samples_conform(codes, coding, self)
+                for row in np.flatnonzero(~conforms).tolist():
+                    pretty_name = constraint.__class__.__name__
+                    if hasattr(constraint, 'k'):
+                        pretty_name += f', {constraint.k}'  # type: ignore
+                    if hasattr(constraint, 'level'):
+                        pretty_name += f', {constraint.level}'  # type: ignore
+                    res[indices[row]].append(pretty_name)
         return res
 
     def sample_mismatch_crossing(self, sample: dict, acceptable_error_per_crossing: int = 0) -> list:
@@ -95,7 +95,7 @@ def __generate_encoding_diagram(blk: Block) -> str:
                     offset = t - width + 1 - stride_offset
                     variables = list(map(lambda n: n + len(variables) * offset, variables))
                 else:
-                    variables = list(map(lambda n: n + design_size * t, variables))
+                    variables = list(map(lambda n: blk.layout_variable(n + design_size * t), variables))
 
                 args += list(map(str, variables))
             else:
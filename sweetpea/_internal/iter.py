@@ -2,7 +2,7 @@
 
 
 from itertools import islice, tee, chain, repeat
-from typing import Any, Tuple, List, Dict, Iterator, Iterable
+from typing import Any, Tuple, List, Dict, Iterator, Iterable, Sequence, Union, cast, overload
 
 
 def chunk(it: Iterable[Any], size: int) -> Iterator[Tuple[Any, ...]]:
@@ -30,6 +30,32 @@ def chunk_dict(it: Iterable[Any], size: int) -> List[Dict[int, Any]]:
             break
     return r
 
+class Windows(Sequence[List[Any]]):
+    """The `size`-wide windows of `items`, in order. A window is made as a
+    list only when it is accessed, so the sequence itself takes constant
+    space beyond `items`, and a slice is another :class:`Windows`."""
+
+    def __init__(self, items: Sequence[Any], size: int, starts: Union[range, None] = None) -> None:
+        self.__items = items
+        self.__size = size
+        self.__starts = starts if starts is not None else range(max(len(items) - size + 1, 0))
+
+    @overload
+    def __getitem__(self, index: int) -> List[Any]: ...
+
+    @overload
+    def __getitem__(self, index: slice) -> 'Windows': ...
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return Windows(self.__items, self.__size, self.__starts[index])
+        start = self.__starts[index]
+        return list(self.__items[start:start + self.__size])
+
+    def __len__(self) -> int:
+        return len(self.__starts)
+
+
 def pairwise(iterable):
     """Helper recipe from:
     https://docs.python.org/3/library/itertools.html#itertools-recipes
@@ -48,3 +74,35 @@ def intersperse(delimiter, seq, repeat_delimiter = 1):
     nested_list_seq = map(lambda elem: [elem], seq)
     new_seq = zip(repeat([delimiter] * repeat_delimiter), nested_list_seq)
     return chain(*islice(chain.from_iterable(new_seq), 1, None))
+
+
+class IndexShuffle():
+    """Draws indices from a range in random order without replacement, using
+    a Fisher-Yates shuffle that records only the positions it has swapped, so
+    that the range can be much larger than the number of draws."""
+
+    def __init__(self, indices: range, rng: Any) -> None:
+        self.indices = indices
+        self.size = max(indices.stop - indices.start, 0)
+        self.remaining = self.size
+        self.__rng = rng
+        self.__swapped = cast(Dict[int, int], {})
+
+    def draw(self, count: int) -> List[int]:
+        drawn = []
+        for _ in range(min(count, self.remaining)):
+            i = self.size - self.remaining
+            j = self.__rng.randrange(i, self.size)
+            drawn.append(self.indices.start + self.__swapped.get(j, j))
+            self.__swapped[j] = self.__swapped.get(i, i)
+            self.__swapped.pop(i, None)
+            self.remaining -= 1
+        return drawn
+
+    def get_state(self) -> Tuple[int, Dict[int, int], Any]:
+        return (self.remaining, dict(self.__swapped), self.__rng.getstate())
+
+    def set_state(self, state: Tuple[int, Dict[int, int], Any]) -> None:
+        self.remaining, swapped, rng_state = state
+        self.__swapped = dict(swapped)
+        self.__rng.setstate(rng_state)
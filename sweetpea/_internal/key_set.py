@@ -0,0 +1,216 @@
+"""This module provides compact sets of sequence keys, which samplers use to
+avoid producing the same trial sequence twice.
+
+A key is a tuple of integers or strings (possibly nested), and it is
+represented in a set by a 128-bit hash of a canonical encoding, which is the
+same in every Python version, so that sets saved in checkpoints can be used by
+any version. :class:`HashedKeySet` stores the hashes in a Python set, so it
+treats distinct keys as equal only if their hashes collide, which is
+vanishingly unlikely for realistic numbers of keys. :class:`BloomKeySet` stores only a few bits per key, and it can
+report that a key is present when it is not, but it never reports that a
+present key is absent.
+
+Since a :class:`BloomKeySet` may never hold every possible key, a sampler
+cannot stop drawing when the set is full. Instead, a set counts the adds in
+a row that find the key already present, and it reports itself as
+saturated after too many of them.
+"""
+
+
+import struct
+import sys
+import time
+
+from abc import ABC, abstractmethod
+from hashlib import blake2b
+from math import ceil, log
+from typing import Any, Dict, List, Set, Tuple, cast
+
+import numpy as np
+
+
+# A length, or a count of items
+_LENGTH = struct.Struct("<I")
+
+
+class KeySet(ABC):
+    """A set of sequence keys that tracks the time spent hashing keys."""
+
+    def __init__(self) -> None:
+        self.hash_seconds = 0.0
+        self.repeats = 0  # adds in a row that found the key present
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def __contains__(self, key: Any) -> bool:
+        return self._contains_digest(self._digest(key))
+
+    def add(self, key: Any) -> bool:
+        """Adds `key` to the set, returning False if it was already
+        present."""
+        digest = self._digest(key)
+        if self._contains_digest(digest):
+            self.repeats += 1
+            return False
+        self._add_digest(digest)
+        self._count += 1
+        self.repeats = 0
+        return True
+
+    def saturated(self) -> bool:
+        """Reports whether so many adds in a row have found their keys
+        already present that a caller drawing random keys should stop."""
+        return False
+
+    @property
+    @abstractmethod
+    def nbytes(self) -> int:
+        """The number of bytes used to store the set's contents."""
+        pass
+
+    def metrics(self) -> Dict[str, Any]:
+        return {'kind': self.kind(),
+                'keys': len(self),
+                'bytes': self.nbytes,
+                'hash_seconds': self.hash_seconds,
+                'saturated': self.saturated()}
+
+    @abstractmethod
+    def kind(self) -> str:
+        pass
+
+    def _digest(self, key: Any) -> bytes:
+        start = time.perf_counter()
+        encoded = bytearray()
+        _encode_key(key, encoded)
+        digest = blake2b(encoded, digest_size=16).digest()
+        self.hash_seconds += time.perf_counter() - start
+        return digest
+
+    @abstractmethod
+    def _contains_digest(self, digest: bytes) -> bool:
+        pass
+
+    @abstractmethod
+    def _add_digest(self, digest: bytes) -> None:
+        pass
+
+
+def _encode_key(key: Any, out: bytearray) -> None:
+    # Each item is tagged with its type, and integers, strings, and tuples
+    # carry their lengths, so distinct keys have distinct encodings
+    if isinstance(key, int):
+        data = key.to_bytes((key.bit_length() + 8) // 8, 'little', signed=True)
+        out += b"i"
+        out += _LENGTH.pack(len(data))
+        out += data
+    elif isinstance(key, str):
+        data = key.encode()
+        out += b"s"
+        out += _LENGTH.pack(len(data))
+        out += data
+    elif isinstance(key, (tuple, list)):
+        out += b"t"
+        out += _LENGTH.pack(len(key))
+        for item in key:
+            _encode_key(item, out)
+    else:
+        raise TypeError(f"Cannot use {type(key).__name__} in a sequence key.")
+
+
+class HashedKeySet(KeySet):
+    """An exact set of key hashes. A caller can stop drawing keys when the
+    set holds all possible keys, so the set is never saturated."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.__digests = cast(Set[bytes], set())
+
+    def kind(self) -> str:
+        return 'hashed'
+
+    @property
+    def nbytes(self) -> int:
+        # Every digest is a bytes object of the same size
+        return sys.getsizeof(self.__digests) + len(self.__digests) * sys.getsizeof(bytes(16))
+
+    def _contains_digest(self, digest: bytes) -> bool:
+        return digest in self.__digests
+
+    def _add_digest(self, digest: bytes) -> None:
+        self.__digests.add(digest)
+
+
+class BloomKeySet(KeySet):
+    """A probabilistic set of keys, implemented as a series of Bloom filters
+    with growing capacities and shrinking error rates, so that the chance that
+    any absent key is reported as present stays below `error_rate` no matter
+    how many keys are added.
+
+    Keys that are wrongly reported as present can never be added, so the set
+    is saturated after `max_repeats` adds in a row find their keys present.
+    If a fraction `f` of all possible keys has not been added, that happens
+    with probability about ``(1 - f) ** max_repeats``."""
+
+    def __init__(self, capacity: int = 65536, error_rate: float = 1e-6, max_repeats: int = 65536) -> None:
+        super().__init__()
+        self.error_rate = error_rate
+        self.max_repeats = max_repeats
+        self.__capacity = max(capacity, 1)
+        self.__filters = cast(List[Tuple[np.ndarray, int, int]], [])
+        self.__filter_count = 0  # keys in the last filter
+
+    def kind(self) -> str:
+        return 'bloom'
+
+    def saturated(self) -> bool:
+        return self.repeats >= self.max_repeats
+
+    @property
+    def nbytes(self) -> int:
+        return sum(bits.nbytes for bits, _, _ in self.__filters)
+
+    def _contains_digest(self, digest: bytes) -> bool:
+        for bits, bit_count, hash_count in self.__filters:
+            if all(bits[j >> 3] & (1 << (j & 7)) for j in self.__positions(digest, bit_count, hash_count)):
+                return True
+        return False
+
+    def _add_digest(self, digest: bytes) -> None:
+        if not self.__filters or self.__filter_count >= self.__capacity << (len(self.__filters) - 1):
+            self.__add_filter()
+        bits, bit_count, hash_count = self.__filters[-1]
+        for j in self.__positions(digest, bit_count, hash_count):
+            bits[j >> 3] |= (1 << (j & 7))
+        self.__filter_count += 1
+
+    def __add_filter(self) -> None:
+        # Each filter has twice the capacity of the previous one and half its
+        # error rate, so the total error rate is at most `error_rate`
+        n = len(self.__filters)
+        capacity = self.__capacity << n
+        error_rate = self.error_rate / (2 << n)
+        bit_count = ceil(-capacity * log(error_rate) / (log(2) ** 2))
+        hash_count = max(1, round(bit_count / capacity * log(2)))
+        self.__filters.append((np.zeros((bit_count + 7) >> 3, dtype=np.uint8), bit_count, hash_count))
+        self.__filter_count = 0
+
+    @staticmethod
+    def __positions(digest: bytes, bit_count: int, hash_count: int) -> List[int]:
+        # Enhanced double hashing, which avoids the correlated positions of
+        # plain double hashing when `bit_count` is small
+        low = int.from_bytes(digest[:8], 'little')
+        high = int.from_bytes(digest[8:], 'little')
+        return [(low + i * high + (i * i * i - i) // 6) % bit_count for i in range(hash_count)]
+
+
+def make_key_set(kind: str) -> KeySet:
+    """Creates a key set of the given kind, either ``'hashed'`` or
+    ``'bloom'``."""
+    if kind == 'hashed':
+        return HashedKeySet()
+    if kind == 'bloom':
+        return BloomKeySet()
+    raise ValueError(f"Unknown key set kind {kind!r}; expected 'hashed' or 'bloom'.")
@@ -0,0 +1,68 @@
+"""This module provides strategies for laying out a block's variable grid in
+the formula that is passed to a solver.
+
+A :class:`.Block` numbers the variables of its core grid in a canonical,
+trial-major order: all variables for trial 1, then all variables for trial 2,
+and so on, with variables for factors with complex windows appended after the
+grid. Everything that computes variables in terms of trials and levels
+(constraints, derivations, decoding) works with that canonical numbering and
+converts through :func:`.Block.layout_variable` and
+:func:`.Block.canonical_variable`, so a layout can change which solver variable
+represents each grid cell without changing any encoding logic. Variables for
+complex windows and fresh variables keep their numbers in every layout.
+"""
+
+
+from abc import ABC, abstractmethod
+from typing import Any
+
+
+class VariableLayout(ABC):
+    """Generic interface for variable layouts. Each method receives and
+    returns zero-based indices into the grid, which has ``trial_count`` rows
+    of ``trial_size`` variables each. Indices can be integers or NumPy integer
+    arrays.
+    """
+
+    @abstractmethod
+    def to_formula(self, index: Any, trial_count: int, trial_size: int) -> Any:
+        """Converts a canonical grid index to a formula grid index."""
+        pass
+
+    @abstractmethod
+    def from_formula(self, index: Any, trial_count: int, trial_size: int) -> Any:
+        """Converts a formula grid index to a canonical grid index."""
+        pass
+
+
+class TrialMajorLayout(VariableLayout):
+    """The default layout, where the formula uses the canonical numbering:
+    variables for the same trial are adjacent."""
+
+    def to_formula(self, index: Any, trial_count: int, trial_size: int) -> Any:
+        return index
+
+    def from_formula(self, index: Any, trial_count: int, trial_size: int) -> Any:
+        return index
+
+    def __str__(self):
+        return 'TrialMajorLayout'
+
+
+class FactorMajorLayout(VariableLayout):
+    """A layout where variables are grouped by factor, and within a factor by
+    level, so that the variables for one level in every trial are
+    adjacent. Constraints that range over a single level across trials, such
+    as :class:`.AtMostKInARow`, then refer to a contiguous block of
+    variables."""
+
+    def to_formula(self, index: Any, trial_count: int, trial_size: int) -> Any:
+        trial, offset = divmod(index, trial_size)
+        return offset * trial_count + trial
+
+    def from_formula(self, index: Any, trial_count: int, trial_size: int) -> Any:
+        offset, trial = divmod(index, trial_count)
+        return trial * trial_size + offset
+
+    def __str__(self):
+        return 'FactorMajorLayout'
@@ -1,7 +1,8 @@
 # Everything in `__all_` is exported from the `sweetpea` module.
 
 __all__ = [
-    'synthesize_trials', 'sample_mismatch_experiment',
+    'synthesize_trials', 'synthesize_trials_iter', 'sample_mismatch_experiment',
+    'save_sample_bank', 'SampleBank',
 
     'print_experiments', 'tabulate_experiments',
     'save_experiments_csv', 'experiments_to_tuples',
@@ -19,11 +20,13 @@ __all__ = [
 
     'Gen', 'RandomGen', 'IterateSATGen',
     'CMSGen', 'UniGen', 'IterateILPGen',
-    'UniformGen', 'IterateGen'
+    'UniformGen', 'IterateGen', 'TransitionGen',
+
+    'Budget'
 ]
 
 from functools import reduce
-from typing import Dict, List, Optional, Tuple, Any, Union, cast
+from typing import Dict, Iterator, List, Optional, Tuple, Any, Union, cast
 from itertools import product
 import csv, os
 
@@ -39,13 +42,17 @@ from sweetpea._internal.constraint import (
     Exclude, Pin, MinimumTrials,
     ExactlyK, AtMostKInARow, AtLeastKInARow, ExactlyKInARow
 )
-from sweetpea._internal.sampling_strategy.base import Gen
+from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
+from sweetpea._internal.budget import Budget
+from sweetpea._internal.checkpoint import Checkpoint
+from sweetpea._internal.sample_bank import SampleBank, write_sample_bank
 from sweetpea._internal.sampling_strategy.uniform import UniformGen
 from sweetpea._internal.sampling_strategy.iterate import IterateGen
 from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
 from sweetpea._internal.sampling_strategy.unigen import UniGen
 from sweetpea._internal.sampling_strategy.cmsgen import CMSGen
 from sweetpea._internal.sampling_strategy.random import RandomGen
+from sweetpea._internal.sampling_strategy.transition import TransitionGen
 from sweetpea._internal.sampling_strategy.iterate_ilp import IterateILPGen
 from sweetpea._internal.server import build_cnf
 from sweetpea._internal.core.cnf import Var
@@ -263,7 +270,11 @@ def save_experiments_csv(block: Block,
 
 def synthesize_trials(block: Block,
                       samples: int = 10,
-                      sampling_strategy=IterateGen
+                      sampling_strategy=IterateGen,
+                      checkpoint: Optional[str] = None,
+                      resume_from: Optional[str] = None,
+                      checkpoint_interval: float = 60.0,
+                      budget: Optional[Budget] = None
                       ) -> List[dict]:
     """Given an experiment described with a :class:`.Block`, randomly generates
     multiple sets of trials for that experiment.
@@ -294,6 +305,25 @@ def synthesize_trials(block: Block,
         The strategy to use for trial generation. The default is
         :class:`.NonUniformGen`.
 
+    :param checkpoint:
+        A file to which the strategy's progress is saved every
+        ``checkpoint_interval`` seconds and when sampling finishes. Only
+        :class:`.RandomGen` and :class:`.IterateSATGen` support checkpoints.
+
+    :param resume_from:
+        A checkpoint file saved by an earlier call with the same block and
+        strategy, from which sampling continues where it left off; if the
+        file does not exist, sampling starts from the beginning. Progress is
+        saved to the same file unless ``checkpoint`` names a different one.
+
+    :param checkpoint_interval:
+        The minimum number of seconds between saves of ``checkpoint``.
+
+    :param budget:
+        A :class:`.Budget` that limits the time, candidates, or solver calls
+        used for sampling. When the budget runs out, the trial sets found so
+        far are returned, so fewer than ``samples`` sets may be returned.
+
     :returns:
         A :class:`list` of trial sets. Each set is represented as a
         :class:`dictionary <dict>` mapping each factor name to a list of
@@ -304,28 +334,155 @@ def synthesize_trials(block: Block,
         nonlocal samples
         print(f"Sampling {samples} trial sequences using {who}.")
 
+    saver = __make_checkpoint(checkpoint, resume_from, checkpoint_interval)
     if isinstance(sampling_strategy, type):
         assert issubclass(sampling_strategy, Gen)
         starting(sampling_strategy.class_name())
-        sampling_result = sampling_strategy.sample(block, samples)
+        if saver is not None:
+            sampling_result = SamplingResult(list(sampling_strategy.sample_iter(block, samples, saver, budget)),
+                                             saver.metrics)
+        else:
+            sampling_result = sampling_strategy.sample(block, samples, **Gen._budget_arguments(budget))
     else:
         starting(sampling_strategy)
-        sampling_result = sampling_strategy.sample_object(block, samples)
+        if saver is not None:
+            sampling_result = SamplingResult(list(sampling_strategy.sample_object_iter(block, samples, saver,
+                                                                                       budget)),
+                                             saver.metrics)
+        else:
+            sampling_result = sampling_strategy.sample_object(block, samples, **Gen._budget_arguments(budget))
+
+    stop_reason = sampling_result.metrics.get('stop_reason', '')
+    if stop_reason.endswith('_budget'):
+        print(f"Stopped with {len(sampling_result.samples)} trial sequences: reached the {stop_reason}.")
 
-    trialss = list(map(lambda e: __filter_hidden_keys(block.add_implied_levels(e)),
-                       sampling_result.samples))
+    trialss = list(map(lambda e: __filter_hidden_keys(e),
+                       block.add_implied_levels_to_samples(sampling_result.samples)))
 
     if os.getenv("SWEETPEA_CHECK_SYNTHESIZED"):
         for trials in trialss:
-            mismatches = sample_mismatch_experiment(block, trials)
-            if mismatches:
-                print_experiments(block, [trials])
-                print(mismatches)
-                raise RuntimeError("synthesized trials has mismatches")
+            __check_synthesized(block, trials)
 
     return trialss
 
 
+def synthesize_trials_iter(block: Block,
+                           samples: int = 10,
+                           sampling_strategy=IterateGen,
+                           checkpoint: Optional[str] = None,
+                           resume_from: Optional[str] = None,
+                           checkpoint_interval: float = 60.0,
+                           budget: Optional[Budget] = None
+                           ) -> Iterator[dict]:
+    """Like :func:`.synthesize_trials`, but returns an iterator that produces
+    each set of trials as soon as the sampling strategy finds it, instead of
+    a list of all sets of trials. Trial sets that have been produced are not
+    retained, so a large number of them can be generated and written out
+    without keeping them all in memory.
+
+    Strategies that find trial sets one at a time, such as
+    :class:`.RandomGen` and :class:`.IterateSATGen`, produce each set as it
+    is found. :class:`.UniGen` and :class:`.CMSGen` request samples from
+    their solver in batches.
+
+    :param block:
+        An experimental description as a :class:`.Block`.
+
+    :param samples:
+        The maximum number of trial sets to generate. Default is ``10``.
+
+    :param sampling_strategy:
+        The strategy to use for trial generation.
+
+    :param checkpoint:
+        As for :func:`.synthesize_trials`. When resuming, trial sets that
+        were produced before the checkpoint was saved are produced again.
+
+    :param resume_from:
+        As for :func:`.synthesize_trials`.
+
+    :param checkpoint_interval:
+        As for :func:`.synthesize_trials`.
+
+    :param budget:
+        As for :func:`.synthesize_trials`. The budget's time limit is
+        measured from when sampling starts, so it includes time that the
+        caller spends between trial sets.
+
+    :returns:
+        An iterator of trial sets, each represented as for
+        :func:`.synthesize_trials`.
+    """
+    saver = __make_checkpoint(checkpoint, resume_from, checkpoint_interval)
+    if isinstance(sampling_strategy, type):
+        assert issubclass(sampling_strategy, Gen)
+        print(f"Sampling {samples} trial sequences using {sampling_strategy.class_name()}.")
+        sample_iter = sampling_strategy.sample_iter(block, samples, saver, budget)
+    else:
+        print(f"Sampling {samples} trial sequences using {sampling_strategy}.")
+        sample_iter = sampling_strategy.sample_object_iter(block, samples, saver, budget)
+
+    check = os.getenv("SWEETPEA_CHECK_SYNTHESIZED")
+    for sample in sample_iter:
+        trials = __filter_hidden_keys(block.add_implied_levels(sample))
+        if check:
+            __check_synthesized(block, trials)
+        yield trials
+
+
+def save_sample_bank(block: Block,
+                     path: str,
+                     samples: int = 1000,
+                     sampling_strategy=IterateGen,
+                     budget: Optional[Budget] = None
+                     ) -> int:
+    """Generates sets of trials for a :class:`.Block` as
+    :func:`.synthesize_trials_iter` does, and writes them to a sample bank
+    file, from which a :class:`.SampleBank` can later draw sets of trials
+    without running a sampling strategy. The sets are stored in an
+    integer-coded form, so a bank is compact enough to hold a large pool of
+    sets for a design.
+
+    :param block:
+        An experimental description as a :class:`.Block`.
+
+    :param path:
+        The file to write. The file is replaced only after all sets of
+        trials have been generated.
+
+    :param samples:
+        The maximum number of trial sets to generate. Default is ``1000``.
+
+    :param sampling_strategy:
+        The strategy to use for trial generation. A strategy that samples
+        without replacement produces a bank of distinct trial sets.
+
+    :param budget:
+        As for :func:`.synthesize_trials`.
+
+    :returns:
+        The number of trial sets written to the bank.
+    """
+    trials = synthesize_trials_iter(block, samples, sampling_strategy, budget=budget)
+    return write_sample_bank(path, block, __filter_hidden(block.design), trials)
+
+
+def __make_checkpoint(checkpoint: Optional[str], resume_from: Optional[str],
+                      interval: float) -> Optional[Checkpoint]:
+    path = checkpoint if checkpoint is not None else resume_from
+    if path is None:
+        return None
+    return Checkpoint(path, interval, resume_from)
+
+
+def __check_synthesized(block: Block, trials: dict) -> None:
+    mismatches = sample_mismatch_experiment(block, trials)
+    if mismatches:
+        print_experiments(block, [trials])
+        print(mismatches)
+        raise RuntimeError("synthesized trials has mismatches")
+
+
 def sample_mismatch_experiment(block: Block, sample: dict) -> dict:
     """Given an experiment described with a :class:`.Block`, tests if :class:`list`
     of trials meets the factors, constraints and crossings of the described experiment.
@@ -512,6 +512,35 @@ class Factor:
         return (trial_number >= (cast(int, window.start)+1)
                 and (trial_number - (cast(int, window.start)+1)) % window.stride == 0)
 
+    def applicable_trials_through(self, trial_number: int) -> int:
+        """The number of trials, from trial ``1`` through ``trial_number``
+        inclusive, to which this factor applies. The count is computed
+        directly from the derivation window's start and stride.
+        """
+        if trial_number <= 0:
+            return 0
+        if not isinstance(self, DerivedFactor):
+            return trial_number
+
+        window = self.first_level.window
+        first_trial = cast(int, window.start) + 1
+        if trial_number < first_trial:
+            return 0
+        return (trial_number - first_trial) // window.stride + 1
+
+    def nth_applicable_trial(self, n: int) -> int:
+        """The (1-based) trial number of the ``n``th trial to which this
+        factor applies, or ``0`` when ``n`` is ``0``. This is the inverse of
+        :func:`.Factor.applicable_trials_through`.
+        """
+        if n <= 0:
+            return 0
+        if not isinstance(self, DerivedFactor):
+            return n
+
+        window = self.first_level.window
+        return cast(int, window.start) + 1 + (n - 1) * window.stride
+
 
     def uses_factor(self, f: Factor):
         return self == f
@@ -0,0 +1,152 @@
+"""This module compiles run-length constraints, such as
+:class:`.AtMostKInARow`, into a finite automaton over sequences of crossing
+instances, so that the sequences that satisfy the constraints can be counted
+and sampled exactly instead of by rejection.
+
+A run is a series of rounds, where each round draws crossing instances
+without replacement from a multiset of them, and each choice of an instance
+is weighted by the number of ways to complete its trial (such as the number
+of source combinations for the instance). Counting is dynamic programming
+over (position, remaining multiset, automaton state), and sampling walks
+forward from the start, choosing each instance in proportion to the
+completions that it leaves.
+"""
+
+
+from typing import Any, Dict, List, Optional, Tuple, cast
+
+from sweetpea._internal.constraint import _KInARow, AtMostKInARow, AtLeastKInARow, ExactlyKInARow
+
+
+State = Tuple[Tuple[int, ...], Tuple[int, ...]]
+
+
+class RunLengthAutomaton():
+    """Tracks, for each constraint, the length of the current run of trials
+    that have the constraint's level. `matches[c][i]` reports whether crossing
+    instance `i` has the level of constraint `c`.
+    """
+
+    def __init__(self, constraints: List[_KInARow], matches: List[List[bool]]) -> None:
+        self.constraints = constraints
+        self.matches = matches
+
+    @staticmethod
+    def supports(constraint: Any) -> bool:
+        return isinstance(constraint, (AtMostKInARow, AtLeastKInARow, ExactlyKInARow))
+
+    def start(self) -> Tuple[int, ...]:
+        return tuple(0 for _ in self.constraints)
+
+    def step(self, state: Tuple[int, ...], instance: int) -> Optional[Tuple[int, ...]]:
+        """Returns the state after a trial with the given crossing instance,
+        or None if the trial violates a constraint."""
+        new_state = []
+        for c, run, matches in zip(self.constraints, state, self.matches):
+            k = c.k
+            if matches[instance]:
+                run += 1
+                if isinstance(c, AtLeastKInARow):
+                    run = min(run, k)
+                elif run > k:
+                    return None
+            else:
+                if run > 0 and run < k and not isinstance(c, AtMostKInARow):
+                    return None
+                run = 0
+            new_state.append(run)
+        return tuple(new_state)
+
+    def accepts(self, state: Tuple[int, ...]) -> bool:
+        """Reports whether a run can end in the given state."""
+        for c, run in zip(self.constraints, state):
+            if run > 0 and run < c.k and not isinstance(c, AtMostKInARow):
+                return False
+        return True
+
+
+class RunLengthSampler():
+    """Counts and samples the sequences of crossing instances for a run with
+    rounds of the sizes in `round_sizes`, where each round can use instance
+    `i` up to `counters[i]` times, and each use is weighted by `weights[i]`.
+
+    The number of states is limited by `max_states`; when the limit is
+    exceeded, `count` reports None.
+    """
+
+    def __init__(self, automaton: RunLengthAutomaton, counters: List[int], round_sizes: List[int],
+                 weights: List[int], max_states: int) -> None:
+        self.automaton = automaton
+        self.counters = tuple(counters)
+        self.weights = weights
+        self.__round_starts = set()
+        start = 0
+        for size in round_sizes:
+            self.__round_starts.add(start)
+            start += size
+        self.trial_count = start
+        self.__completions = self.__count_completions(max_states)
+
+    def count(self) -> Optional[int]:
+        """The total weight of sequences that satisfy the constraints."""
+        if self.__completions is None:
+            return None
+        return self.__completions[0].get(self.__start(), 0)
+
+    def sample(self, rng: Any) -> List[int]:
+        """Returns a sequence of crossing instance indices, where each
+        sequence's probability is proportional to its weight."""
+        completions = cast(List[Dict[State, int]], self.__completions)
+        state = self.__start()
+        instances = []
+        for t in range(self.trial_count):
+            choice = rng.randrange(completions[t][state])
+            for i, next_state in self.__successors(t, state):
+                ways = self.weights[i] * completions[t + 1].get(next_state, 0)
+                if choice < ways:
+                    instances.append(i)
+                    state = next_state
+                    break
+                choice -= ways
+        return instances
+
+    def __start(self) -> State:
+        return (self.counters, self.automaton.start())
+
+    def __successors(self, t: int, state: State) -> List[Tuple[int, State]]:
+        remaining, runs = state
+        successors = []
+        for i, c in enumerate(remaining):
+            if c == 0 or self.weights[i] == 0:
+                continue
+            new_runs = self.automaton.step(runs, i)
+            if new_runs is None:
+                continue
+            if t + 1 in self.__round_starts:
+                new_remaining = self.counters
+            else:
+                new_remaining = remaining[:i] + (c - 1,) + remaining[i + 1:]
+            successors.append((i, (new_remaining, new_runs)))
+        return successors
+
+    def __count_completions(self, max_states: int) -> Optional[List[Dict[State, int]]]:
+        # Find the states reachable at each position, then count the weighted
+        # completions from each state, starting at the end
+        layers = [{self.__start(): 0}]
+        total = 1
+        for t in range(self.trial_count):
+            layer = cast(Dict[State, int], {})
+            for state in layers[t]:
+                for _, next_state in self.__successors(t, state):
+                    layer[next_state] = 0
+            total += len(layer)
+            if total > max_states:
+                return None
+            layers.append(layer)
+        for state in layers[self.trial_count]:
+            layers[self.trial_count][state] = 1 if self.automaton.accepts(state[1]) else 0
+        for t in range(self.trial_count - 1, -1, -1):
+            for state in layers[t]:
+                layers[t][state] = sum(self.weights[i] * layers[t + 1][next_state]
+                                       for i, next_state in self.__successors(t, state))
+        return layers
@@ -0,0 +1,175 @@
+"""This module provides sample banks, which are files of trial sequences that
+are generated once, ahead of time, and then served without running a sampling
+strategy.
+
+A bank file starts with a small header that records the design it was
+generated for and the factor and level names of its columns, followed by the
+sequences as an integer-coded array of shape (sequences, trials, factors), as
+in :mod:`sweetpea._internal.sample_coding`. A :class:`SampleBank` maps the
+array into memory, so opening a bank and drawing a sequence take the same
+time no matter how many sequences the bank holds.
+
+File layout::
+
+    magic (8 bytes) | sequence count (uint64) | header length (uint64)
+    | JSON header | padding to a multiple of 64 bytes | coded sequences
+"""
+
+
+import json
+import os
+import random
+import struct
+import tempfile
+
+from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
+
+import numpy as np
+
+from sweetpea._internal.block import Block
+from sweetpea._internal.checkpoint import design_fingerprint
+from sweetpea._internal.iter import IndexShuffle
+from sweetpea._internal.primitive import Factor
+from sweetpea._internal.sample_coding import NO_LEVEL
+
+
+_MAGIC = b"SPBANK\x00\x00"
+
+# Incremented when the file layout changes in an incompatible way
+_FORMAT = 2
+
+# Magic, sequence count, and header length
+_PREFIX = struct.Struct("<8sQQ")
+
+_ALIGNMENT = 64
+
+
+def write_sample_bank(path: str, block: Block, factors: List[Factor], samples: Iterator[dict]) -> int:
+    """Writes `samples`, which map the names of `factors` to lists of level
+    names, to a bank file at `path` for `block`, and returns the number of
+    samples written. The file is replaced only after all samples are
+    written."""
+    level_names = [[l.name for l in f.levels] for f in factors]
+    dtype = _code_dtype(max([len(names) for names in level_names], default=0))
+    header = json.dumps({'format': _FORMAT,
+                         'design': _json_fingerprint(block),
+                         'trials': block.trials_per_sample(),
+                         'factors': [f.name for f in factors],
+                         'levels': level_names,
+                         'dtype': np.dtype(dtype).str}).encode()
+    codes = [{name: j for j, name in enumerate(names)} for names in level_names]
+    trial_count = block.trials_per_sample()
+
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".bank-", suffix=".tmp")
+    count = 0
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            out.write(_PREFIX.pack(_MAGIC, 0, len(header)))
+            out.write(header)
+            out.write(b"\x00" * (_data_offset(len(header)) - _PREFIX.size - len(header)))
+            for sample in samples:
+                row = np.full((trial_count, len(factors)), NO_LEVEL, dtype=dtype)
+                for i, (f, level_codes) in enumerate(zip(factors, codes)):
+                    row[:, i] = [level_codes[name] if name != "" else NO_LEVEL for name in sample[f.name]]
+                out.write(row.tobytes())
+                count += 1
+            # The count is filled in last, so a partly written file is never
+            # mistaken for a complete one
+            out.seek(0)
+            out.write(_PREFIX.pack(_MAGIC, count, len(header)))
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
+    return count
+
+
+class SampleBank():
+    """Serves the trial sequences in a bank file that was written for
+    `block`. Each call to :func:`draw` returns sequences that have not been
+    drawn before from this object, either in a random order, which is
+    reproducible for a given `seed`, or in the order that they were written
+    when `order` is ``'sequential'``."""
+
+    def __init__(self, path: str, block: Block, order: str = 'random', seed: Optional[int] = None) -> None:
+        if order not in ('random', 'sequential'):
+            raise ValueError(f"Unknown sample bank order {order!r}; expected 'random' or 'sequential'.")
+        count, header, offset = SampleBank.__read_header(path)
+        if header['design'] != _json_fingerprint(block):
+            raise ValueError("Sample bank was generated for a different design.")
+        self.factors = cast(List[str], header['factors'])
+        # An extra empty name at the end decodes NO_LEVEL (-1)
+        self.__names = [np.array(names + [""], dtype=object) for names in header['levels']]
+        shape = (count, header['trials'], len(self.factors))
+        if count > 0:
+            self.__codes = cast(np.ndarray, np.memmap(path, dtype=np.dtype(header['dtype']), mode='r',
+                                                      offset=offset, shape=shape))
+        else:
+            self.__codes = np.zeros(shape, dtype=np.dtype(header['dtype']))
+        self.__order = order
+        self.__shuffle = IndexShuffle(range(count), random.Random(seed))
+        self.__next = 0
+
+    def __len__(self) -> int:
+        return self.__codes.shape[0]
+
+    def __getitem__(self, index: int) -> dict:
+        """Returns the sequence at `index`, mapping factor names to lists of
+        level names as in the result of :func:`.synthesize_trials`."""
+        codes = np.asarray(self.__codes[index])
+        return {name: names[column].tolist()
+                for name, names, column in zip(self.factors, self.__names, codes.T)}
+
+    @property
+    def remaining(self) -> int:
+        """The number of sequences that have not been drawn."""
+        return len(self) - self.__next
+
+    def draw(self, count: int = 1) -> List[dict]:
+        """Returns up to `count` sequences that have not been drawn, which
+        is fewer than `count` only when the bank is used up."""
+        count = min(count, self.remaining)
+        if self.__order == 'sequential':
+            indices = list(range(self.__next, self.__next + count))
+        else:
+            indices = self.__shuffle.draw(count)
+        self.__next += count
+        return [self[i] for i in indices]
+
+    @staticmethod
+    def __read_header(path: str) -> Tuple[int, Dict[str, Any], int]:
+        with open(path, 'rb') as f:
+            prefix = f.read(_PREFIX.size)
+            if len(prefix) < _PREFIX.size:
+                raise ValueError("File is not a sample bank.")
+            magic, count, header_length = _PREFIX.unpack(prefix)
+            if magic != _MAGIC:
+                raise ValueError("File is not a sample bank.")
+            header = json.loads(f.read(header_length).decode())
+        if header.get('format') != _FORMAT:
+            raise ValueError("Sample bank is not in a supported format.")
+        return (count, header, _data_offset(header_length))
+
+
+def _data_offset(header_length: int) -> int:
+    end = _PREFIX.size + header_length
+    return (end + _ALIGNMENT - 1) // _ALIGNMENT * _ALIGNMENT
+
+
+def _code_dtype(level_count: int) -> Any:
+    # Codes are signed, so that NO_LEVEL fits
+    if level_count <= np.iinfo(np.int8).max:
+        return np.int8
+    if level_count <= np.iinfo(np.int16).max:
+        return np.int16
+    return np.int32
+
+
+def _json_fingerprint(block: Block) -> Any:
+    # The fingerprint as it reads back from a JSON header, with lists in
+    # place of tuples
+    return json.loads(json.dumps(design_fingerprint(block)))
@@ -0,0 +1,129 @@
+"""This module provides an integer coding of samples, so that candidate
+samples can be generated and checked in batches as NumPy arrays.
+
+A coded batch is an integer array of shape (samples, trials, factors), where
+each column corresponds to a factor and each entry is the index of a level
+within that factor's levels. The code ``-1`` stands for a trial to which the
+factor does not apply.
+"""
+
+
+from typing import Any, Dict, List, Optional, cast
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from sweetpea._internal.iter import chunk_dict
+from sweetpea._internal.primitive import DerivedFactor, DerivedLevel, Factor, Level
+
+
+NO_LEVEL = -1
+
+
+class SampleCoding():
+    """Assigns a column to each of a sequence of factors and a code to each
+    level of those factors."""
+
+    def __init__(self, factors: List[Factor]) -> None:
+        self.factors = factors
+        self.columns = {f: i for i, f in enumerate(factors)}
+        self.levels = [list(f.levels) for f in factors]
+        self.__codes = [{l: j for j, l in enumerate(levels)} for levels in self.levels]
+        self.__derived_tables = cast(Dict[Factor, Dict[tuple, int]], {})
+
+    def column(self, factor: Factor) -> int:
+        return self.columns[factor]
+
+    def level_code(self, factor: Factor, level: Optional[Level]) -> int:
+        if level is None:
+            return NO_LEVEL
+        return self.__codes[self.columns[factor]][level]
+
+    def level_codes(self, factor: Factor) -> Dict[Level, int]:
+        """Returns a mapping from each level of `factor` to its code."""
+        return self.__codes[self.columns[factor]]
+
+    def derived_table(self, df: DerivedFactor) -> Dict[tuple, int]:
+        """Returns the level codes for `df` that have been found so far by
+        :func:`derived_level_code`, indexed by key."""
+        return self.__derived_tables.setdefault(df, {})
+
+    def empty(self, sample_count: int, trial_count: int) -> np.ndarray:
+        return np.full((sample_count, trial_count, len(self.factors)), NO_LEVEL, dtype=np.int64)
+
+    def encode(self, sample: dict, trial_count: int) -> np.ndarray:
+        """Converts a sample that maps factors to lists of levels into a
+        (trials, factors) array."""
+        codes = self.empty(1, trial_count)[0]
+        for f, levels in sample.items():
+            if f in self.columns:
+                codes[:, self.columns[f]] = [self.level_code(f, l) for l in levels]
+        return codes
+
+    def decode(self, codes: np.ndarray) -> dict:
+        """Converts a (trials, factors) array into a sample that maps factors
+        to lists of levels, where ``None`` stands for no level."""
+        sample = {}
+        for f, levels, col in zip(self.factors, self.levels, codes.T.tolist()):
+            sample[f] = [(levels[c] if c != NO_LEVEL else None) for c in col]
+        return sample
+
+    def decode_names(self, codes: np.ndarray) -> dict:
+        """Like :func:`decode`, but maps factor names to lists of level
+        names, where ``""`` stands for no level."""
+        sample = {}
+        for f, levels, col in zip(self.factors, self.levels, codes.T.tolist()):
+            sample[f.name] = [(levels[c].name if c != NO_LEVEL else "") for c in col]
+        return sample
+
+    def fill_in_derived(self, codes: np.ndarray, sorted_factors: List[DerivedFactor], start: int, end: int) -> None:
+        """Fills in the columns of derived factors, which must be sorted by
+        depth, for trials ``start`` (inclusive, zero-based) through ``end``
+        (exclusive) in every sample of a batch.
+
+        Levels are found with :func:`derived_level_code` once for each
+        distinct combination of window arguments in the batch.
+        """
+        sample_count = codes.shape[0]
+        for df in sorted_factors:
+            applies = [i for i in range(start, end) if df.applies_to_trial(i + 1)]
+            if not applies:
+                continue
+            w = df.first_level.window
+            padded = np.concatenate([self.empty(sample_count, w.width - 1), codes], axis=1)
+            windows = [sliding_window_view(padded[:, :, self.columns[f]], w.width, axis=1)
+                       for f in w.factors]
+            keys = np.concatenate(windows, axis=2)[:, applies, :].reshape(-1, len(w.factors) * w.width)
+            unique_keys, inverse = np.unique(keys, axis=0, return_inverse=True)
+            selected = [self.derived_level_code(df, key) for key in map(tuple, unique_keys.tolist())]
+            codes[:, applies, self.columns[df]] = (np.array(selected, dtype=np.int64)[np.asarray(inverse).reshape(-1)]
+                                                   .reshape(sample_count, len(applies)))
+
+    def derived_level_code(self, df: DerivedFactor, key: tuple) -> int:
+        """Returns the code of the level of `df` for a trial whose window
+        arguments have the codes in `key`, which lists the codes of each
+        window factor in turn from the earliest trial of the window to the
+        current one, with ``-1`` for trials before the start of a sample.
+
+        Each key has its level predicates evaluated once, and the result is
+        remembered for later lookups.
+        """
+        table = self.derived_table(df)
+        code = table.get(key)
+        if code is None:
+            code = table[key] = self.__select_level_code(df, key)
+        return code
+
+    def __select_level_code(self, df: DerivedFactor, key: tuple) -> int:
+        w = df.first_level.window
+        args = cast(List[Any], [])
+        for idx, f in enumerate(w.factors):
+            levels = self.levels[self.columns[f]]
+            for c in key[idx * w.width:(idx + 1) * w.width]:
+                args.append(levels[c].name if c != NO_LEVEL else None)
+        if w.width > 1:
+            args = list(chunk_dict(args, w.width))
+        for j, l in enumerate(self.levels[self.columns[df]]):
+            if cast(DerivedLevel, l).window.predicate(*args):
+                return j
+        raise RuntimeError("no matching trial found when filling in a sample")
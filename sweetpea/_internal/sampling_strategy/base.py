@@ -1,8 +1,10 @@
 from abc import ABC, abstractmethod
-from typing import List, cast
+from typing import Any, Dict, Iterator, List, Optional, cast
 from itertools import repeat
 
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget
+from sweetpea._internal.checkpoint import Checkpoint
 from sweetpea._internal.iter import intersperse
 
 
@@ -22,14 +24,61 @@ class Gen(ABC):
     """
     Sample some number of trial sequences for the given block.
 
+    When a `budget` is provided, sampling stops when the budget runs out,
+    and the result has the samples found so far. The result's
+    ``stop_reason`` metric reports why sampling stopped. The `budget` is
+    passed by keyword, so that strategies can accept other arguments
+    before it.
+
     TODO: This should accept some kind of options structure. What if we want
     to disable metrics? Or use some other feature flag?
     """
     @staticmethod
     @abstractmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
+    def sample(block: Block, sample_count: int, *, budget: Optional[Budget] = None) -> SamplingResult:
         pass
 
+    """
+    Like `sample`, but yields each trial sequence as soon as it is
+    available, so that a caller can consume sequences without waiting for
+    all of them. Strategies that find sequences one at a time override this
+    method; by default, it yields the sequences from `sample`.
+
+    A strategy that can save its progress and resume from a saved state
+    accepts a `checkpoint`; others report an error when given one.
+    """
+    @classmethod
+    def sample_iter(cls, block: Block, sample_count: int,
+                    checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None) -> Iterator[dict]:
+        Gen._check_no_checkpoint(cls.class_name(), checkpoint)
+        yield from cls.sample(block, sample_count, **Gen._budget_arguments(budget)).samples
+
+    """
+    Like `sample_iter`, but for an instance of a strategy that has
+    non-default arguments.
+    """
+    def sample_object_iter(self, block: Block, sample_count: int,
+                           checkpoint: Optional[Checkpoint] = None,
+                           budget: Optional[Budget] = None) -> Iterator[dict]:
+        Gen._check_no_checkpoint(str(self), checkpoint)
+        yield from cast(Any, self).sample_object(block, sample_count, **Gen._budget_arguments(budget)).samples
+
+    @staticmethod
+    def _budget_arguments(budget: Optional[Budget]) -> Dict[str, Any]:
+        """Returns the keyword arguments that pass `budget` to `sample` or
+        `sample_object`. Strategies written before budgets existed do not
+        accept a `budget`, so none is passed when there are no limits."""
+        if budget is None or (budget.seconds is None and budget.candidates is None
+                              and budget.solver_calls is None):
+            return {}
+        return {'budget': budget}
+
+    @staticmethod
+    def _check_no_checkpoint(name: str, checkpoint: Optional[Checkpoint]) -> None:
+        if checkpoint is not None:
+            raise ValueError(f"{name} does not support checkpoints.")
+
     """
     Decodes a single solution into a dict of this form:
 
@@ -43,9 +92,9 @@ class Gen(ABC):
     """
     @staticmethod
     def decode(block: Block, solution: List[int]) -> dict:
-        # Sort the list and remove any negative (false) variables
-        solution.sort()
-        solution = list(filter(lambda v: v > 0, solution))
+        # Remove any negative (false) variables, convert to the block's
+        # canonical (trial-major) numbering, and sort
+        solution = sorted([block.canonical_variable(v) for v in solution if v > 0])
 
         # Separate into simple/complex variables.
         simple_variables = list(filter(lambda v: v <= block.grid_variables(), solution))
@@ -54,7 +103,7 @@ class Gen(ABC):
         experiment = cast(dict, {})
 
         # Simple factors
-        tuples = list(map(lambda v: block.decode_variable(v), simple_variables))
+        tuples = list(map(lambda v: block.decode_canonical_variable(v), simple_variables))
         string_tuples = list(map(lambda t: (t[0].name, t[1].name), tuples))
         for (factor_name, level_name) in string_tuples:
             if factor_name not in experiment:
@@ -71,7 +120,7 @@ class Gen(ABC):
             variables = list(filter(lambda n: n in range(start, end), complex_variables))
 
             # Get the level names for the variables in the solution.
-            level_tuples = list(map(lambda v: block.decode_variable(v), variables))
+            level_tuples = list(map(lambda v: block.decode_canonical_variable(v), variables))
             level_names = list(map(lambda t: (t[1].name), level_tuples))
 
             # Intersperse empty strings for the trials to which this factor does not apply.
@@ -1,8 +1,10 @@
-from typing import List, cast
+from typing import Iterator, List, Optional, cast
 
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.sampling_strategy.unigen import UniGen
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget
+from sweetpea._internal.checkpoint import Checkpoint
 
 
 """
@@ -18,5 +20,11 @@ class CMSGen(Gen):
         return 'CMSGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int, min_search: bool=False) -> SamplingResult:
-        return UniGen.sample(block, sample_count, min_search, use_cmsgen=True)
+    def sample(block: Block, sample_count: int, min_search: bool=False,
+               budget: Optional[Budget] = None) -> SamplingResult:
+        return UniGen.sample(block, sample_count, min_search, use_cmsgen=True, budget=budget)
+
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None, batch_size: Optional[int] = None) -> Iterator[dict]:
+        return UniGen.sample_iter(block, sample_count, checkpoint, budget, use_cmsgen=True, batch_size=batch_size)
@@ -4,9 +4,10 @@ import numpy as np
 from functools import reduce
 from itertools import product, chain
 from time import time
-from typing import List, cast
+from typing import List, Optional, cast
 
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget, BudgetMeter
 from sweetpea._internal.core import CNF, cnf_is_satisfiable
 from sweetpea._internal.logic import And, cnf_to_json
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
@@ -27,7 +28,7 @@ class GuidedGen(Gen):
         return 'GuidedGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
 
         samples = cast(List[dict], [])
         metrics = cast(dict, {
@@ -40,15 +41,21 @@ class GuidedGen(Gen):
         cnf = build_cnf(block)
 
         metrics['solver_call_count'] = 0
+        meter = BudgetMeter(budget)
         for _ in range(sample_count):
+            if meter.exhausted():
+                break
             sample_metrics = cast(dict, {})
             t_start = time()
             samples.append(GuidedGen.__generate_sample(block, cnf, sample_metrics))
             sample_metrics['time'] = time() - t_start
             metrics['sample_metrics'].append(sample_metrics)
             metrics['solver_call_count'] += sample_metrics['solver_call_count']
+            meter.spend_candidates(1)
+            meter.spend_solver_calls(sample_metrics['solver_call_count'])
 
         metrics['time'] = time() - overall_start
+        meter.record(metrics, len(samples), sample_count)
         GuidedGen.__compute_additional_metrics(metrics)
 
         return SamplingResult(samples, metrics)
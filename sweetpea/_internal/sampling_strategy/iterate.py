@@ -1,5 +1,9 @@
+from typing import Iterator, Optional
+
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget
+from sweetpea._internal.checkpoint import Checkpoint
 from sweetpea._internal.sampling_strategy.iterate_sat import IterateSATGen
 from sweetpea._internal.sampling_strategy.random import RandomGen
 
@@ -15,8 +19,16 @@ class IterateGen(Gen):
         return 'NonUniformGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        if block.complex_factors_or_constraints:
+            return IterateSATGen.sample(block, sample_count, budget)
+        else:
+            return RandomGen.sample(block, sample_count, budget)
+
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None) -> Iterator[dict]:
         if block.complex_factors_or_constraints:
-            return IterateSATGen.sample(block, sample_count)
+            return IterateSATGen.sample_iter(block, sample_count, checkpoint, budget)
         else:
-            return RandomGen.sample(block, sample_count)
+            return RandomGen.sample_iter(block, sample_count, checkpoint, budget)
@@ -1,5 +1,8 @@
+from typing import Optional, cast
+
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget, BudgetMeter
 from sweetpea._internal.core import CNF
 from sweetpea._internal.core.generate.sample_ilp import sample_ilp_iterate
 
@@ -10,15 +13,19 @@ class IterateILPGen(Gen):
         return 'IterateILPGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
         backend_request = block.build_backend_request()
         if block.show_errors():
             return SamplingResult([], {})
 
+        meter = BudgetMeter(budget)
         solutions = sample_ilp_iterate(sample_count,
                                        CNF(backend_request.get_cnfs_as_json()),
                                        block.variables_per_sample(),
-                                       backend_request.get_requests_as_generation_requests())
+                                       backend_request.get_requests_as_generation_requests(),
+                                       lambda: meter.start_solver_call(1))
 
         result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
-        return SamplingResult(result, {})
+        metrics = cast(dict, {})
+        meter.record(metrics, len(result), sample_count)
+        return SamplingResult(result, metrics)
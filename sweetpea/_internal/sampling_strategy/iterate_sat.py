@@ -1,8 +1,10 @@
-from typing import List, cast
+from typing import Iterator, List, Optional, cast
 
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
-from sweetpea._internal.core import CNF, sample_non_uniform
+from sweetpea._internal.budget import Budget, BudgetMeter
+from sweetpea._internal.checkpoint import Checkpoint
+from sweetpea._internal.core import CNF, iterate_non_uniform
 
 """
 This represents a strategy where we "sample" just by using a SAT
@@ -15,17 +17,50 @@ class IterateSATGen(Gen):
         return 'IterateSATGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        meter = BudgetMeter(budget)
+        samples = list(IterateSATGen.__sample_iter(block, sample_count, None, meter))
+        metrics = cast(dict, {})
+        meter.record(metrics, len(samples), sample_count)
+        return SamplingResult(samples, metrics)
+
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None) -> Iterator[dict]:
+        return IterateSATGen.__sample_iter(block, sample_count, checkpoint, BudgetMeter(budget))
+
+    @staticmethod
+    def __sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint],
+                      meter: BudgetMeter) -> Iterator[dict]:
         backend_request = block.build_backend_request()
         if block.show_errors():
-            return SamplingResult([], {})
+            return
+
+        # The solutions found so far are the solver's only progress: each one
+        # is excluded from later solutions by a blocking clause
+        found = cast(List[List[int]], [])
+        if checkpoint is not None:
+            state = checkpoint.resumed_state(IterateSATGen.class_name(), block)
+            if state is not None:
+                found = state['solutions']
+                for assignment in found:
+                    yield Gen.decode(block, assignment)
 
-        solutions = sample_non_uniform(sample_count,
-                                       CNF(backend_request.get_cnfs_as_json()),
-                                       backend_request.fresh - 1,
-                                       block.variables_per_sample(),
-                                       backend_request.get_requests_as_generation_requests())
+        solutions = iterate_non_uniform(sample_count - len(found),
+                                        CNF(backend_request.get_cnfs_as_json()),
+                                        backend_request.fresh - 1,
+                                        block.variables_per_sample(),
+                                        backend_request.get_requests_as_generation_requests(),
+                                        found,
+                                        # Each call finds at most one candidate
+                                        lambda: meter.start_solver_call(1))
 
-        result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
-        return SamplingResult(result, {})
+        for s in solutions:
+            found.append(s.assignment)
+            if checkpoint is not None:
+                checkpoint.save_if_due(IterateSATGen.class_name(), block, lambda: {'solutions': found})
+            yield Gen.decode(block, s.assignment)
 
+        if checkpoint is not None:
+            meter.record(checkpoint.metrics, len(found), sample_count)
+            checkpoint.save(IterateSATGen.class_name(), block, {'solutions': found})
@@ -1,37 +1,97 @@
+import multiprocessing
 import operator as op
 import random
+import time
 import numpy as np
 
 from functools import reduce
-from itertools import product
+from itertools import chain, product
 from math import factorial, ceil
-from typing import List, cast, Tuple, Dict, Optional, Union, Any
+from typing import List, cast, Tuple, Dict, Optional, Union, Any, Callable, Iterator
 
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget, BudgetMeter
 from sweetpea._internal.cross_block import CrossBlock
 from sweetpea._internal.combinatorics import (
     n_choose_m,
-    extract_components, compute_jth_permutation_prefix, compute_jth_combination,
+    extract_components, extract_components_batch, combine_components, compute_jth_permutation_prefix, rank_permutation_prefix,
+    compute_jth_combination, rank_combination,
     count_prefixes_of_permutations_with_copies, compute_jth_prefix_of_permutations_with_copies,
-    PermutationMemo
+    sum_prefix_products_of_permutations_with_copies, PermutationMemo,
+    shared_permutation_memo
 )
 from sweetpea._internal.design_partition import DesignPartitions
+from sweetpea._internal.checkpoint import Checkpoint
+from sweetpea._internal.key_set import KeySet, HashedKeySet, make_key_set
 from sweetpea._internal.logic import And
 from sweetpea._internal.primitive import SimpleLevel, Factor, DerivedFactor, Level
+from sweetpea._internal.run_automaton import RunLengthAutomaton, RunLengthSampler
+from sweetpea._internal.sample_coding import NO_LEVEL, SampleCoding
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
+from sweetpea._internal.sampling_strategy.unigen import UniGen
 from sweetpea._internal.constraint import Exclude, _KInARow, ExactlyKInARow, AtMostKInARow
-from sweetpea._internal.iter import chunk
+from sweetpea._internal.iter import chunk, IndexShuffle
 from sweetpea._internal.weight import combination_weight
-from sweetpea._internal.check_mismatch import combinations_mismatched_weights
+from sweetpea._internal.check_mismatch import CrossingBalance
 
 
 class RandomGen(Gen):
     """This strategy represents the ideal. Valid sequences are uniformly
     sampled via a bijection from natural numbers to valid trial sequences.
 
-    Complex windows and counting constrants are handled by rejection sampling.
+    Complex windows and counting constrants are handled by rejection sampling,
+    except that k-in-a-row constraints on levels of crossed factors are
+    compiled into an automaton, so that sequences satisfying them are sampled
+    directly.
+
+    When `batch_size` is greater than 1, candidates are drawn `batch_size` at
+    a time and represented as an integer-coded array while they are checked
+    against constraints, which is much faster when many candidates are
+    rejected.
+
+    When `workers` is greater than 1, candidates are generated and checked by
+    a pool of processes. Each worker draws from its own random stream derived
+    from `seed`, so results are reproducible for a given seed and number of
+    workers. When `seed` is provided with a single worker, it seeds a random
+    stream that is used instead of the global one.
+
+    When `index_range` is provided, candidates are instead drawn without
+    replacement from that range of sequence indices, as numbered by the
+    enumerator from :func:`RandomGen.sequence_enumerator`. Disjoint ranges
+    from its `partition` method can be sampled by separate processes or
+    machines without sharing any state, and a range is enumerated
+    exhaustively when `sample_count` is at least its size. Drawing by index
+    is uniform over candidate sequences even when levels are weighted.
+
+    When `max_estimated_time` is provided, the acceptance rate of candidates
+    is tracked as sampling proceeds, and it is used to estimate the time
+    needed for the remaining samples. If the estimate exceeds
+    `max_estimated_time` seconds, the remaining samples are requested from
+    `fallback` instead, which defaults to :class:`.UniGen`, and the switch
+    is recorded in the result's metrics. Samples from `fallback` that
+    duplicate earlier ones are replaced by requesting more, and the number
+    dropped is reported in the ``fallback_duplicates`` metric.
+
+    Sequences that have already been drawn are remembered by 128-bit hashes
+    in a compact table. When `dedup` is ``'bloom'``, they are remembered in a
+    Bloom filter, instead, which uses much less memory for a large number of
+    candidates, at the cost of a small chance of skipping a sequence that has
+    not been drawn. Since the filter cannot tell when every candidate has
+    been drawn, sampling stops after many draws in a row find only
+    candidates that it reports as drawn. The memory and time used for
+    deduplication, and whether sampling stopped that way, are reported in
+    the ``dedup`` metric.
     """
 
+    # Each task given to a worker process checks at least this many candidates
+    _MIN_TASK_CANDIDATES = 256
+
+    # Constraints are checked incrementally after each this many trials
+    _PREFIX_CHECK_TRIALS = 8
+
+    # The acceptance rate is estimated only after this many candidates
+    _MIN_ESTIMATE_CANDIDATES = 1000
+
     def __str__(self):
         return RandomGen.class_name()
 
@@ -40,33 +100,93 @@ class RandomGen(Gen):
         return 'RandomGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
-        return RandomGen.__sample(block, sample_count, 0)
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        return RandomGen.__sample(block, sample_count, 0, budget=budget)
 
-    def __init__(self, acceptable_error):
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None) -> Iterator[dict]:
+        return RandomGen.__sample_iter(block, sample_count, checkpoint.metrics if checkpoint is not None else {}, 0,
+                                       checkpoint=checkpoint, budget=budget)
+
+    def __init__(self, acceptable_error=0, batch_size=1, workers=1, seed=None, index_range=None,
+                 max_estimated_time=None, fallback=None, dedup='hashed'):
         self.acceptable_error = acceptable_error
+        self.batch_size = batch_size
+        self.workers = workers
+        self.seed = seed
+        self.index_range = index_range
+        self.max_estimated_time = max_estimated_time
+        self.fallback = fallback
+        self.dedup = dedup
+
+    def sample_object(self, block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        return RandomGen.__sample(block, sample_count, self.acceptable_error, self.batch_size,
+                                  self.workers, self.seed, self.index_range,
+                                  self.max_estimated_time, self.fallback, self.dedup, budget)
+
+    def sample_object_iter(self, block: Block, sample_count: int,
+                           checkpoint: Optional[Checkpoint] = None,
+                           budget: Optional[Budget] = None) -> Iterator[dict]:
+        return RandomGen.__sample_iter(block, sample_count, checkpoint.metrics if checkpoint is not None else {},
+                                       self.acceptable_error, self.batch_size,
+                                       self.workers, self.seed, self.index_range,
+                                       self.max_estimated_time, self.fallback, self.dedup, checkpoint, budget)
+
+    @staticmethod
+    def sequence_enumerator(block: Block) -> 'UCSolutionEnumerator':
+        """Returns an enumerator that numbers the candidate sequences for
+        `block`, providing `sequence_count`, `unrank`, `rank`, and
+        `partition` methods."""
+        RandomGen.__validate(block)
+        return UCSolutionEnumerator(cast(CrossBlock, block))
 
-    def sample_object(self, block: Block, sample_count: int) -> SamplingResult:
-        return RandomGen.__sample(block, sample_count, self.acceptable_error)
+    @staticmethod
+    def __sample(block: Block, sample_count: int, acceptable_error: int, batch_size: int = 1,
+                 workers: int = 1, seed: Optional[int] = None,
+                 index_range: Optional[Union[range, Tuple[int, int]]] = None,
+                 max_estimated_time: Optional[float] = None, fallback: Any = None,
+                 dedup: str = 'hashed', budget: Optional[Budget] = None) -> SamplingResult:
+        metrics = cast(Dict[str, Any], {})
+        samples = list(RandomGen.__sample_iter(block, sample_count, metrics, acceptable_error, batch_size,
+                                               workers, seed, index_range, max_estimated_time, fallback, dedup,
+                                               budget=budget))
+        return SamplingResult(samples, metrics)
 
     @staticmethod
-    def __sample(block: Block, sample_count: int, acceptable_error: int) -> SamplingResult:
+    def __sample_iter(block: Block, sample_count: int, metrics: Dict[str, Any], acceptable_error: int,
+                      batch_size: int = 1, workers: int = 1, seed: Optional[int] = None,
+                      index_range: Optional[Union[range, Tuple[int, int]]] = None,
+                      max_estimated_time: Optional[float] = None, fallback: Any = None,
+                      dedup: str = 'hashed', checkpoint: Optional[Checkpoint] = None,
+                      budget: Optional[Budget] = None) -> Iterator[dict]:
+        """Yields each sample as soon as it is accepted, and fills in
+        `metrics` as sampling proceeds. Accepted samples are not retained,
+        except as keys for deduplicating samples from `fallback` or as part
+        of the state that is saved to `checkpoint`. Sampling stops early if
+        `budget` runs out, and `fallback` gets whatever budget is left."""
         # 1. Validate the block.
         RandomGen.__validate(block)
-        metrics = {}
 
         if block.show_errors():
-            return SamplingResult([], {})
+            return
+
+        resumed = checkpoint.resumed_state(RandomGen.class_name(), block) if checkpoint is not None else None
+        if resumed is not None and resumed['complete']:
+            yield from resumed['samples']
+            return
 
         # 2. Count how many solutions there are. The enumerator will note
         # the crossing size and minimum-trial request, and it will be prepared
         # to generate runs of a crossing-size length or "leftover" length.
         print("Counting possible configurations...")
+        meter = BudgetMeter(budget)
         enumerator = UCSolutionEnumerator(cast(CrossBlock, block))
         metrics['solution_count'] = enumerator.solution_count()
 
         if (enumerator.solution_count() == 0):
-            return SamplingResult([], metrics)
+            meter.record(metrics, 0, sample_count)
+            return
 
         crossing_size = enumerator.crossing_size # includes crossing weight
 
@@ -79,53 +199,383 @@ class RandomGen(Gen):
         trials_per_run = block.trials_per_sample()
         rounds_per_run = (trials_per_run - enumerator._preamble_size) // crossing_size
         leftover = (trials_per_run - enumerator._preamble_size) % crossing_size
-        samples = cast(List[dict], [])
-        used_keys = cast(Dict[Tuple[int, ...], bool], {})
+        used_keys = make_key_set(dedup)
+        # Only needed to deduplicate samples from a fallback strategy
+        accepted_keys = HashedKeySet() if max_estimated_time is not None else None
         possible_keys = (enumerator.preamble_solution_count()
                          * pow(enumerator.solution_count(), rounds_per_run)
                          * enumerator.leftover_solution_count())
-        while sampled < sample_count:
-            if len(used_keys) == possible_keys:
-                break
-
-            solution_variabless = enumerator.generate_random_samples(rounds_per_run, leftover, used_keys)
-            used_keys[enumerator.extract_sequence_key(solution_variabless)] = True
-
-            # Combine randomly selected crossing-sized runs plus a leftover-sized run
-            # into one complete run with the requested number of trials.
-            run = solution_variabless[0][1]  # the preamble solution, possibly empty
-            for round in range(0, rounds_per_run + (1 if leftover > 0 else 0)):
-                run = RandomGen.__combine_round(run, solution_variabless[round + 1][1])
-
-            run = enumerator.fill_in_nonpreamble_uncrossed_derived(run, trials_per_run)
-
-            if RandomGen.__are_constraints_violated(cast(CrossBlock, block), run, enumerator,
-                                                    rounds_per_run, leftover,
-                                                    acceptable_error):
+        metrics['run_length_sampler'] = False
+        indices = cast(Optional[IndexShuffle], None)
+        if index_range is None and enumerator.run_length_sampler() is not None:
+            # Run-length constraints are satisfied by construction, so only
+            # other constraints can reject a candidate
+            metrics['run_length_sampler'] = True
+            possible_keys = enumerator.run_length_sequence_count()
+        if index_range is not None:
+            if not isinstance(index_range, range):
+                index_range = range(*index_range)
+            index_range = range(max(index_range.start, 0), min(index_range.stop, possible_keys))
+            indices = IndexShuffle(index_range, random.Random(seed) if seed is not None else enumerator._random)
+            possible_keys = indices.size
+
+        def record(conforms: bool) -> bool:
+            nonlocal sampled, rejected, total_rejected
+            meter.spend_candidates(1)
+            if not conforms:
                 rejected += 1
                 if rejected % 10000 == 0:
-                    if len(samples) > 0:
-                        accepts = f", accepted {len(samples)}"
+                    if sampled > 0:
+                        accepts = f", accepted {sampled}"
                     else:
                         accepts = ""
                     n = total_rejected + rejected
                     print(f"Rejected {n} candidates so far (out of {possible_keys} choices){accepts}")
-                continue
-
+                return False
             metrics['rejections'].append(rejected)
             total_rejected += rejected
             rejected = 0
             sampled += 1
-
-            samples.append(enumerator.factors_and_levels_to_names(run))
+            return True
+
+        # When the estimated time for the remaining samples is too long,
+        # `switch` records why, and sampling continues with `fallback`
+        start_time = time.time()
+        switch = cast(Optional[dict], None)
+
+        def keep_going() -> bool:
+            nonlocal switch
+            if sampled >= sample_count or meter.exhausted():
+                return False
+            candidates = sampled + total_rejected + rejected
+            if max_estimated_time is None or candidates < RandomGen._MIN_ESTIMATE_CANDIDATES:
+                return True
+            elapsed = time.time() - start_time
+            # Assume one more acceptance than observed, so that an estimate
+            # is available before any candidate is accepted
+            acceptance_rate = (sampled + 1) / (candidates + 1)
+            estimated_time = (sample_count - sampled) / acceptance_rate * (elapsed / candidates)
+            if estimated_time <= max_estimated_time:
+                return True
+            switch = {'from': RandomGen.class_name(),
+                      'to': RandomGen.__fallback_name(fallback),
+                      'reason': (f"estimated {estimated_time:.1f} seconds for {sample_count - sampled} more"
+                                 f" samples exceeds {max_estimated_time} seconds"),
+                      'candidates': candidates,
+                      'acceptance_rate': sampled / candidates,
+                      'estimated_time': estimated_time,
+                      'elapsed_time': elapsed}
+            return False
+
+        # With a checkpoint, accepted samples are kept so that they can be
+        # saved, and a saved state is restored after seeding
+        accepted = cast(Optional[List[dict]], [] if checkpoint is not None else None)
+        if workers <= 1 and seed is not None:
+            enumerator.use_random(random.Random(seed))
+        progress = cast(Dict[str, Any], {'round': 0, 'entropy': np.random.SeedSequence(seed).entropy})
+        if resumed is not None:
+            accepted = resumed['samples']
+            used_keys = resumed['used_keys']
+            accepted_keys = resumed['accepted_keys']
+            sampled = resumed['sampled']
+            rejected = resumed['rejected']
+            total_rejected = resumed['total_rejected']
+            metrics['rejections'] = resumed['rejections']
+            enumerator._random.setstate(resumed['random'])
+            if indices is not None:
+                indices.set_state(resumed['indices'])
+            progress = resumed['progress']
+            yield from cast(List[dict], accepted)
+
+        def state(complete: bool = False) -> Dict[str, Any]:
+            return {'complete': complete,
+                    'samples': accepted,
+                    'used_keys': used_keys,
+                    'accepted_keys': accepted_keys,
+                    'sampled': sampled,
+                    'rejected': rejected,
+                    'total_rejected': total_rejected,
+                    'rejections': metrics['rejections'],
+                    'random': enumerator._random.getstate(),
+                    'indices': indices.get_state() if indices is not None else None,
+                    'progress': progress}
+
+        def save_if_due() -> None:
+            if checkpoint is not None:
+                checkpoint.save_if_due(RandomGen.class_name(), block, state)
+
+        def record_all(candidates: List[Tuple[Tuple[int, ...], Optional[dict]]]) -> Iterator[dict]:
+            for _, candidate in candidates:
+                if sampled == sample_count or meter.remaining_candidates(1) == 0:
+                    break
+                if record(candidate is not None):
+                    if accepted_keys is not None:
+                        accepted_keys.add(RandomGen.__sample_key(cast(dict, candidate)))
+                    if accepted is not None:
+                        accepted.append(cast(dict, candidate))
+                    yield cast(dict, candidate)
+
+        if workers > 1:
+            for candidates in RandomGen.__sample_in_workers(cast(CrossBlock, block), enumerator, sample_count,
+                                                            acceptable_error, batch_size, workers,
+                                                            used_keys, possible_keys, keep_going, indices,
+                                                            progress, save_if_due):
+                yield from record_all(candidates)
+        else:
+            while keep_going():
+                if len(used_keys) == possible_keys or used_keys.saturated():
+                    break
+                count = meter.remaining_candidates(min(batch_size, possible_keys - len(used_keys)))
+                if indices is not None:
+                    candidates = RandomGen.__check_indices(cast(CrossBlock, block), enumerator, indices.draw(count),
+                                                           acceptable_error)
+                    for key, _ in candidates:
+                        used_keys.add(key)
+                    yield from record_all(candidates)
+                else:
+                    yield from record_all(RandomGen.__check_candidates(cast(CrossBlock, block), enumerator, count,
+                                                                       acceptable_error, batch_size, used_keys))
+                save_if_due()
 
         metrics['sample_count'] = sample_count
+        metrics['dedup'] = used_keys.metrics()
         metrics['total_rejected'] = total_rejected
         metrics['avg_rejected'] = total_rejected / sample_count
         if (total_rejected > 10000):
             print("")
 
-        return SamplingResult(samples, metrics)
+        produced = sampled
+        if switch is not None:
+            print(f"Switching to {switch['to']}: {switch['reason']}")
+            metrics['strategy_switch'] = switch
+            # Samples from `fallback` that duplicate accepted ones are
+            # dropped, so more are requested until enough are produced. A
+            # request asks for enough to replace the duplicates, but after
+            # a request produces nothing new, the next one asks for more
+            # than all samples so far, in case `fallback` repeats its
+            # earlier samples; sampling stops if that also produces nothing
+            duplicates = 0
+            received = 0
+            stalled = False
+            while produced < sample_count and not meter.exhausted():
+                request = sample_count - produced + (received if stalled else duplicates)
+                fallback_result = RandomGen.__sample_fallback(block, request, fallback, meter.remaining())
+                received += len(fallback_result.samples)
+                metrics['fallback_metrics'] = fallback_result.metrics
+                if fallback_result.metrics.get('stop_reason', '').endswith('_budget'):
+                    meter.stop_reason = fallback_result.metrics['stop_reason']
+                fresh = 0
+                for sample in fallback_result.samples:
+                    if produced == sample_count:
+                        break
+                    if cast(HashedKeySet, accepted_keys).add(RandomGen.__sample_key(sample)):
+                        if accepted is not None:
+                            accepted.append(sample)
+                        produced += 1
+                        fresh += 1
+                        yield sample
+                    else:
+                        duplicates += 1
+                if fresh == 0 and stalled:
+                    break
+                stalled = (fresh == 0)
+            metrics['fallback_duplicates'] = duplicates
+
+        meter.record(metrics, produced, sample_count)
+
+        if checkpoint is not None:
+            checkpoint.save(RandomGen.class_name(), block, state(complete=True))
+
+    @staticmethod
+    def __sample_key(sample: dict) -> Tuple[Tuple[str, Tuple[str, ...]], ...]:
+        return tuple(sorted([(name, tuple(levels)) for name, levels in sample.items()]))
+
+    @staticmethod
+    def __fallback_name(fallback: Any) -> str:
+        if fallback is None:
+            return UniGen.class_name()
+        if isinstance(fallback, type):
+            return cast(Any, fallback).class_name()
+        return str(fallback)
+
+    @staticmethod
+    def __sample_fallback(block: Block, sample_count: int, fallback: Any, budget: Budget) -> SamplingResult:
+        if fallback is None:
+            fallback = UniGen
+        if isinstance(fallback, type):
+            assert issubclass(fallback, Gen)
+            return fallback.sample(block, sample_count, **Gen._budget_arguments(budget))
+        return fallback.sample_object(block, sample_count, **Gen._budget_arguments(budget))
+
+    @staticmethod
+    def __check_candidates(block: CrossBlock, enumerator: 'UCSolutionEnumerator', count: int,
+                           acceptable_error: int, batch_size: int,
+                           used_keys: KeySet) -> List[Tuple[Tuple[int, ...], Optional[dict]]]:
+        """Draws `count` candidates that are not in `used_keys`, adds them to
+        `used_keys`, and returns each candidate's key paired with either its
+        sample, if it satisfies the constraints, or None. Fewer candidates
+        are returned if `used_keys` becomes saturated."""
+        trials_per_run = block.trials_per_sample()
+        rounds_per_run = (trials_per_run - enumerator._preamble_size) // enumerator.crossing_size
+        leftover = (trials_per_run - enumerator._preamble_size) % enumerator.crossing_size
+        candidates = cast(List[Tuple[Tuple[int, ...], Optional[dict]]], [])
+        exact = enumerator.run_length_sampler() is not None
+        while len(candidates) < count:
+            if exact:
+                key, run = enumerator.generate_run_length_sample()
+                if not used_keys.add(key):
+                    if used_keys.saturated():
+                        break
+                    continue
+                if RandomGen.__are_constraints_violated(block, run, enumerator, rounds_per_run, leftover,
+                                                        acceptable_error):
+                    candidates.append((key, None))
+                else:
+                    candidates.append((key, enumerator.factors_and_levels_to_names(run)))
+                continue
+
+            if batch_size > 1:
+                # Check a batch of candidates in integer-coded form, and
+                # convert only accepted candidates to samples.
+                coding = enumerator.sample_coding()
+                keys, codes = enumerator.generate_random_codes(min(batch_size, count - len(candidates)),
+                                                               rounds_per_run, leftover, used_keys)
+                conforms = RandomGen.__coded_constraints_conform(block, codes, coding, enumerator,
+                                                                 rounds_per_run, leftover, acceptable_error)
+                for key, candidate, ok in zip(keys, codes, conforms.tolist()):
+                    candidates.append((key, coding.decode_names(candidate) if ok else None))
+                if used_keys.saturated():
+                    break
+                continue
+
+            segments = enumerator.generate_random_segments(rounds_per_run, leftover, used_keys)
+            if segments is None:
+                break
+            key = tuple([segment_key for segment_key, _ in segments])
+
+            # Combine randomly selected crossing-sized runs plus a leftover-sized run
+            # into one complete run with the requested number of trials, checking
+            # constraints as each segment is added, so that a candidate can be
+            # rejected without generating the rest of its run
+            run = cast(dict, {})
+            segment_end = 0
+            violated = False
+            for i, (_, generate) in enumerate(segments):
+                start = segment_end
+                segment_end = min(enumerator._preamble_size + i * enumerator.crossing_size, trials_per_run)
+                run = RandomGen.__combine_round(run, generate())
+                # Derived factors are filled in and checked a few trials at a time
+                while start < segment_end and not violated:
+                    end = min(start + RandomGen._PREFIX_CHECK_TRIALS, segment_end)
+                    run = enumerator.fill_in_nonpreamble_uncrossed_derived(run, end, start)
+                    violated = RandomGen.__is_prefix_violated(block, run, start, end)
+                    start = end
+                if violated:
+                    break
+            else:
+                if not RandomGen.__are_constraints_violated(block, run, enumerator, rounds_per_run, leftover,
+                                                            acceptable_error):
+                    candidates.append((key, enumerator.factors_and_levels_to_names(run)))
+                    continue
+            candidates.append((key, None))
+        return candidates
+
+    @staticmethod
+    def __check_indices(block: CrossBlock, enumerator: 'UCSolutionEnumerator', indices: List[int],
+                        acceptable_error: int) -> List[Tuple[Tuple[int, ...], Optional[dict]]]:
+        """Like `__check_candidates`, but for the candidates at the given
+        sequence indices, each keyed by a tuple of its index."""
+        trials_per_run = block.trials_per_sample()
+        rounds_per_run = (trials_per_run - enumerator._preamble_size) // enumerator.crossing_size
+        leftover = (trials_per_run - enumerator._preamble_size) % enumerator.crossing_size
+        candidates = cast(List[Tuple[Tuple[int, ...], Optional[dict]]], [])
+        for index in indices:
+            run = enumerator.unrank_run(index)
+            if RandomGen.__are_constraints_violated(block, run, enumerator, rounds_per_run, leftover,
+                                                    acceptable_error):
+                candidates.append(((index,), None))
+            else:
+                candidates.append(((index,), enumerator.factors_and_levels_to_names(run)))
+        return candidates
+
+    # Set while worker processes are running, so that forked workers
+    # inherit the block and enumerator instead of receiving pickled copies:
+    __task_context = cast(Optional[tuple], None)
+
+    @staticmethod
+    def __sample_in_workers(block: CrossBlock, enumerator: 'UCSolutionEnumerator', sample_count: int,
+                            acceptable_error: int, batch_size: int, workers: int,
+                            used_keys: KeySet, possible_keys: int,
+                            keep_going: Callable[[], bool],
+                            indices: Optional[IndexShuffle],
+                            progress: Dict[str, Any],
+                            round_done: Callable[[], None]) -> Iterator[List[Tuple[Tuple[int, ...],
+                                                                                   Optional[dict]]]]:
+        # Each round gives every worker a task with a seed drawn from its own
+        # stream. Results are merged in worker order, deduplicated against
+        # `used_keys`, and yielded as one list of candidates per task, so the
+        # outcome does not depend on process scheduling.
+        # When sampling by index, this process draws the indices instead, and
+        # each task checks its share of them. The stream's entropy and the
+        # number of completed rounds are kept in `progress`, and `round_done`
+        # is called after each round, which is when `progress` and
+        # `used_keys` are consistent with each other.
+        task_size = max(batch_size, RandomGen._MIN_TASK_CANDIDATES)
+        entropy = progress['entropy']
+        RandomGen.__task_context = (block, enumerator, acceptable_error, batch_size)
+        try:
+            # Without fork, the block's predicates may not be transferable to
+            # workers, so the same tasks run in this process, instead
+            pool = None
+            if 'fork' in multiprocessing.get_all_start_methods():
+                pool = multiprocessing.get_context('fork').Pool(workers)
+            try:
+                round = progress['round']
+                while keep_going() and len(used_keys) < possible_keys and not used_keys.saturated():
+                    count = min(task_size, possible_keys)
+                    tasks = [(int.from_bytes(np.random.SeedSequence(entropy, spawn_key=(worker, round))
+                                             .generate_state(4).tobytes(), 'little'),
+                              count,
+                              indices.draw(count) if indices is not None else None)
+                             for worker in range(workers)]
+                    if pool is not None:
+                        results = pool.map(RandomGen._check_candidates_task, tasks)
+                    else:
+                        results = [RandomGen._check_candidates_task(task) for task in tasks]
+                    for candidates in results:
+                        fresh = []
+                        for key, candidate in candidates:
+                            if used_keys.add(key):
+                                fresh.append((key, candidate))
+                        yield fresh
+                    round += 1
+                    progress['round'] = round
+                    round_done()
+            finally:
+                if pool is not None:
+                    pool.terminate()
+        finally:
+            RandomGen.__task_context = None
+
+    @staticmethod
+    def _check_candidates_task(task: Tuple[int, int, Optional[List[int]]]) -> List[Tuple[Tuple[int, ...],
+                                                                                         Optional[dict]]]:
+        """Runs in a worker process to check a number of candidates drawn
+        from a random stream with the given seed, or to check the candidates
+        at the given indices."""
+        seed, count, indices = task
+        block, enumerator, acceptable_error, batch_size = cast(tuple, RandomGen.__task_context)
+        if indices is not None:
+            return RandomGen.__check_indices(block, enumerator, indices, acceptable_error)
+        # Without fork, this runs on the caller's enumerator, so its stream
+        # is restored afterward
+        previous = enumerator._random
+        enumerator.use_random(random.Random(seed))
+        try:
+            return RandomGen.__check_candidates(block, enumerator, count, acceptable_error, batch_size,
+                                                HashedKeySet())
+        finally:
+            enumerator.use_random(previous)
 
     @staticmethod
     def __are_constraints_violated(block: CrossBlock, sample: dict, enumerator: 'UCSolutionEnumerator',
@@ -134,35 +584,81 @@ class RandomGen(Gen):
         for ct in block.constraints:
             if not ct.potential_sample_conforms(sample, block):
                 return True
-        if enumerator.has_crossed_complex_derived_factors or len(block.crossings) > 1:
+        return RandomGen.__are_crossings_violated(block, sample, enumerator, rounds_per_run, leftover,
+                                                  acceptable_error)
+
+    @staticmethod
+    def __is_prefix_violated(block: CrossBlock, run: dict, start: int, end: int) -> bool:
+        for ct in block.constraints:
+            if not ct.potential_prefix_conforms(run, block, start, end):
+                return True
+        return False
+
+    @staticmethod
+    def __coded_constraints_conform(block: CrossBlock, codes: np.ndarray, coding: SampleCoding,
+                                    enumerator: 'UCSolutionEnumerator',
+                                    rounds_per_run: int, leftover: int,
+                                    acceptable_error: int) -> np.ndarray:
+        """Batch form of the negation of `__are_constraints_violated` for
+        candidates coded by `coding`."""
+        conforms = np.ones(len(codes), dtype=bool)
+        for ct in block.constraints:
+            # Check only candidates that are not already rejected:
+            remaining = np.flatnonzero(conforms)
+            if len(remaining) == 0:
+                return conforms
+            conforms[remaining] = ct.potential_coded_samples_conform(codes[remaining], coding, block)
+        if RandomGen.__needs_crossings_check(block, enumerator):
+            coding_columns = [[coding.column(f) for f in balance.crossing] for balance in enumerator.crossing_balances]
+            bad = np.zeros(len(codes), dtype=np.int64)
+            for i, start, end, or_less in RandomGen.__crossing_segments(block, enumerator, rounds_per_run, leftover):
+                remaining = np.flatnonzero(conforms)
+                if len(remaining) == 0:
+                    break
+                balance = enumerator.crossing_balances[i]
+                bad[remaining] += balance.coded_mismatches(start, end, codes[remaining], coding_columns[i], or_less)
+                conforms &= (bad <= acceptable_error)
+        return conforms
+
+    @staticmethod
+    def __needs_crossings_check(block: CrossBlock, enumerator: 'UCSolutionEnumerator') -> bool:
+        return enumerator.has_crossed_complex_derived_factors or len(block.crossings) > 1
+
+    @staticmethod
+    def __are_crossings_violated(block: CrossBlock, sample: dict, enumerator: 'UCSolutionEnumerator',
+                                 rounds_per_run: int, leftover: int,
+                                 acceptable_error: int) -> bool:
+        if RandomGen.__needs_crossings_check(block, enumerator):
             # Check whether the sample achieves each crossing in the run
             bad = 0
-            run_length = enumerator._preamble_size + (rounds_per_run * enumerator.crossing_size) + leftover
-            for i, c in enumerate(block.crossings):
-                if enumerator.has_crossed_complex_derived_factors or i > 0:
-                    start = enumerator.preamble_sizes[i]
-                    c_weight = enumerator.crossing_weights[i]
-                    c_crossing_size = enumerator.crossing_sizes[i] * c_weight
-                    c_rounds_per_run = (run_length - start) // c_crossing_size
-                    c_leftover = (run_length - start) % c_crossing_size
-                    # There might be a little room for improvement here by bailing
-                    # out within combinations_mismatched_weights() as soon as the
-                    # acceptable error is exceeded, but probably it doesn't matter.
-                    for round in range(c_rounds_per_run):
-                        # if not conds_match_weights(start, start + crossing_size, True):
-                        #     return True
-                        bad += combinations_mismatched_weights(start, start + c_crossing_size, c_weight, c, sample, False)
-                        if bad > acceptable_error:
-                            return True
-                        start += c_crossing_size
-                    if c_leftover > 0:
-                        # if not conds_match_weights(start, start + c_leftover, True):
-                        #     return True
-                        bad += combinations_mismatched_weights(start, start + c_leftover, c_weight, c, sample, True)
-                        if bad > acceptable_error:
-                            return True
+            for i, start, end, or_less in RandomGen.__crossing_segments(block, enumerator, rounds_per_run, leftover):
+                bad += enumerator.crossing_balances[i].mismatches(start, end, sample, or_less)
+                if bad > acceptable_error:
+                    return True
         return False
 
+    @staticmethod
+    def __crossing_segments(block: CrossBlock, enumerator: 'UCSolutionEnumerator',
+                            rounds_per_run: int, leftover: int) -> List[Tuple[int, int, int, bool]]:
+        """Lists the trial ranges of a run that `__are_crossings_violated`
+        checks, each with the index of its crossing and whether the range
+        is a leftover that may have fewer of each combination."""
+        segments = cast(List[Tuple[int, int, int, bool]], [])
+        run_length = enumerator._preamble_size + (rounds_per_run * enumerator.crossing_size) + leftover
+        for i, c in enumerate(block.crossings):
+            if enumerator.has_crossed_complex_derived_factors or i > 0:
+                start = enumerator.preamble_sizes[i]
+                c_weight = enumerator.crossing_weights[i]
+                c_crossing_size = enumerator.crossing_sizes[i] * c_weight
+                c_rounds_per_run = (run_length - start) // c_crossing_size
+                c_leftover = (run_length - start) % c_crossing_size
+                for round in range(c_rounds_per_run):
+                    segments.append((i, start, start + c_crossing_size, False))
+                    start += c_crossing_size
+                if c_leftover > 0:
+                    segments.append((i, start, start + c_leftover, True))
+        return segments
+
     @staticmethod
     def __validate(block: Block) -> None:
         # Triggers checks within `block`:
@@ -237,6 +733,7 @@ class UCSolutionEnumerator():
         self.crossing_sizes = [block.crossing_size(c) for c in block.crossings]
         self.preamble_sizes = [block.preamble_size(c) for c in block.crossings]
         self.crossing_weights = [block.crossing_weight(c) for c in block.crossings]
+        self.crossing_balances = [CrossingBalance(c, w) for c, w in zip(block.crossings, self.crossing_weights)]
         # Check that calculations from two sources agree:
         assert self.crossing_sizes[0] * self.crossing_weights[0] == self.crossing_size
 
@@ -245,8 +742,11 @@ class UCSolutionEnumerator():
         self._preamble_size = preamble_size;
 
         # Call `__count_solutions` after everything else is set up.
+        self.__compatible_sources = cast(Optional[np.ndarray], None)  # Computed on demand
         self._components_shape = RandomComponentsShape()
-        self._pmemo = PermutationMemo()
+        # The same counting table serves full and leftover rounds, and it is
+        # shared with other enumerators for the same crossing shape
+        self._pmemo = shared_permutation_memo(len(self._crossing_instances), self._m_or_counters)
         self._solution_count = self.__count_solutions(self.crossing_size,
                                                       self._components_shape,
                                                       self._pmemo,
@@ -254,7 +754,7 @@ class UCSolutionEnumerator():
                                                       self._ind_factor_levels)
         self._leftover_components_shape = RandomComponentsShape()
         self._leftover_solution_count = 1
-        self._leftover_pmemo = PermutationMemo()
+        self._leftover_pmemo = self._pmemo
         leftover = (block.trials_per_sample() - preamble_size) % self.crossing_size;
         if (leftover != 0):
             self._leftover_solution_count = self.__count_solutions(leftover,
@@ -268,6 +768,21 @@ class UCSolutionEnumerator():
         # factors with complex windows?
         self._preamble_solution_count = self.__count_preamble_solutions()
 
+        self.__sample_coding = cast(Optional[SampleCoding], None)  # Created on demand for batches
+        self.__round_tables = cast(Optional[Tuple[np.ndarray, List[int], np.ndarray]], None)  # Also on demand
+        self.__preamble_radix_list = cast(Optional[List[int]], None)
+        self.__round_factor_list = cast(Optional[List[Factor]], None)
+        self.__round_counts = cast(Dict[Tuple[Tuple[int, ...], int], int], {})  # For ranking and unranking
+        self.__distinct_level_positions = cast(Dict[Factor, List[int]], {})  # Also for ranking and unranking
+        self.__run_length_sampler = cast(Optional[RunLengthSampler], None)  # Created on demand
+        self.__run_length_sampler_ready = False
+        self._random = cast(Any, random)  # The global stream, unless `use_random` is called
+
+    def use_random(self, rng: random.Random) -> None:
+        """Draws random components from `rng` instead of the global
+        random stream."""
+        self._random = rng
+
     def solution_count(self):
         return self._solution_count
 
@@ -280,36 +795,458 @@ class UCSolutionEnumerator():
     def crossing_instances_count(self):
         return len(self._crossing_instances)
 
-    def generate_random_samples(self, n: int, leftover: int, sampled: Dict[Tuple[int, ...], bool]) -> List[
-        Tuple[int, dict]]:
+    def sequence_count(self) -> int:
+        """The number of candidate sequences for a full run, which is the
+        number of indices accepted by `unrank`. Candidates are not checked
+        against constraints that need rejection sampling, so this count is
+        an upper bound on the number of valid sequences. A weighted level
+        counts once, so the count is of distinct sequences."""
+        return reduce(op.mul, self.__run_sizes(), 1)
+
+    def unrank(self, index: int) -> dict:
+        """Returns the candidate sequence at `index` as a sample that maps
+        factor names to lists of level names. The index must be between 0
+        (inclusive) and `sequence_count()` (exclusive), and each index
+        produces a different sequence, even when levels are weighted."""
+        return self.factors_and_levels_to_names(self.unrank_run(index))
+
+    def unrank_run(self, index: int) -> dict:
+        """Like `unrank`, but produces a sample that maps factors to lists of
+        levels."""
+        if not 0 <= index < self.sequence_count():
+            raise IndexError(f"sequence index {index} is out of range")
+        rounds, leftover = self.__run_shape()
+        digits = extract_components(self.__run_sizes(), index)
+        preamble_digits = extract_components(self.__preamble_index_radices(), digits[0])
+        positions = [self.__level_positions(f, levels) for f, levels in self._basic_factor_levels
+                     for _ in range(self._preamble_size)]
+        run = self.generate_preamble_sample(combine_components(self.__preamble_radices(),
+                                                               [p[d] for p, d in zip(positions, preamble_digits)]))
+        for r, digit in enumerate(digits[1:]):
+            trial_count = self.crossing_size if r < rounds else leftover
+            round = self._trial_values_to_experiment(self.__unrank_round(digit, trial_count))
+            if len(run) == 0:
+                run = round
+            else:
+                run = run.copy()
+                for f in round:
+                    run[f] = run[f] + round[f]
+        return self.fill_in_nonpreamble_uncrossed_derived(run, self._block.trials_per_sample())
+
+    def rank(self, sample: dict) -> int:
+        """The inverse of `unrank`: returns the index of a sample that maps
+        factor names to lists of level names. Extra factors in `sample` are
+        ignored. Raises ValueError if `sample` is not a candidate sequence."""
+        trials_per_run = self._block.trials_per_sample()
+        factors = {f.name: f for f in self._block.design}
+        columns = cast(Dict[Factor, List[Any]], {})
+        for name, f in factors.items():
+            if name in sample:
+                if len(sample[name]) != trials_per_run:
+                    raise ValueError(f"sample has {len(sample[name])} trials for {name}, expected {trials_per_run}")
+                columns[f] = [f.get_level(l) for l in sample[name]]
+        try:
+            rounds, leftover = self.__run_shape()
+            preamble_size = self._preamble_size
+            digits = cast(List[int], [])
+            for f, levels in self._basic_factor_levels:
+                level_digits = self.__level_digits(f, levels)
+                digits += [level_digits[l.name] for l in columns[f][:preamble_size]]
+            run_digits = [combine_components(self.__preamble_index_radices(), digits)]
+            ind_level_digits = [self.__level_digits(f, levels) for f, levels in self._ind_factor_levels]
+            crossed = self._partitions.get_crossed_noncomplex_factors()
+            sources = self._partitions.get_uncrossed_basic_source_factors()
+            crossing_indices = {tuple(ci[f] for f in crossed): i for i, ci in enumerate(self._crossing_instances)}
+            source_indices = {tuple(sc[f] for f in sources): i for i, sc in enumerate(self._source_combinations)}
+            start = preamble_size
+            for r in range(rounds + (1 if leftover > 0 else 0)):
+                trial_count = self.crossing_size if r < rounds else leftover
+                trials = range(start, start + trial_count)
+                run_digits.append(self.__rank_round(
+                    [crossing_indices[tuple(columns[f][t] for f in crossed)] for t in trials],
+                    [source_indices[tuple(columns[f][t] for f in sources)] for t in trials],
+                    [[level_digits[columns[f][t].name] for t in trials]
+                     for (f, _), level_digits in zip(self._ind_factor_levels, ind_level_digits)],
+                    trial_count))
+                start += trial_count
+            index = combine_components(self.__run_sizes(), run_digits)
+        except (KeyError, ValueError):
+            raise ValueError("sample is not a candidate sequence for the block")
+        # Ranking considers only the factors that determine a sequence, so
+        # check the rest by converting back:
+        candidate = self.unrank(index)
+        if any(sample[name] != levels for name, levels in candidate.items() if name in sample):
+            raise ValueError("sample is not a candidate sequence for the block")
+        return index
+
+    # Limits the total number of states in the dynamic-programming tables of
+    # a `RunLengthSampler`:
+    _MAX_RUN_LENGTH_STATES = 200000
+
+    def run_length_sampler(self) -> Optional[RunLengthSampler]:
+        """Returns a sampler for the sequence of crossing instances in a run
+        that exactly satisfies the block's run-length constraints, or None if
+        the block has no run-length constraints that can be compiled. A
+        constraint can be compiled when its level belongs to a crossed factor
+        without a complex window and it spans the whole run. The sampler's
+        `count` is the number of ways to choose crossing instances and source
+        combinations for a run."""
+        if not self.__run_length_sampler_ready:
+            self.__run_length_sampler_ready = True
+            trial_count = self._block.trials_per_sample()
+            crossed = self._partitions.get_crossed_noncomplex_factors()
+            constraints = [cast(_KInARow, c) for c in self._block.constraints if RunLengthAutomaton.supports(c)]
+            constraints = [c for c in constraints
+                           if (c.level.factor in crossed
+                               and (self._block.map_block_trial_ranges(c.within_block, lambda start, end: (start, end))
+                                    == [(0, trial_count)]))]
+            if constraints and self._preamble_size == 0 and self._solution_count > 0:
+                automaton = RunLengthAutomaton(constraints,
+                                               [[ci[c.level.factor] == c.level for ci in self._crossing_instances]
+                                                for c in constraints])
+                rounds, leftover = self.__run_shape()
+                sampler = RunLengthSampler(automaton, self.__round_counters(),
+                                           [self.crossing_size] * rounds + ([leftover] if leftover > 0 else []),
+                                           self._components_shape.combinations_shapes,
+                                           self._MAX_RUN_LENGTH_STATES)
+                if sampler.count() is not None:
+                    self.__run_length_sampler = sampler
+        return self.__run_length_sampler
+
+    def run_length_sequence_count(self) -> int:
+        """The number of distinct runs produced by
+        `generate_run_length_sample`."""
+        sampler = cast(RunLengthSampler, self.run_length_sampler())
+        return reduce(op.mul,
+                      [pow(len(levels), sampler.trial_count) for _, levels in self._ind_factor_levels],
+                      cast(int, sampler.count()))
+
+    def generate_run_length_sample(self) -> Tuple[Tuple[int, ...], dict]:
+        """Draws a run using `run_length_sampler`, which must not be None,
+        and returns a key that identifies the run along with the run."""
+        sampler = cast(RunLengthSampler, self.run_length_sampler())
+        permutation_indices = sampler.sample(self._random)
+        components = [self._random.randrange(self._components_shape.combinations_shapes[p])
+                      for p in permutation_indices]
+        independent_indices = [[self._random.randrange(len(levels)) for _ in permutation_indices]
+                               for _, levels in self._ind_factor_levels]
+        trial_values = self._trial_values_from_indices(
+            permutation_indices,
+            [self._valid_source_combinations_indices[p][c] for p, c in zip(permutation_indices, components)],
+            independent_indices)
+        run = self.fill_in_nonpreamble_uncrossed_derived(self._trial_values_to_experiment(trial_values),
+                                                         sampler.trial_count)
+        key = tuple(permutation_indices + components + list(chain.from_iterable(independent_indices)))
+        return key, run
+
+    def partition(self, parts: int) -> List[range]:
+        """Splits the indices accepted by `unrank` into `parts` disjoint,
+        contiguous ranges of nearly equal size."""
+        total = self.sequence_count()
+        return [range(total * k // parts, total * (k + 1) // parts) for k in range(parts)]
+
+    def __run_shape(self) -> Tuple[int, int]:
+        # The number of full rounds and the size of the leftover round in a run
+        trials = self._block.trials_per_sample() - self._preamble_size
+        return trials // self.crossing_size, trials % self.crossing_size
+
+    def __run_sizes(self) -> List[int]:
+        rounds, leftover = self.__run_shape()
+        return ([reduce(op.mul, self.__preamble_index_radices(), 1)]
+                + [reduce(op.mul, self.__round_sizes(self.crossing_size), 1)] * rounds
+                + ([reduce(op.mul, self.__round_sizes(leftover), 1)] if leftover > 0 else []))
+
+    def __level_positions(self, f: Factor, levels: List[SimpleLevel]) -> List[int]:
+        # Ranking numbers the distinct levels of an uncrossed factor, so that
+        # the copies of a weighted level do not produce the same sequence at
+        # different indices; these are the positions in `levels` of the
+        # first copy of each distinct level
+        if f not in self.__distinct_level_positions:
+            names = [l.name for l in levels]
+            self.__distinct_level_positions[f] = [i for i, name in enumerate(names) if names.index(name) == i]
+        return self.__distinct_level_positions[f]
+
+    def __level_digits(self, f: Factor, levels: List[SimpleLevel]) -> Dict[str, int]:
+        return {levels[p].name: d for d, p in enumerate(self.__level_positions(f, levels))}
+
+    def __preamble_index_radices(self) -> List[int]:
+        # Like `__preamble_radices`, but for distinct levels
+        return [len(self.__level_positions(f, levels)) for f, levels in self._basic_factor_levels
+                for _ in range(self._preamble_size)]
+
+    def __is_simple_round(self, trial_count: int) -> bool:
+        # Whether a round is a permutation of all crossing instances, each
+        # appearing once
+        return (trial_count == len(self._crossing_instances)
+                and self.__complex_crossing_instances == 1
+                and self._crossing_is_unweighted)
+
+    def __round_counters(self) -> List[int]:
+        m = self._m_or_counters
+        return [m] * len(self._crossing_instances) if isinstance(m, int) else list(m)
+
+    def __count_round_sequences(self, counters: List[int], trial_count: int) -> int:
+        # Counts sequences of crossing instances paired with source
+        # combinations, where instance i appears at most counters[i] times
+        key = (tuple(counters), trial_count)
+        if key not in self.__round_counts:
+            self.__round_counts[key] = sum_prefix_products_of_permutations_with_copies(
+                len(self._crossing_instances), counters, trial_count, self._components_shape.combinations_shapes)
+        return self.__round_counts[key]
+
+    def __round_sizes(self, trial_count: int) -> List[int]:
+        # The number of choices for crossing instances with source
+        # combinations, followed by the number for each independent factor
+        if self.__is_simple_round(trial_count):
+            count = reduce(op.mul, self._components_shape.combinations_shapes, self._components_shape.crossings_shape)
+        else:
+            count = self.__count_round_sequences(self.__round_counters(), trial_count)
+        return [count] + [pow(len(self.__level_positions(f, levels)), trial_count)
+                          for f, levels in self._ind_factor_levels]
+
+    def __unrank_round(self, index: int, trial_count: int) -> List[dict]:
+        shapes = self._components_shape.combinations_shapes
+        valid = self._valid_source_combinations_indices
+        digits = extract_components(self.__round_sizes(trial_count), index)
+        if self.__is_simple_round(trial_count):
+            # Numbered the same as `generate_sample`
+            flat = extract_components([self._components_shape.crossings_shape] + shapes, digits[0])
+            permutation_indices = compute_jth_permutation_prefix(trial_count, trial_count, flat[0])
+            source_indices = [valid[p][flat[1 + p]] for p in permutation_indices]
+        else:
+            # Sequences are ordered by the first trial's crossing instance,
+            # then by its source combination, then by the remaining trials
+            counters = self.__round_counters()
+            rest = digits[0]
+            permutation_indices = []
+            source_indices = []
+            for n in range(trial_count, 0, -1):
+                for i in range(len(counters)):
+                    if counters[i] == 0:
+                        continue
+                    counters[i] -= 1
+                    tail = self.__count_round_sequences(counters, n - 1)
+                    if rest < shapes[i] * tail:
+                        s, rest = divmod(rest, tail)
+                        permutation_indices.append(i)
+                        source_indices.append(valid[i][s])
+                        break
+                    rest -= shapes[i] * tail
+                    counters[i] += 1
+        independent_indices = []
+        for digit, (f, levels) in zip(digits[1:], self._ind_factor_levels):
+            positions = self.__level_positions(f, levels)
+            independent_indices.append([positions[d]
+                                        for d in compute_jth_combination(trial_count, len(positions), digit)])
+        return self._trial_values_from_indices(permutation_indices, source_indices, independent_indices)
+
+    def __rank_round(self, permutation_indices: List[int], source_indices: List[int],
+                     independent_indices: List[List[int]], trial_count: int) -> int:
+        shapes = self._components_shape.combinations_shapes
+        components = [self._valid_source_combinations_indices[p].index(s)
+                      for p, s in zip(permutation_indices, source_indices)]
+        if self.__is_simple_round(trial_count):
+            components_by_instance = [0 for _ in shapes]
+            for p, c in zip(permutation_indices, components):
+                components_by_instance[p] = c
+            index = combine_components([self._components_shape.crossings_shape] + shapes,
+                                       [rank_permutation_prefix(trial_count, permutation_indices)]
+                                       + components_by_instance)
+        else:
+            counters = self.__round_counters()
+            index = 0
+            for t, (p, c) in enumerate(zip(permutation_indices, components)):
+                n = trial_count - t
+                for i in range(p):
+                    if counters[i] > 0:
+                        counters[i] -= 1
+                        index += shapes[i] * self.__count_round_sequences(counters, n - 1)
+                        counters[i] += 1
+                if counters[p] == 0:
+                    raise ValueError("crossing instance appears too many times")
+                counters[p] -= 1
+                index += c * self.__count_round_sequences(counters, n - 1)
+        return combine_components(self.__round_sizes(trial_count),
+                                  [index] + [rank_combination(len(self.__level_positions(f, levels)), combo)
+                                             for combo, (f, levels) in zip(independent_indices,
+                                                                           self._ind_factor_levels)])
+
+    def generate_random_samples(self, n: int, leftover: int, sampled: KeySet) -> Optional[List[Tuple[int, dict]]]:
+        segments = self.generate_random_segments(n, leftover, sampled)
+        if segments is None:
+            return None
+        return [(key, generate()) for key, generate in segments]
+
+    def generate_random_segments(self, n: int, leftover: int,
+                                 sampled: KeySet) -> Optional[List[Tuple[Any, Callable[[], dict]]]]:
+        """Like `generate_random_samples`, but instead of a sample for each
+        segment of the run (preamble, rounds, and leftover), returns a
+        function that generates the segment's sample, so that a caller can
+        stop generating a run that is certain to be rejected. Both return
+        None if `sampled` becomes saturated before a new sequence is
+        found."""
         # Select a collection of random numbers, each from the range of solutions.
         # If `leftover` is not zero, then tack on one more sequence that is shorter
         # than the crossing size.
-        # Then, make sure we haven't already picked the same sequence according to `sampled`.
+        # Then, make sure we haven't already picked the same sequence according to `sampled`,
+        # and add it to `sampled`.
         # This rejection-based approach is probably ok for realistic experiments,
         # where we're unlikely to want a number of samples close to the number of solutions
         # at the same time that there are a lot of solutions.
-        choice = cast(List[Any],
-                      (random.randrange(0, self._preamble_solution_count),
-                       tuple([self.random_components(self._components_shape, self.crossing_size, 0) for i in range(n)]),
-                       self.random_components(self._leftover_components_shape, leftover,
-                                              leftover) if leftover > 0 else 0))
-        while tuple([choice[0]] + list(choice[1]) + ([choice[2]] if leftover > 0 else [])) in sampled:
+        while True:
             choice = cast(List[Any],
-                          (random.randrange(0, self._preamble_solution_count),
+                          (self._random.randrange(0, self._preamble_solution_count),
                            tuple([self.random_components(self._components_shape, self.crossing_size, 0) for i in
                                   range(n)]),
                            self.random_components(self._leftover_components_shape, leftover,
                                                   leftover) if leftover > 0 else 0))
-        return ([(choice[0], self.generate_preamble_sample(choice[0]))]
-                + [(components, self.generate_sample_from_components(components)) for components in choice[1]]
+            if sampled.add(tuple([choice[0]] + list(choice[1]) + ([choice[2]] if leftover > 0 else []))):
+                break
+            if sampled.saturated():
+                return None
+        return ([(choice[0], lambda: self.generate_preamble_sample(choice[0]))]
+                + [(components, lambda components=components: self.generate_sample_from_components(components))
+                   for components in choice[1]]
                 + ([(choice[2],
-                     self.generate_leftover_sample(choice[2], leftover))] if leftover > 0 else []))
+                     lambda: self.generate_leftover_sample(choice[2], leftover))] if leftover > 0 else []))
+
+    def generate_random_codes(self, count: int, n: int, leftover: int,
+                              sampled: KeySet) -> Tuple[List[Tuple[int, ...]], np.ndarray]:
+        """Batch form of `generate_random_samples`. Selects `count` distinct
+        sequences that are not already in `sampled`, adds them to `sampled`,
+        and returns their keys along with a (samples, trials, factors) array
+        coded by `sample_coding`, with all derived factors filled in. Fewer
+        sequences are selected if `sampled` becomes saturated."""
+        coding = self.sample_coding()
+        keys = cast(List[Tuple[int, ...]], [])
+        preambles = cast(List[int], [])
+        crossings = cast(List[List[int]], [])  # a crossing instance index per non-preamble trial
+        sources = cast(List[List[int]], [])  # a source combination index per non-preamble trial
+        independents = cast(List[List[List[int]]], [])  # per independent factor, a level index per trial
+        while len(preambles) < count:
+            preamble = self._random.randrange(0, self._preamble_solution_count)
+            rounds = [self.__random_round(self._components_shape, self.crossing_size, 0, self._pmemo)
+                      for i in range(n)]
+            if leftover > 0:
+                rounds.append(self.__random_round(self._leftover_components_shape, leftover, leftover,
+                                                  self._leftover_pmemo))
+            key = tuple(cast(List[Any], [preamble]) + [r[0] for r in rounds])
+            if not sampled.add(key):
+                if sampled.saturated():
+                    break
+                continue
+            keys.append(key)
+            preambles.append(preamble)
+            crossings.append(list(chain.from_iterable([r[1] for r in rounds])))
+            sources.append(list(chain.from_iterable([r[2] for r in rounds])))
+            independents.append([list(chain.from_iterable([r[3][j] for r in rounds]))
+                                 for j in range(len(self._ind_factor_levels))])
+
+        preamble_size = self._preamble_size
+        trial_count = preamble_size + n * self.crossing_size + leftover
+        codes = coding.empty(len(keys), trial_count)
+        if not keys:
+            return keys, codes
+        if preamble_size > 0:
+            digits = extract_components_batch(self.__preamble_radices(), preambles)
+            for j, (f, levels) in enumerate(self._basic_factor_levels):
+                codes[:, :preamble_size, coding.column(f)] = (self.__level_code_array(f, levels)
+                                                              [digits[:, j * preamble_size:(j + 1) * preamble_size]])
+            coding.fill_in_derived(codes, self._sorted_derived_factors, 0, preamble_size)
+        if trial_count > preamble_size:
+            self.__fill_round_codes(codes, preamble_size, crossings, sources, independents)
+        coding.fill_in_derived(codes, self._sorted_uncrossed_derived_and_complex_derived, preamble_size, trial_count)
+        return keys, codes
+
+    def __fill_round_codes(self, codes: np.ndarray, start: int, crossings: List[List[int]], sources: List[List[int]],
+                           independents: List[List[List[int]]]) -> None:
+        # Fills in the crossed, source, and independent columns of a batch
+        # from trial `start` on, given the selected crossing instance, source
+        # combination, and (per independent factor) level for each trial
+        coding = self.sample_coding()
+        crossing_codes, source_columns, source_codes = self.__round_code_tables()
+        codes[:, start:, :] = crossing_codes[np.array(crossings, dtype=np.int64)]
+        if source_columns:
+            codes[:, start:, source_columns] = source_codes[np.array(sources, dtype=np.int64)]
+        for j, (f, levels) in enumerate(self._ind_factor_levels):
+            codes[:, start:, coding.column(f)] = (self.__level_code_array(f, levels)
+                                                  [np.array([ind[j] for ind in independents], dtype=np.int64)])
+
+    def __level_code_array(self, f: Factor, levels: List[SimpleLevel]) -> np.ndarray:
+        coding = self.sample_coding()
+        return np.array([coding.level_code(f, l) for l in levels], dtype=np.int64)
+
+    def __preamble_radices(self) -> List[int]:
+        # A preamble's sequence number has a digit for each trial of each
+        # basic factor in turn, least significant first
+        if self.__preamble_radix_list is None:
+            self.__preamble_radix_list = [len(levels) for _, levels in self._basic_factor_levels
+                                          for _ in range(self._preamble_size)]
+        return self.__preamble_radix_list
+
+    def sample_coding(self) -> SampleCoding:
+        """The coding used for batches from `generate_random_codes`, with
+        factors in the same order as in samples from
+        `generate_random_samples`."""
+        if self.__sample_coding is None:
+            if self._preamble_size > 0:
+                factors = [f for f, _ in self._basic_factor_levels] + self._sorted_derived_factors
+            else:
+                factors = (self._partitions.get_crossed_noncomplex_factors()
+                           + self._partitions.get_uncrossed_basic_source_factors()
+                           + [f for f, _ in self._ind_factor_levels])
+            factors += [f for f in self._sorted_uncrossed_derived_and_complex_derived if f not in factors]
+            self.__sample_coding = SampleCoding(factors)
+        return self.__sample_coding
+
+    def __round_code_tables(self) -> Tuple[np.ndarray, List[int], np.ndarray]:
+        # Codes for each crossing instance across all columns, and codes for
+        # each source combination across just the source-factor columns
+        if self.__round_tables is None:
+            self.__round_tables = self.__make_round_code_tables()
+        return self.__round_tables
+
+    def __make_round_code_tables(self) -> Tuple[np.ndarray, List[int], np.ndarray]:
+        coding = self.sample_coding()
+        crossing_codes = coding.empty(1, len(self._crossing_instances))[0]
+        for i, ci in enumerate(self._crossing_instances):
+            for f, l in ci.items():
+                crossing_codes[i, coding.column(f)] = coding.level_code(f, l)
+        ubs = self._partitions.get_uncrossed_basic_source_factors()
+        source_codes = np.array([[coding.level_code(f, sc[f]) for f in ubs] for sc in self._source_combinations],
+                                dtype=np.int64)
+        return crossing_codes, [coding.column(f) for f in ubs], source_codes
+
+    def __random_round(self, components_shape: RandomComponentsShape, trial_count: int, leftover: int,
+                       pmemo: PermutationMemo) -> Tuple[Components, List[int], List[int], List[List[int]]]:
+        # Like `random_components`, but also reports the selected crossing
+        # instance, source combination, and independent levels for each trial
+        components, permutation_indices = self.__random_components_and_permutation(components_shape,
+                                                                                   trial_count, leftover)
+        if permutation_indices is None:
+            permutation_indices = self.jth_permutation_indices(len(self._crossing_instances), trial_count,
+                                                               components[0], pmemo)
+        source_indices = []
+        for i, p in enumerate(permutation_indices):
+            if trial_count == len(self._crossing_instances) and self._crossing_is_unweighted:
+                component_for_p = components[1][p]
+            else:
+                component_for_p = components[1][i]
+            source_indices.append(self._valid_source_combinations_indices[p][component_for_p])
+        independent_indices = [compute_jth_combination(trial_count, len(levels), components[2][j])
+                               for j, (fi, levels) in enumerate(self._ind_factor_levels)]
+        return components, permutation_indices, source_indices, independent_indices
 
     def random_components(self, components_shape: RandomComponentsShape, trial_count: int, leftover: int) -> Components:
-        crossing_permutation_index = random.randrange(0, components_shape.crossings_shape)
+        return self.__random_components_and_permutation(components_shape, trial_count, leftover)[0]
+
+    def __random_components_and_permutation(self, components_shape: RandomComponentsShape, trial_count: int,
+                                            leftover: int) -> Tuple[Components, Optional[List[int]]]:
+        # Also returns the selected permutation, if it was needed to select the components
+        crossing_permutation_index = self._random.randrange(0, components_shape.crossings_shape)
+        permutation_indices = cast(Optional[List[int]], None)
         if trial_count == len(self._crossing_instances) and self._crossing_is_unweighted:
-            source_combination_indices = tuple([random.randrange(0, len)
+            source_combination_indices = tuple([self._random.randrange(0, len)
                                                 for len in components_shape.combinations_shapes])
         else:
             # The indicies for source combination depend on the chosen permutation
@@ -319,13 +1256,14 @@ class UCSolutionEnumerator():
                                                                self._pmemo if leftover == 0 else self._leftover_pmemo)
             indices = []
             for p in permutation_indices:
-                indices.append(random.randrange(0, components_shape.combinations_shapes[p]))
+                indices.append(self._random.randrange(0, components_shape.combinations_shapes[p]))
             source_combination_indices = tuple(indices)
-        independent_factor_combination_indices = tuple([random.randrange(0, len)
+        independent_factor_combination_indices = tuple([self._random.randrange(0, len)
                                                         for len in components_shape.independent_shapes])
-        return (crossing_permutation_index,
-                source_combination_indices,
-                independent_factor_combination_indices)
+        return ((crossing_permutation_index,
+                 source_combination_indices,
+                 independent_factor_combination_indices),
+                permutation_indices)
 
     def extract_sequence_key(self, solution_variabless: List[Tuple[int, dict]]) -> Tuple[int, ...]:
         return tuple(map(lambda sv: sv[0], solution_variabless))
@@ -347,9 +1285,31 @@ class UCSolutionEnumerator():
         return self.generate_sample_from_components(components)
 
     def generate_leftover_sample(self, components: Components, leftover: int) -> dict:
-        trial_values = self.generate_trial_values(components, leftover, len(self._crossing_instances),
-                                                  self._leftover_pmemo)
-        return self._trial_values_to_experiment(trial_values)
+        # Built in coded form as for a batch, and then decoded for just the
+        # factors that a round determines
+        coding = self.sample_coding()
+        codes = coding.empty(1, leftover)
+        permutation_indices, source_indices, independent_indices = self.__trial_indices(
+            components, leftover, len(self._crossing_instances), self._leftover_pmemo)
+        self.__fill_round_codes(codes, 0, [permutation_indices], [source_indices], [independent_indices])
+        run = cast(dict, {})
+        for f in self.__round_factors():
+            levels = coding.levels[coding.column(f)]
+            run[f] = [levels[c] for c in codes[0, :, coding.column(f)].tolist()]
+        return run
+
+    def __round_factors(self) -> List[Factor]:
+        # The factors of a round's samples, in the same order as from
+        # `_trial_values_from_indices`
+        if self.__round_factor_list is None:
+            factors = cast(List[Factor], [])
+            for f in chain(self._crossing_instances[0],
+                           self._source_combinations[0] if self._source_combinations else {},
+                           [f for f, _ in self._ind_factor_levels]):
+                if f not in factors:
+                    factors.append(f)
+            self.__round_factor_list = factors
+        return self.__round_factor_list
 
     def _trial_values_to_experiment(self, trial_values: List[dict]) -> dict:
         experiment = cast(dict, {})
@@ -394,38 +1354,43 @@ class UCSolutionEnumerator():
         #           (so some combinations may be missing).
         #    The 2nd component is a list of combination indices for independent basic factors.
 
+        return self._trial_values_from_indices(*self.__trial_indices(components, trial_count, crossing_size, pmemo))
+
+    def __trial_indices(self, components: Components, trial_count: int, crossing_size: int,
+                        pmemo: PermutationMemo) -> Tuple[List[int], List[int], List[List[int]]]:
+        # Selects a crossing instance, source combination, and independent
+        # levels for each trial, as described in `generate_trial_values`
+
         # Generate the inversion sequence for the selected permutation number.
         # Use the inversion sequence to construct the permutation.
         permutation_indices = self.jth_permutation_indices(crossing_size, trial_count, components[0], pmemo)
 
-        permutation = list(map(lambda i: self._crossing_instances[i], permutation_indices))
-
         # Generate the source combinations for the selected sequence.
-        source_combinations = cast(List[dict], [])
+        source_indices = cast(List[int], [])
         for i, p in enumerate(permutation_indices):
             if trial_count == len(self._crossing_instances) and self._crossing_is_unweighted:
                 component_for_p = components[1][p]
             else:
                 component_for_p = components[1][i]
-            source_combination_index_for_component = self._valid_source_combinations_indices[p][component_for_p]
-            source_combinations.append(self._source_combinations[source_combination_index_for_component])
+            source_indices.append(self._valid_source_combinations_indices[p][component_for_p])
 
         # Generate the combinations for independent basic factors
-        independent_factor_combinations = cast(List[dict], [{}] * trial_count)
-        if self._ind_factor_levels:
-            for j, (fi, levels) in enumerate(self._ind_factor_levels):
-                independent_combination_idx = components[2][j]
-                combo = compute_jth_combination(trial_count, len(levels), independent_combination_idx)
-                for i in range(trial_count):
-                    if not independent_factor_combinations[i]:
-                        independent_factor_combinations[i] = {fi: levels[combo[i]]}
-                        continue
-                    independent_factor_combinations[i][fi] = levels[combo[i]]
-
-        # 5. Merge the selected levels gathered so far to facilitate computing the uncrossed derived factor levels.
-        trial_values = cast(List[dict], [{}] * trial_count)
-        for t in range(trial_count):
-            trial_values[t] = {**permutation[t], **source_combinations[t], **independent_factor_combinations[t]}
+        independent_indices = [compute_jth_combination(trial_count, len(levels), components[2][j])
+                               for j, (fi, levels) in enumerate(self._ind_factor_levels)]
+
+        return permutation_indices, source_indices, independent_indices
+
+    def _trial_values_from_indices(self, permutation_indices: List[int], source_indices: List[int],
+                                   independent_indices: List[List[int]]) -> List[dict]:
+        # Merges the selected crossing instance, source combination, and
+        # independent levels for each trial to facilitate computing the
+        # uncrossed derived factor levels.
+        trial_values = cast(List[dict], [])
+        for t, (p, s) in enumerate(zip(permutation_indices, source_indices)):
+            trial_value = {**self._crossing_instances[p], **self._source_combinations[s]}
+            for (fi, levels), combo in zip(self._ind_factor_levels, independent_indices):
+                trial_value[fi] = levels[combo[t]]
+            trial_values.append(trial_value)
 
         return trial_values
 
@@ -441,31 +1406,58 @@ class UCSolutionEnumerator():
         if self._preamble_size == 0:
             assert sequence_number == 0
             return run
-        for f, levels in self._basic_factor_levels:
-            trials = []
-            for _ in range(self._preamble_size):
-                n = sequence_number % len(levels)
-                sequence_number = sequence_number // len(levels)
-                trials.append(levels[n])
-            run[f] = trials
+        # A single number is decoded faster without arrays
+        digits = extract_components(self.__preamble_radices(), sequence_number)
+        for j, (f, levels) in enumerate(self._basic_factor_levels):
+            run[f] = [levels[d] for d in digits[j * self._preamble_size:(j + 1) * self._preamble_size]]
         return self._fill_in_derived(run, self._sorted_derived_factors, 0, self._preamble_size)
 
-    def fill_in_nonpreamble_uncrossed_derived(self, run: dict, trials_per_run: int) -> dict:
-        # Note: "uncrossed" includes crossed derived that have complex windows
-        return self._fill_in_derived(run, self._sorted_uncrossed_derived_and_complex_derived, self._preamble_size,
-                                     trials_per_run)
+    def fill_in_nonpreamble_uncrossed_derived(self, run: dict, trials_per_run: int, start: int = 0) -> dict:
+        # Note: "uncrossed" includes crossed derived that have complex windows.
+        # Trials before `start` are assumed to be filled in already.
+        return self._fill_in_derived(run, self._sorted_uncrossed_derived_and_complex_derived,
+                                     max(start, self._preamble_size), trials_per_run)
 
     def _fill_in_derived(self, run: dict, sorted_factors: List[DerivedFactor], start: int, end: int) -> dict:
+        # Levels are found through the tables of the sample coding, which are
+        # indexed by the codes of a trial's window arguments, so each distinct
+        # combination of arguments has its level predicates evaluated once
+        coding = self.sample_coding()
         for df in sorted_factors:
             if start > 0:
                 trials = run[df][:start]
             else:
                 trials = []
-            for i in range(start, end):
-                if df.applies_to_trial(i + 1):
-                    trials.append(df.select_level_for_sample(i, run))
-                else:
-                    trials.append(None)
+            w = df.first_level.window
+            if df in coding.columns and all(f in coding.columns for f in w.factors):
+                levels = coding.levels[coding.column(df)]
+                table = coding.derived_table(df)
+                # Codes for trials `start - w.width + 1` through `end`, padded
+                # with no level before the first trial
+                lo = start - (w.width - 1)
+                pad = [NO_LEVEL] * max(0, -lo)
+                arg_codes = []
+                for f in w.factors:
+                    level_codes = coding.level_codes(f)
+                    arg_codes.append(pad + [(level_codes[l] if l is not None else NO_LEVEL)
+                                            for l in run[f][max(0, lo):end]])
+                # Same as `df.applies_to_trial(i + 1)`:
+                first = cast(int, w.start)
+                for i in range(start, end):
+                    if i >= first and (i - first) % w.stride == 0:
+                        key = tuple([c for f_codes in arg_codes for c in f_codes[i - start:i - start + w.width]])
+                        code = table.get(key)
+                        if code is None:
+                            code = coding.derived_level_code(df, key)
+                        trials.append(levels[code])
+                    else:
+                        trials.append(None)
+            else:
+                for i in range(start, end):
+                    if df.applies_to_trial(i + 1):
+                        trials.append(df.select_level_for_sample(i, run))
+                    else:
+                        trials.append(None)
             run[df] = trials
         return run
 
@@ -498,6 +1490,43 @@ class UCSolutionEnumerator():
         level_lists = [list(f.levels) for f in ubs]
         return [{ubs[i]: level for i, level in enumerate(levels)} for levels in product(*level_lists)]
 
+    def __source_compatibility(self) -> np.ndarray:
+        """Returns a boolean array that has a row for each crossing instance
+        and a column for each source combination, indicating whether the
+        combination is allowed with the instance. The array is computed once
+        and shared by the counts for full rounds and leftovers."""
+        if self.__compatible_sources is not None:
+            return self.__compatible_sources
+        compatible = np.ones((len(self._crossing_instances), len(self._source_combinations)), dtype=bool)
+        # Apply the derivation fn for each DF in the crossing to each crossing
+        # instance and source combination, and disallow the combination if
+        # it returns false. The "crossing" here doesn't include crossed derived
+        # factors with complex windows, though, so we can only perform this
+        # filtering for a derived factor that does not depend on a
+        # complex-window derived factor. Each predicate is evaluated once per
+        # distinct combination of its arguments, and the results are spread
+        # across instances and combinations that share those arguments.
+        for df in self._partitions.get_crossed_noncomplex_derived_factors():
+            if df.has_complex_window:
+                continue
+            factors = df.first_level.window.factors
+            ci_keys = [(ci[df],) + tuple([ci.get(f) for f in factors]) for ci in self._crossing_instances]
+            sc_keys = [tuple([sc.get(f) for f in factors]) for sc in self._source_combinations]
+            ci_unique = list(dict.fromkeys(ci_keys))
+            sc_unique = list(dict.fromkeys(sc_keys))
+            table = np.empty((len(ci_unique), len(sc_unique)), dtype=bool)
+            for i, (level, *ci_args) in enumerate(ci_unique):
+                w = level.window
+                for j, sc_args in enumerate(sc_unique):
+                    table[i, j] = w.predicate(*[cast(Level, ci_arg if ci_arg is not None else sc_arg).name
+                                                for ci_arg, sc_arg in zip(ci_args, sc_args)])
+            ci_index = {key: i for i, key in enumerate(ci_unique)}
+            sc_index = {key: j for j, key in enumerate(sc_unique)}
+            compatible &= table[np.array([ci_index[key] for key in ci_keys], dtype=np.int64)[:, None],
+                                np.array([sc_index[key] for key in sc_keys], dtype=np.int64)[None, :]]
+        self.__compatible_sources = compatible
+        return compatible
+
     def __count_solutions(self,
                           first_n: int,
                           components_shape: RandomComponentsShape,
@@ -550,26 +1579,11 @@ class UCSolutionEnumerator():
         # completions with uncrossed basic factors. We consider derived
         # factors only in the way that they limit completions via
         # uncrossed basic factors.
-        level_combinations = self.__generate_source_combinations()
+        compatible = self.__source_compatibility()
 
         # Keep only allowed combos for each permutation
-        for ci in self._crossing_instances:
-            sc_indices = list(range(len(self._source_combinations)))
-            for sc_idx, sc in enumerate(self._source_combinations):
-                # Apply the derivation fn for each DF in the crossing for this instance and make sure it
-                # return true for this level combination. If it doesn't, then remove this combination.
-                # The "crossing" here doesn't include crossed derived factors with complex windows,
-                # though, so we can only perform this filtering for a derived factor that does
-                # not depend on a complex-window derived factor.
-                merged_levels = {**ci, **sc}
-                for df in self._partitions.get_crossed_noncomplex_derived_factors():
-                    # Not yet separating complex:
-                    # assert not df.has_complex_window
-                    if not df.has_complex_window:
-                        w = merged_levels[df].window
-                        if not w.predicate(*[(merged_levels[f]).name for f in w.factors]):
-                            sc_indices.remove(sc_idx)
-
+        for row in compatible:
+            sc_indices = np.flatnonzero(row).tolist()
             components_shape.combinations_shapes.append(len(sc_indices))
             if isinstance(valid_source_combinations_indices, list):
                 valid_source_combinations_indices.append(sc_indices)
@@ -626,17 +1640,7 @@ class UCSolutionEnumerator():
             return solution_count * pow(shapes[0], first_n)
         else:
             # Need to sum over the `solution_count` possible ways of picking `first_n` combinations,
-            # getting the product of options across trials for each combination. Iterating over all
-            # permutations is the slow way around, since the order within the permutation doesn't
-            # matter (and we end up ignoring `_m_or_counters`), so there's room for improvement here:
-            s = 0
-            crossing_size = len(self._crossing_instances)
-            for i in range(0, solution_count):
-                permutation = compute_jth_prefix_of_permutations_with_copies(crossing_size, m_or_counters, first_n, i,
-                                                                             pmemo)
-                prod = 1
-                for p in permutation:
-                    prod *= shapes[p]
-                s += prod
-            return s
-
+            # getting the product of options across trials for each combination. The order within
+            # a permutation doesn't matter, so sum over allocations of trials to combinations:
+            return sum_prefix_products_of_permutations_with_copies(len(self._crossing_instances), m_or_counters,
+                                                                   first_n, shapes)
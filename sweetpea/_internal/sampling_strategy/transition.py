@@ -0,0 +1,518 @@
+import random
+
+from itertools import product
+from math import ceil, comb
+from typing import Any, Dict, Iterator, List, Optional, Tuple, cast
+
+from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget, BudgetMeter
+from sweetpea._internal.checkpoint import Checkpoint
+from sweetpea._internal.cross_block import CrossBlock
+from sweetpea._internal.constraint import (
+    Consistency, Cross, Derivation, Reify, MinimumTrials, Exclude, Pin,
+    _KInARow, AtMostKInARow, AtLeastKInARow, ExactlyKInARow
+)
+from sweetpea._internal.design_partition import DesignPartitions
+from sweetpea._internal.key_set import HashedKeySet
+from sweetpea._internal.primitive import Factor, DerivedFactor, Level, SimpleLevel
+from sweetpea._internal.run_automaton import RunLengthAutomaton
+from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
+from sweetpea._internal.weight import combination_weight
+
+
+"""
+This strategy samples uniformly and exactly, without rejection or a SAT
+solver, for designs whose derived factors look back at most one trial, such
+as factors defined with :class:`.Transition`. It treats a sequence of trials
+as a Markov chain whose state is the previous trial's levels for factors used
+in transitions, the multiset of crossing combinations remaining in the
+current round, and the run lengths for k-in-a-row constraints, and it counts
+sequences with a dynamic-programming table over those states.
+
+Crossing combinations that are indistinguishable to everything except the
+crossing (for example, because they differ only in factors that are not
+used by any transition or constraint) are counted together, which keeps the
+number of states manageable for typical designs.
+
+When the table for a design would be too large, the strategy counts the
+sequences without k-in-a-row constraints, and without tracking transitions
+that only those constraints use, and it rejects sampled sequences that do
+not satisfy the constraints. Since rejection keeps the accepted sequences
+uniformly distributed, sampling is still exact, but it can take many
+candidates if the constraints reject most sequences.
+"""
+class TransitionGen(Gen):
+
+    # Limits the total number of states in the counting table
+    _MAX_STATES = 100000
+
+    def __init__(self, seed=None):
+        self.seed = seed
+
+    def __str__(self):
+        return TransitionGen.class_name()
+
+    @staticmethod
+    def class_name():
+        return 'TransitionGen'
+
+    @staticmethod
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        return TransitionGen.__sample(block, sample_count, None, budget)
+
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None) -> Iterator[dict]:
+        return TransitionGen.__sample_iter(block, sample_count, None, checkpoint, budget)
+
+    def sample_object(self, block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        return TransitionGen.__sample(block, sample_count, self.seed, budget)
+
+    def sample_object_iter(self, block: Block, sample_count: int,
+                           checkpoint: Optional[Checkpoint] = None,
+                           budget: Optional[Budget] = None) -> Iterator[dict]:
+        return TransitionGen.__sample_iter(block, sample_count, self.seed, checkpoint, budget)
+
+    @staticmethod
+    def __sample(block: Block, sample_count: int, seed: Optional[int],
+                 budget: Optional[Budget]) -> SamplingResult:
+        if block.show_errors():
+            return SamplingResult([], {})
+        return TransitionGen.sample_model(TransitionGen.__checked_model(block), sample_count, budget,
+                                          TransitionGen.__random(seed))
+
+    @staticmethod
+    def __sample_iter(block: Block, sample_count: int, seed: Optional[int],
+                      checkpoint: Optional[Checkpoint], budget: Optional[Budget]) -> Iterator[dict]:
+        Gen._check_no_checkpoint(TransitionGen.class_name(), checkpoint)
+        if block.show_errors():
+            return iter([])
+        return TransitionGen.sample_model_iter(TransitionGen.__checked_model(block), sample_count, budget,
+                                               TransitionGen.__random(seed))
+
+    @staticmethod
+    def __random(seed: Optional[int]) -> Any:
+        # Without a seed, choices are drawn from the global random stream
+        return random.Random(seed) if seed is not None else random
+
+    @staticmethod
+    def __checked_model(block: Block) -> 'TransitionModel':
+        reason = TransitionModel.unsupported_reason(block)
+        if reason is not None:
+            raise RuntimeError(f"TransitionGen: {reason}")
+        model = TransitionGen.model(block, allow_rejection=True)
+        if model is None:
+            raise RuntimeError("TransitionGen: the design needs more than "
+                               f"{TransitionGen._MAX_STATES} counting states")
+        return model
+
+    @staticmethod
+    def model(block: Block, allow_rejection: bool = False) -> Optional['TransitionModel']:
+        """Returns a counting model for `block` if this strategy can sample
+        it, including that the model stays within the size limit, or None
+        otherwise. When `allow_rejection` is true and the exact model is too
+        large, the result can be a model that leaves k-in-a-row constraints
+        to rejection."""
+        if any("WARNING" not in e for e in block.errors):
+            return None
+        if TransitionModel.unsupported_reason(block) is not None:
+            return None
+        model = TransitionModel(cast(CrossBlock, block), TransitionGen._MAX_STATES)
+        if model.count() is None and allow_rejection and model.run_constraints:
+            model = TransitionModel(cast(CrossBlock, block), TransitionGen._MAX_STATES, relax_runs=True)
+        if model.count() is None:
+            return None
+        return model
+
+    @staticmethod
+    def sample_model(model: 'TransitionModel', sample_count: int,
+                     budget: Optional[Budget] = None, rng: Any = random) -> SamplingResult:
+        """Samples from `model` using `rng`, which defaults to the global
+        random stream."""
+        metrics = cast(Dict[str, Any], {})
+        meter = BudgetMeter(budget)
+        samples = list(TransitionGen.__sample_model_iter(model, sample_count, meter, rng, metrics))
+        meter.record(metrics, len(samples), sample_count)
+        return SamplingResult(samples, metrics)
+
+    @staticmethod
+    def sample_model_iter(model: 'TransitionModel', sample_count: int,
+                          budget: Optional[Budget] = None, rng: Any = random) -> Iterator[dict]:
+        """Like :func:`sample_model`, but yields each sample as it is
+        drawn."""
+        return TransitionGen.__sample_model_iter(model, sample_count, BudgetMeter(budget), rng, {})
+
+    @staticmethod
+    def __sample_model_iter(model: 'TransitionModel', sample_count: int, meter: BudgetMeter, rng: Any,
+                            metrics: Dict[str, Any]) -> Iterator[dict]:
+        # Rejected candidates are remembered along with accepted ones, so
+        # sampling stops when every candidate has been drawn
+        count = cast(int, model.count())
+        if model.rejected_constraints:
+            metrics['candidate_count'] = count
+            metrics['total_rejected'] = 0
+        else:
+            metrics['solution_count'] = count
+        used_keys = HashedKeySet()
+        sampled = 0
+        while sampled < sample_count and len(used_keys) < count and not meter.exhausted():
+            key, sample = model.sample(rng)
+            meter.spend_candidates(1)
+            if used_keys.add(key):
+                if sample is None:
+                    metrics['total_rejected'] += 1
+                else:
+                    sampled += 1
+                    yield sample
+
+
+# A counting state is the previous trial's signature (or -1 before the first
+# trial), the remaining-count vector for each group of crossing combinations,
+# and the run lengths for k-in-a-row constraints
+State = Tuple[int, Tuple[Tuple[int, ...], ...], Tuple[int, ...]]
+
+# A choice of a successor state is a lumped class, a group of crossing
+# combinations (or -1), the remaining count of the selected combination, and
+# the pair of trial signatures' derived levels, along with the number of ways
+# to make the choice
+Choice = Tuple[int, int, int, int, int, State]
+
+
+class TransitionModel():
+    """Counts and samples the trial sequences for a block whose derived
+    factors look back at most one trial.
+
+    When `relax_runs` is true, k-in-a-row constraints are left out of the
+    counting states, and they are checked on each sampled sequence,
+    instead. The count is then of candidate sequences, and `sample` returns
+    None in place of a candidate that does not satisfy the constraints."""
+
+    _STRUCTURAL_CONSTRAINTS = (Consistency, Cross, Derivation, Reify, MinimumTrials, Exclude, Pin,
+                               AtMostKInARow, AtLeastKInARow, ExactlyKInARow)
+
+    @staticmethod
+    def unsupported_reason(block: Block) -> Optional[str]:
+        """Returns a reason that the block cannot be modeled, or None."""
+        if not isinstance(block, CrossBlock) or len(block.crossings) != 1:
+            return "requires a block with a single crossing"
+        for c in block.constraints:
+            if not isinstance(c, TransitionModel._STRUCTURAL_CONSTRAINTS):
+                return f"unsupported constraint {c.__class__.__name__}"
+            if getattr(c, 'within_block', False) and not isinstance(c, Pin):
+                return "unsupported within-block constraint"
+        pair_factors = []
+        for f in DesignPartitions(block).get_derived_factors():
+            w = f.first_level.window
+            if w.width > 2 or w.stride != 1 or w.start != w.width - 1:
+                return f"derived factor {f.name} looks back more than one trial"
+            if w.width == 2:
+                pair_factors.append(f)
+        for f in DesignPartitions(block).get_derived_factors():
+            if any(arg in pair_factors for arg in f.first_level.window.factors):
+                return f"derived factor {f.name} depends on a transition"
+        return None
+
+    def __init__(self, block: CrossBlock, max_states: int, relax_runs: bool = False) -> None:
+        self.block = block
+        partitions = DesignPartitions(block)
+        basic = partitions.get_basic_factors()
+        derived = partitions.get_derived_factors()
+        derived.sort(key=lambda f: f._get_depth())
+        self.factors = basic + derived
+        within = [f for f in derived if f.first_level.window.width == 1]
+        crossing = block.crossings[0]
+
+        run_constraints = [cast(_KInARow, c) for c in block.constraints if RunLengthAutomaton.supports(c)]
+        self.run_constraints = [] if relax_runs else run_constraints
+        self.rejected_constraints = run_constraints if relax_runs else []
+        pins = [cast(Pin, c) for c in block.constraints if isinstance(c, Pin)]
+        excluded = [(f, l) for f, l in block.exclude]
+
+        # Transitions are tracked in counting states when anything other
+        # than a rejected constraint depends on them; others are computed
+        # for each sample from the levels of its trials
+        tracked = (list(crossing) + [c.level.factor for c in self.run_constraints]
+                   + [p.factor for p in pins] + [f for f, _ in excluded])
+        pair_factors = [f for f in derived if f.first_level.window.width == 2]
+        self.pair_factors = [f for f in pair_factors if not relax_runs or f in tracked]
+        self.__computed_pair_factors = [f for f in pair_factors if f not in self.pair_factors]
+        history = cast(List[Factor], [])
+        for f in self.pair_factors:
+            for arg in f.first_level.window.factors:
+                if arg not in history:
+                    history.append(arg)
+
+        self.trial_count = block.trials_per_sample()
+        self.preamble_size = block.preamble_size(crossing)
+        c_weight = block.crossing_weight(crossing)
+        self.round_size = block.crossing_size(crossing) * c_weight
+        within_crossing = [f for f in crossing if f not in self.pair_factors]
+        pair_crossing = [f for f in crossing if f in self.pair_factors]
+
+        # Observed factors are the ones whose levels matter beyond the
+        # crossing: the history for transitions and constrained factors
+        observed = list(history)
+        for f in [c.level.factor for c in self.run_constraints] + [p.factor for p in pins]:
+            if f not in observed and f not in self.pair_factors:
+                observed.append(f)
+
+        # Options are complete assignments of levels for a single trial
+        options = cast(List[Dict[Factor, Level]], [])
+        for levels in product(*[[l for l in f.levels if not block.is_excluded_combination({f: l})] for f in basic]):
+            if block.is_excluded_combination(dict(zip(basic, levels))):
+                continue
+            values = {f: [l] for f, l in zip(basic, levels)}
+            for df in within:
+                values[df] = [df.select_level_for_sample(0, values)]
+            if any(f in values and values[f][0] == l for f, l in excluded):
+                continue
+            options.append({f: ls[0] for f, ls in values.items()})
+        self.options = options
+
+        # Group options by their levels for crossed and observed factors
+        observed_ids = cast(Dict[Tuple[Level, ...], int], {})
+        classes = cast(Dict[Tuple[Tuple[Level, ...], int], List[int]], {})
+        for i, o in enumerate(options):
+            observed_key = tuple(o[f] for f in observed)
+            obs_id = observed_ids.setdefault(observed_key, len(observed_ids))
+            classes.setdefault((tuple(o[f] for f in within_crossing), obs_id), []).append(i)
+        observed_levels = list(observed_ids.keys())
+        signature_ids = cast(Dict[Tuple[Level, ...], int], {})
+        signature_of_observed = [signature_ids.setdefault(key[:len(history)], len(signature_ids))
+                                 for key in observed_levels]
+        signatures = list(signature_ids.keys())
+
+        # Required crossing combinations, each split into its within-trial
+        # and transition parts
+        required = cast(Dict[Tuple[Level, ...], Dict[Tuple[Level, ...], int]], {})
+        total_weight = 0
+        for levels in product(*[list(f.levels) for f in crossing]):
+            combo = dict(zip(crossing, levels))
+            if block.is_excluded_or_inconsistent_combination(cast(Dict[Factor, SimpleLevel], combo)):
+                continue
+            weight = combination_weight(levels) * c_weight
+            total_weight += weight
+            required.setdefault(tuple(combo[f] for f in within_crossing), {})[
+                tuple(combo[f] for f in pair_crossing)] = weight
+        self.__consistent = (total_weight == self.round_size)
+
+        # Within-trial crossing parts are interchangeable when they have the
+        # same options for observed factors and the same required transition
+        # parts with the same weights; each such set is a profile
+        within_parts = sorted(set([wpart for wpart, _ in classes.keys()] + list(required.keys())),
+                              key=lambda wpart: [str(l) for l in wpart])
+        profile_ids = cast(Dict[Any, int], {})
+        self.members = cast(List[List[Tuple[Level, ...]]], [])
+        profile_of = cast(Dict[Tuple[Level, ...], int], {})
+        for wpart in within_parts:
+            obs_counts = tuple(sorted((obs_id, len(classes[(wpart, obs_id)]))
+                                      for obs_id in range(len(observed_levels)) if (wpart, obs_id) in classes))
+            pparts = frozenset(required.get(wpart, {}).items())
+            pid = profile_ids.setdefault((obs_counts, pparts), len(profile_ids))
+            if pid == len(self.members):
+                self.members.append([])
+            self.members[pid].append(wpart)
+            profile_of[wpart] = pid
+        self.classes = classes
+
+        # Lumped classes: a profile with an observed assignment
+        self.lumped = cast(List[Tuple[int, int, int, int]], [])  # profile, observed id, multiplicity, signature
+        for pid, wparts in enumerate(self.members):
+            for obs_id in range(len(observed_levels)):
+                if (wparts[0], obs_id) in classes:
+                    self.lumped.append((pid, obs_id, len(classes[(wparts[0], obs_id)]),
+                                        signature_of_observed[obs_id]))
+
+        # Transition levels for each pair of signatures; the extra pair at
+        # index `none_pair` is for the first trial
+        self.pair_levels = cast(List[Tuple[Optional[Level], ...]], [])
+        pair_ids = cast(Dict[Tuple[Optional[Level], ...], int], {})
+        self.pair_table = cast(List[List[Optional[int]]], [])
+        for prev in signatures:
+            row = cast(List[Optional[int]], [])
+            for cur in signatures:
+                values = {f: [p, c] for f, p, c in zip(history, prev, cur)}
+                levels = tuple(df.select_level_for_sample(1, values) for df in self.pair_factors)
+                if any(df == f and l == el for df, l in zip(self.pair_factors, levels) for f, el in excluded):
+                    row.append(None)
+                else:
+                    row.append(pair_ids.setdefault(levels, len(pair_ids)))
+            self.pair_table.append(row)
+        self.pair_levels = list(pair_ids.keys())
+        self.none_pair = len(self.pair_levels)
+        self.pair_levels.append(tuple(None for _ in self.pair_factors))
+        pair_crossing_positions = [self.pair_factors.index(f) for f in pair_crossing]
+
+        # Groups of interchangeable crossing combinations
+        group_ids = cast(Dict[Tuple[int, Tuple[Optional[Level], ...]], int], {})
+        self.group_weights = cast(List[int], [])
+        self.group_members = cast(List[int], [])
+        for pid, wparts in enumerate(self.members):
+            for ppart, weight in required.get(wparts[0], {}).items():
+                group_ids[(pid, ppart)] = len(self.group_weights)
+                self.group_weights.append(weight)
+                self.group_members.append(pid)
+        self.group_of = cast(List[List[int]], [])  # by lumped class and pair, or -1
+        for pid, _, _, _ in self.lumped:
+            self.group_of.append([group_ids.get((pid, tuple(pair[p] for p in pair_crossing_positions)), -1)
+                                  for pair in self.pair_levels])
+        self.initial_groups = tuple(tuple(len(self.members[pid]) if j == w else 0 for j in range(w + 1))
+                                    for w, pid in zip(self.group_weights, self.group_members))
+
+        # Run-length constraints and pins observe a lumped class with a pair
+        def level_of(lumped: int, pair: int, f: Factor) -> Optional[Level]:
+            if f in self.pair_factors:
+                return self.pair_levels[pair][self.pair_factors.index(f)]
+            return observed_levels[self.lumped[lumped][1]][observed.index(f)]
+
+        kinds = [(i, p) for i in range(len(self.lumped)) for p in range(len(self.pair_levels))]
+        self.automaton = RunLengthAutomaton(self.run_constraints,
+                                            [[level_of(i, p, c.level.factor) == c.level for i, p in kinds]
+                                             for c in self.run_constraints])
+        self.pins = cast(Dict[int, List[Tuple[Factor, Level]]], {})
+        self.__pins_satisfiable = True
+        for pin in pins:
+            trial_nos = block.get_trial_numbers(pin.index, pin.within_block)
+            if not trial_nos:
+                self.__pins_satisfiable = False
+            for t in trial_nos:
+                self.pins.setdefault(t, []).append((pin.factor, pin.level))
+        self.__level_of = level_of
+        self.__observed = observed
+
+        self.__completions = self.__count_completions(max_states)
+
+    def count(self) -> Optional[int]:
+        """The number of trial sequences, or None if the counting table would
+        be too large."""
+        if self.__completions is None:
+            return None
+        return self.__completions[0].get(self.__start(), 0)
+
+    def sample(self, rng: Any) -> Tuple[Tuple[int, ...], Optional[dict]]:
+        """Returns a uniformly chosen trial sequence, mapping factor names to
+        lists of level names, along with a key that identifies it. The
+        sequence is None if it does not satisfy a rejected constraint."""
+        completions = cast(List[Dict[State, int]], self.__completions)
+        state = self.__start()
+        remaining = cast(List[List[int]], [])
+        chosen = cast(List[int], [])
+        pairs = cast(List[int], [])
+        for t in range(self.trial_count):
+            if self.__starts_round(t):
+                remaining = [[w for _ in self.members[pid]] for w, pid in zip(self.group_weights, self.group_members)]
+            choice = rng.randrange(completions[t][state])
+            for lumped, group, j, pair, ways, next_state in self.__successors(t, state):
+                n = ways * completions[t + 1].get(next_state, 0)
+                if choice < n:
+                    break
+                choice -= n
+            pid, obs_id, _, _ = self.lumped[lumped]
+            if group >= 0:
+                # Pick a specific combination with `j` remaining uses
+                candidates = [k for k, r in enumerate(remaining[group]) if r == j]
+                member = candidates[rng.randrange(len(candidates))]
+                remaining[group][member] -= 1
+            else:
+                member = rng.randrange(len(self.members[pid]))
+            options = self.classes[(self.members[pid][member], obs_id)]
+            chosen.append(options[rng.randrange(len(options))])
+            pairs.append(pair)
+            state = next_state
+
+        run = cast(Dict[Factor, List[Optional[Level]]], {})
+        for f in self.factors:
+            if f in self.pair_factors:
+                p = self.pair_factors.index(f)
+                run[f] = [self.pair_levels[pair][p] for pair in pairs]
+            elif f in self.__computed_pair_factors:
+                values = {arg: run[arg] for arg in f.first_level.window.factors}
+                run[f] = [None] + [f.select_level_for_sample(t, values) for t in range(1, self.trial_count)]
+            else:
+                run[f] = [self.options[o][f] for o in chosen]
+        if not all(c.potential_sample_conforms(run, self.block) for c in self.rejected_constraints):
+            return tuple(chosen), None
+        return tuple(chosen), {f.name: [(l.name if l is not None else "") for l in levels]
+                               for f, levels in run.items()}
+
+    def __start(self) -> State:
+        return (-1, self.initial_groups, self.automaton.start())
+
+    def __starts_round(self, t: int) -> bool:
+        return t >= self.preamble_size and (t - self.preamble_size) % self.round_size == 0
+
+    def __successors(self, t: int, state: State) -> List[Choice]:
+        prev, groups, runs = state
+        if self.__starts_round(t):
+            groups = self.initial_groups
+        successors = cast(List[Choice], [])
+        for i, (pid, obs_id, multiplicity, signature) in enumerate(self.lumped):
+            pair = self.none_pair if prev < 0 else self.pair_table[prev][signature]
+            if pair is None:
+                continue
+            if any(self.__level_of(i, pair, f) != l for f, l in self.pins.get(t, [])):
+                continue
+            new_runs = self.automaton.step(runs, i * len(self.pair_levels) + pair)
+            if new_runs is None:
+                continue
+            if t < self.preamble_size:
+                successors.append((i, -1, 0, pair, multiplicity * len(self.members[pid]),
+                                   (signature, groups, new_runs)))
+                continue
+            group = self.group_of[i][pair]
+            if group < 0:
+                continue
+            counts = groups[group]
+            for j in range(1, len(counts)):
+                if counts[j] > 0:
+                    new_counts = list(counts)
+                    new_counts[j] -= 1
+                    new_counts[j - 1] += 1
+                    new_groups = groups[:group] + (tuple(new_counts),) + groups[group + 1:]
+                    successors.append((i, group, j, pair, multiplicity * counts[j],
+                                       (signature, new_groups, new_runs)))
+        return successors
+
+    def __estimate_states(self) -> int:
+        # Every vector of remaining counts for the groups can be reached in
+        # each round, and each factor with k-in-a-row constraints multiplies
+        # that by the run lengths that it can have. Previous trials are
+        # not counted, so this is only an estimate, but it is cheap enough
+        # to skip building a table that would clearly be too large.
+        vectors = 1
+        for w, pid in zip(self.group_weights, self.group_members):
+            vectors *= comb(len(self.members[pid]) + w, w)
+        run_lengths = cast(Dict[Factor, int], {})
+        for c in self.run_constraints:
+            run_lengths[c.level.factor] = run_lengths.get(c.level.factor, 1) + c.k
+        rounds = ceil((self.trial_count - self.preamble_size) / self.round_size) if self.round_size > 0 else 0
+        estimate = rounds * vectors
+        for n in run_lengths.values():
+            estimate *= n
+        return estimate
+
+    def __count_completions(self, max_states: int) -> Optional[List[Dict[State, int]]]:
+        # Find the states reachable at each position, then count the
+        # completions from each state, starting at the end
+        layers = [{self.__start(): 0}]
+        if not self.__consistent or not self.__pins_satisfiable:
+            return layers
+        if self.__estimate_states() > max_states:
+            return None
+        total = 1
+        for t in range(self.trial_count):
+            layer = cast(Dict[State, int], {})
+            for state in layers[t]:
+                for choice in self.__successors(t, state):
+                    layer[choice[5]] = 0
+            total += len(layer)
+            if total > max_states:
+                return None
+            layers.append(layer)
+        for state in layers[self.trial_count]:
+            layers[self.trial_count][state] = 1 if self.automaton.accepts(state[2]) else 0
+        for t in range(self.trial_count - 1, -1, -1):
+            for state in layers[t]:
+                layers[t][state] = sum(choice[4] * layers[t + 1][choice[5]]
+                                       for choice in self.__successors(t, state))
+        return layers
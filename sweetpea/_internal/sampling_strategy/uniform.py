@@ -1,7 +1,12 @@
+from typing import Iterator, Optional
+
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget
+from sweetpea._internal.checkpoint import Checkpoint
 from sweetpea._internal.sampling_strategy.unigen import UniGen
 from sweetpea._internal.sampling_strategy.random import RandomGen
+from sweetpea._internal.sampling_strategy.transition import TransitionGen
 
 """
 This represents a uniform sampling strategy where a specific strategy
@@ -15,8 +20,23 @@ class UniformGen(Gen):
         return 'UniformGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int) -> SamplingResult:
+    def sample(block: Block, sample_count: int, budget: Optional[Budget] = None) -> SamplingResult:
+        if block.complex_factors_or_constraints:
+            model = TransitionGen.model(block)
+            if model is not None:
+                return TransitionGen.sample_model(model, sample_count, budget)
+            return UniGen.sample(block, sample_count, budget=budget)
+        else:
+            return RandomGen.sample(block, sample_count, budget)
+
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None) -> Iterator[dict]:
         if block.complex_factors_or_constraints:
-            return UniGen.sample(block, sample_count)
+            model = TransitionGen.model(block)
+            if model is not None:
+                Gen._check_no_checkpoint(UniformGen.class_name(), checkpoint)
+                return TransitionGen.sample_model_iter(model, sample_count, budget)
+            return UniGen.sample_iter(block, sample_count, checkpoint, budget)
         else:
-            return RandomGen.sample(block, sample_count)
+            return RandomGen.sample_iter(block, sample_count, checkpoint, budget)
@@ -2,10 +2,12 @@ from math import ceil, log
 from tqdm import tqdm
 import sys
 
-from typing import List, cast
+from typing import Iterator, List, Optional, cast
 
 from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
 from sweetpea._internal.block import Block
+from sweetpea._internal.budget import Budget, BudgetMeter
+from sweetpea._internal.checkpoint import Checkpoint
 from sweetpea._internal.core import sample_uniform, CNF
 
 """
@@ -13,25 +15,73 @@ This strategy relies UniGen to sample uniformly from possible solutions.
 """
 class UniGen(Gen):
 
+    # The default number of samples that `sample_iter` requests from the
+    # solver in each run
+    _ITER_BATCH_SIZE = 100
+
     @staticmethod
     def class_name():
         return 'UniGen'
 
     @staticmethod
-    def sample(block: Block, sample_count: int, min_search: bool=False, use_cmsgen=False) -> SamplingResult:
+    def sample(block: Block, sample_count: int, min_search: bool=False, use_cmsgen=False,
+               budget: Optional[Budget] = None) -> SamplingResult:
 
         backend_request = block.build_backend_request()
         if block.show_errors():
             return SamplingResult([], {})
 
+        meter = BudgetMeter(budget)
+        samples = UniGen.__sample_request(block, backend_request, CNF(backend_request.get_cnfs_as_json()),
+                                          sample_count, use_cmsgen, meter)
+        metrics = cast(dict, {})
+        meter.record(metrics, len(samples), sample_count)
+        return SamplingResult(samples, metrics)
+
+    @staticmethod
+    def sample_iter(block: Block, sample_count: int, checkpoint: Optional[Checkpoint] = None,
+                    budget: Optional[Budget] = None, use_cmsgen=False,
+                    batch_size: Optional[int] = None) -> Iterator[dict]:
+        """Yields samples in batches of `batch_size`, which defaults to
+        `_ITER_BATCH_SIZE`. The solver reports samples only when a run
+        finishes, so each batch is a separate run of the solver, and each
+        run pays again to start the solver on the design's formula. A
+        `batch_size` of at least `sample_count` uses a single run, as
+        `sample` does, so samples are yielded only when all are found."""
+        Gen._check_no_checkpoint('CMSGen' if use_cmsgen else UniGen.class_name(), checkpoint)
+        backend_request = block.build_backend_request()
+        if block.show_errors():
+            return
+
+        if batch_size is None:
+            batch_size = UniGen._ITER_BATCH_SIZE
+        if batch_size < 1:
+            raise ValueError(f"UniGen batch size must be at least 1; got {batch_size}.")
+        meter = BudgetMeter(budget)
+        # The formula is built once for all runs
+        cnf = CNF(backend_request.get_cnfs_as_json())
+        while sample_count > 0:
+            batch = UniGen.__sample_request(block, backend_request, cnf, min(sample_count, batch_size),
+                                            use_cmsgen, meter)
+            if not batch:
+                return
+            yield from batch
+            sample_count -= len(batch)
+
+    @staticmethod
+    def __sample_request(block: Block, backend_request, cnf: CNF, sample_count: int, use_cmsgen: bool,
+                         meter: BudgetMeter) -> List[dict]:
+        # A request asks for no more samples than the candidate budget allows
+        sample_count = meter.remaining_candidates(sample_count)
+        if not meter.start_solver_call(sample_count):
+            return []
         solutions = sample_uniform(
             sample_count,
-            CNF(backend_request.get_cnfs_as_json()),
+            cnf,
             backend_request.fresh - 1,
             block.variables_per_sample(),
             backend_request.get_requests_as_generation_requests(),
             use_docker=False,
             use_cmsgen=use_cmsgen)
 
-        result = list(map(lambda s: Gen.decode(block, s.assignment), solutions))
-        return SamplingResult(result, {})
+        return list(map(lambda s: Gen.decode(block, s.assignment), solutions))
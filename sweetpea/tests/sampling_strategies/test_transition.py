@@ -0,0 +1,114 @@
+import operator as op
+import pytest
+import random
+
+from itertools import product
+
+from sweetpea import CrossBlock, MultiCrossBlock, MinimumTrials, Pin, sample_mismatch_experiment
+from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial, Transition, Window
+from sweetpea._internal.constraint import AtMostKInARow, ExactlyKInARow
+from sweetpea._internal.sampling_strategy.transition import TransitionGen, TransitionModel
+
+
+color = Factor("color", ["red", "blue"])
+size  = Factor("size",  ["small", "large"])
+color_repeats = Factor("color repeats?", [
+    DerivedLevel("yes", Transition(lambda colors: colors[0] == colors[-1], [color])),
+    DerivedLevel("no",  Transition(lambda colors: colors[0] != colors[-1], [color]))
+])
+big_red = Factor("big red?", [
+    DerivedLevel("yes", WithinTrial(lambda c, s: c == "red" and s == "large", [color, size])),
+    DerivedLevel("no",  WithinTrial(lambda c, s: not (c == "red" and s == "large"), [color, size]))
+])
+
+
+def count_valid_sequences(block):
+    # Brute force over every choice of basic levels for every trial
+    trial_count = block.trials_per_sample()
+    basic = [color, size]
+    derived = [f for f in block.act_design if f not in basic]
+    count = 0
+    for levels in product(product(*[f.levels for f in basic]), repeat=trial_count):
+        sample = {f: [trial[i] for trial in levels] for i, f in enumerate(basic)}
+        for df in derived:
+            sample[df] = [(df.select_level_for_sample(t, sample) if df.applies_to_trial(t + 1) else None)
+                          for t in range(trial_count)]
+        names = {f.name: [(l.name if l is not None else "") for l in ls] for f, ls in sample.items()}
+        if not sample_mismatch_experiment(block, names):
+            count += 1
+    return count
+
+
+@pytest.mark.parametrize('design, crossing, constraints', [
+    [[color, size, color_repeats], [color, color_repeats], []],
+    [[color, size, color_repeats], [color, color_repeats], [Pin(0, (color, "red")), Pin(-1, (color_repeats, "no"))]],
+    [[color, size, color_repeats, big_red], [color_repeats], [ExactlyKInARow(2, (big_red, "no")), MinimumTrials(5)]],
+    [[color, size, color_repeats], [size], [AtMostKInARow(1, (color_repeats, "yes")), MinimumTrials(5)]]
+])
+def test_transition_model_counts_valid_sequences(design, crossing, constraints):
+    block = CrossBlock(design, crossing, constraints)
+    assert TransitionModel.unsupported_reason(block) is None
+    model = TransitionModel(block, 10000)
+    assert model.count() == count_valid_sequences(block)
+
+    random.seed(5)
+    for _ in range(20):
+        _, sample = model.sample(random)
+        assert sample_mismatch_experiment(block, sample) == {}
+
+
+def test_transition_gen_samples_without_replacement():
+    block = CrossBlock([color, size, color_repeats], [color, color_repeats], [])
+    result = TransitionGen.sample(block, 2000)
+    assert result.metrics['solution_count'] == 128
+    assert len(result.samples) == 128
+    assert len(set(tuple(s["color"] + s["size"]) for s in result.samples)) == 128
+
+
+def test_transition_model_unsupported():
+    color_history = Factor("color history", [
+        DerivedLevel("same", Window(lambda colors: colors[0] == colors[-2], [color], 3, 1)),
+        DerivedLevel("different", Window(lambda colors: colors[0] != colors[-2], [color], 3, 1))
+    ])
+    block = CrossBlock([color, size, color_history], [color, color_history], [])
+    assert TransitionModel.unsupported_reason(block) is not None
+
+    block = MultiCrossBlock([color, size], [[color], [size]], [])
+    assert TransitionModel.unsupported_reason(block) is not None
+
+
+def test_transition_model_can_reject_run_constraints():
+    block = CrossBlock([color, size, color_repeats], [size], [AtMostKInARow(1, (color_repeats, "yes")),
+                                                              MinimumTrials(5)])
+    exact = TransitionModel(block, 10000)
+    relaxed = TransitionModel(block, 10000, relax_runs=True)
+    assert relaxed.rejected_constraints and not relaxed.run_constraints
+    assert relaxed.count() > exact.count()
+
+    result = TransitionGen.sample_model(relaxed, 10000)
+    assert len(result.samples) == exact.count() == count_valid_sequences(block)
+    assert result.metrics['total_rejected'] == relaxed.count() - exact.count()
+    for sample in result.samples:
+        assert sample_mismatch_experiment(block, sample) == {}
+
+
+def test_transition_gen_rejects_when_counting_table_is_too_large(monkeypatch):
+    block = CrossBlock([color, size, color_repeats], [color, size], [AtMostKInARow(2, (color_repeats, "yes")),
+                                                                     MinimumTrials(8)])
+    monkeypatch.setattr(TransitionGen, '_MAX_STATES', 40)
+    assert TransitionGen.model(block) is None
+    model = TransitionGen.model(block, allow_rejection=True)
+    assert model is not None and model.rejected_constraints
+    result = TransitionGen.sample(block, 5)
+    assert len(result.samples) == 5
+    assert 'candidate_count' in result.metrics
+
+
+def test_transition_gen_seed_is_reproducible():
+    block = CrossBlock([color, size, color_repeats], [color, color_repeats], [])
+    runss = []
+    for global_seed in [1, 2]:
+        random.seed(global_seed)
+        runss.append(TransitionGen(seed=8).sample_object(block, 5).samples)
+    assert len(runss[0]) == 5
+    assert runss[1] == runss[0]
@@ -1,8 +1,8 @@
 import operator as op
 import pytest
 
-from sweetpea import CrossBlock
-from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial
+from sweetpea import CrossBlock, MinimumTrials, AtMostKInARow
+from sweetpea._internal.primitive import Factor, SimpleLevel, DerivedLevel, WithinTrial, Transition
 from sweetpea._internal.constraint import Reify
 from sweetpea._internal.sampling_strategy.random import UCSolutionEnumerator
 
@@ -12,6 +12,7 @@ congruency = Factor("congruency", [
     DerivedLevel("congruent",   WithinTrial(op.eq, [color, text])),
     DerivedLevel("incongruent", WithinTrial(op.ne, [color, text]))
 ])
+weighted = Factor("weighted", [SimpleLevel("a", 2), SimpleLevel("b", 1)])
 
 crossing = [color, text]
 design = [color, text]
@@ -147,3 +148,88 @@ def test_generate_sample_basic_stroop_uneven_colors(sequence_number, expected_so
                        [])
     enumerator = UCSolutionEnumerator(block)
     assert enumerator.factors_and_levels_to_names(enumerator.generate_sample(sequence_number)) == expected_solution
+
+
+@pytest.mark.parametrize('design, crossing, constraints', [
+    [[color, text], [color, text], []],
+    [[color, text, congruency], [congruency], []],
+    [[color, Factor("text", ["red", "blue", "green"])], [color], [MinimumTrials(5)]],
+    [[weighted, color], [weighted], [MinimumTrials(4)]],
+    [[color, text, weighted], [color, text], []],
+    [[color, text, Factor("repeated", [
+        DerivedLevel("yes", Transition(lambda c: c[0] == c[-1], [color])),
+        DerivedLevel("no",  Transition(lambda c: c[0] != c[-1], [color]))
+    ])], [color, text], []]
+])
+def test_rank_and_unrank_are_inverses(design, crossing, constraints):
+    block = CrossBlock(design, crossing, constraints)
+    enumerator = UCSolutionEnumerator(block)
+    samples = [enumerator.unrank(j) for j in range(enumerator.sequence_count())]
+    assert len(set([str(sample) for sample in samples])) == len(samples)
+    for j, sample in enumerate(samples):
+        assert enumerator.rank(sample) == j
+
+
+def test_weighted_uncrossed_levels_count_once():
+    block = CrossBlock([color, text, weighted], [color, text], [])
+    enumerator = UCSolutionEnumerator(block)
+    # 4! orders of the crossing, and 2 sizes for each of 4 trials
+    assert enumerator.sequence_count() == 24 * 2**4
+    for j in range(enumerator.sequence_count()):
+        assert enumerator.rank(enumerator.unrank(j)) == j
+
+
+def test_unrank_matches_generate_sample():
+    enumerator = UCSolutionEnumerator(block)
+    for j in range(enumerator.sequence_count()):
+        assert enumerator.unrank(j) == enumerator.factors_and_levels_to_names(enumerator.generate_sample(j))
+
+
+def test_rank_rejects_non_candidates():
+    enumerator = UCSolutionEnumerator(block)
+    with pytest.raises(ValueError):
+        enumerator.rank({'color': ['red', 'red', 'red', 'blue'], 'text': ['red', 'blue', 'red', 'blue']})
+    with pytest.raises(IndexError):
+        enumerator.unrank(enumerator.sequence_count())
+
+
+def test_partition():
+    enumerator = UCSolutionEnumerator(block)
+    parts = enumerator.partition(5)
+    assert len(parts) == 5
+    assert [j for part in parts for j in part] == list(range(enumerator.sequence_count()))
+
+
+def test_fill_in_derived_matches_level_predicates():
+    repeated = Factor("repeated", [
+        DerivedLevel("yes", Transition(lambda c: c[0] == c[-1], [color])),
+        DerivedLevel("no",  Transition(lambda c: c[0] != c[-1], [color]))
+    ])
+    block = CrossBlock([color, text, congruency, repeated], [color, congruency],
+                       [MinimumTrials(7), AtMostKInARow(3, (repeated, "yes"))])
+    enumerator = UCSolutionEnumerator(block)
+    for j in range(enumerator.sequence_count()):
+        sample = enumerator.unrank_run(j)
+        for f in [congruency, repeated]:
+            assert sample[f] == [(f.select_level_for_sample(i, sample) if f.applies_to_trial(i + 1) else None)
+                                 for i in range(7)]
+
+
+def test_source_combinations_rejected_by_several_derived_factors():
+    text_is_red = Factor("text is red?", [
+        DerivedLevel("yes", WithinTrial(lambda t: t == "red", [text])),
+        DerivedLevel("no",  WithinTrial(lambda t: t != "red", [text]))
+    ])
+    congruent = Factor("congruent?", [
+        DerivedLevel("yes", WithinTrial(op.eq, [color, text])),
+        DerivedLevel("no",  WithinTrial(op.ne, [color, text]))
+    ])
+    block = CrossBlock([color, text, text_is_red, congruent], [color, text_is_red, congruent], [])
+    enumerator = UCSolutionEnumerator(block)
+    # A text can be ruled out by both derived factors at once
+    expected = [len([t for t in text.levels
+                     if all(ci[f].window.predicate(*[(t if g == text else ci[g]).name for g in ci[f].window.factors])
+                            for f in [text_is_red, congruent])])
+                for ci in enumerator._crossing_instances]
+    assert 0 in expected
+    assert enumerator._components_shape.combinations_shapes == expected
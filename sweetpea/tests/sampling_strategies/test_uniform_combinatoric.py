@@ -2,12 +2,18 @@ import glob
 import operator as op
 import os
 import pytest
+import random
 import re
 
-from sweetpea import CrossBlock, Repeat, MinimumTrials, synthesize_trials, UniformGen
+from typing import List, cast
+
+from sweetpea import (CrossBlock, Repeat, MinimumTrials, synthesize_trials, synthesize_trials_iter,
+                      sample_mismatch_experiment, UniformGen)
 from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial, Transition, Window
-from sweetpea._internal.constraint import Exclude, ExactlyKInARow, AtMostKInARow, Reify
+from sweetpea._internal.constraint import Exclude, ExactlyKInARow, AtMostKInARow, Pin, Reify
 from sweetpea._internal.sampling_strategy.random import RandomGen, UCSolutionEnumerator
+from sweetpea._internal.sampling_strategy.base import SamplingResult
+from sweetpea._internal.sampling_strategy.transition import TransitionGen
 
 color = Factor("color", ["red", "blue"])
 text  = Factor("text",  ["red", "blue"])
@@ -113,6 +119,137 @@ def test_constraint_violation():
     assert are_constraints_violated(block, {color: [color[l] for l in ['red', 'red', 'red', 'blue']]}, enumer, 4, 0, 0) == True
     assert are_constraints_violated(block, {color: [color[l] for l in ['blue', 'red', 'red', 'red']]}, enumer, 4, 0, 0) == True
 
+@pytest.mark.parametrize('design, crossing, constraints', [
+    [[color, text, con_factor_within_trial], [color, text], [ExactlyKInARow(2, (color, red_color))]],
+    [[color, text, color_repeats_factor], [color, color_repeats_factor], [AtMostKInARow(1, (text, red_text))]],
+    [[color, text, color_repeats_factor], [color], [MinimumTrials(7), Pin(-1, (text, red_text))]],
+    [[color, text, con_factor_window], [color, con_factor_window], [MinimumTrials(5)]]
+])
+def test_batch_size_preserves_samples(design, crossing, constraints):
+    block = CrossBlock(design, crossing, constraints)
+    runss = []
+    for batch_size in [1, 3, 64]:
+        random.seed(7)
+        runss.append(synthesize_trials(block=block, samples=6, sampling_strategy=RandomGen(batch_size=batch_size)))
+    assert len(runss[0]) > 0
+    assert runss[1] == runss[0]
+    assert runss[2] == runss[0]
+
+@pytest.mark.parametrize('workers', [1, 3])
+def test_seeded_workers_are_reproducible(workers):
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [AtMostKInARow(1, (text, red_text))])
+    runss = []
+    for global_seed in [1, 2]:
+        random.seed(global_seed)
+        runss.append(synthesize_trials(block=block, samples=5,
+                                       sampling_strategy=RandomGen(batch_size=4, workers=workers, seed=42)))
+    assert len(runss[0]) == 5
+    assert len(set([str(run) for run in runss[0]])) == 5
+    assert runss[1] == runss[0]
+
+def test_in_process_worker_tasks_keep_the_callers_stream():
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [AtMostKInARow(1, (text, red_text))])
+    enumerator = RandomGen.sequence_enumerator(block)
+    rng = random.Random(5)
+    enumerator.use_random(rng)
+    RandomGen._RandomGen__task_context = (block, enumerator, 0, 4)  # type: ignore
+    try:
+        assert len(RandomGen._check_candidates_task((11, 4, None))) == 4
+    finally:
+        RandomGen._RandomGen__task_context = None  # type: ignore
+    assert enumerator._random is rng
+    assert rng.getstate() == random.Random(5).getstate()
+
+def test_index_range_partitions_cover_all_samples():
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [AtMostKInARow(1, (text, red_text))])
+    enumerator = RandomGen.sequence_enumerator(block)
+    everything = synthesize_trials(block=block, samples=enumerator.sequence_count(),
+                                   sampling_strategy=RandomGen(index_range=(0, enumerator.sequence_count())))
+    parts = cast(List[dict], [])
+    for index_range in enumerator.partition(3):
+        parts += synthesize_trials(block=block, samples=enumerator.sequence_count(),
+                                   sampling_strategy=RandomGen(index_range=index_range, workers=2, seed=1))
+    assert len(everything) > 0
+    assert sorted([str(run) for run in parts]) == sorted([str(run) for run in everything])
+    assert len(set([str(run) for run in everything])) == len(everything)
+
+def test_switches_to_fallback_when_estimate_is_too_long():
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [MinimumTrials(13), AtMostKInARow(1, (color_repeats_factor, "yes"))])
+    random.seed(3)
+    result = RandomGen(max_estimated_time=0, fallback=TransitionGen).sample_object(block, 40)
+    assert result.metrics['strategy_switch']['to'] == 'TransitionGen'
+    assert result.metrics['strategy_switch']['candidates'] >= RandomGen._MIN_ESTIMATE_CANDIDATES
+    assert len(result.samples) == 40
+    assert len(set([str(run) for run in result.samples])) == 40
+    for run in result.samples:
+        assert sample_mismatch_experiment(block, run) == {}
+
+    result = RandomGen(max_estimated_time=1000, fallback=TransitionGen).sample_object(block, 2)
+    assert 'strategy_switch' not in result.metrics
+    assert len(result.samples) == 2
+
+def test_fallback_replaces_duplicate_samples():
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [MinimumTrials(13), AtMostKInARow(1, (color_repeats_factor, "yes"))])
+
+    class RepeatingGen(TransitionGen):
+        # Produces each sequence twice
+        def sample_object(self, block, sample_count, budget=None):
+            samples = super().sample_object(block, sample_count, budget).samples
+            return SamplingResult([s for s in samples for _ in range(2)][:sample_count], {})
+
+    random.seed(3)
+    result = RandomGen(max_estimated_time=0, fallback=RepeatingGen(seed=1)).sample_object(block, 30)
+    assert len(result.samples) == 30
+    assert len(set([str(run) for run in result.samples])) == 30
+    assert result.metrics['fallback_duplicates'] > 0
+    assert result.metrics['stop_reason'] == 'complete'
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_synthesize_trials_iter_matches_synthesize_trials(workers):
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [AtMostKInARow(1, (text, red_text))])
+    runs = synthesize_trials(block=block, samples=5, sampling_strategy=RandomGen(workers=workers, seed=9))
+    iter_runs = synthesize_trials_iter(block=block, samples=5, sampling_strategy=RandomGen(workers=workers, seed=9))
+    assert next(iter_runs) == runs[0]
+    assert list(iter_runs) == runs[1:]
+
+    random.seed(4)
+    runs = synthesize_trials(block=block, samples=3, sampling_strategy=UniformGen)
+    random.seed(4)
+    assert list(synthesize_trials_iter(block=block, samples=3, sampling_strategy=UniformGen)) == runs
+
+@pytest.mark.parametrize('strategy', [RandomGen(seed=5), RandomGen(workers=2, seed=5), RandomGen(batch_size=4)])
+def test_resume_from_checkpoint_continues_sampling(strategy, tmp_path):
+    block = CrossBlock([color, text, color_repeats_factor],
+                       [color, color_repeats_factor],
+                       [AtMostKInARow(1, (text, red_text))])
+    random.seed(1)
+    runs = synthesize_trials(block=block, samples=20, sampling_strategy=strategy)
+
+    # Stop partway through, after some progress has been saved
+    path = str(tmp_path / "job.ckpt")
+    random.seed(1)
+    iter_runs = synthesize_trials_iter(block=block, samples=20, sampling_strategy=strategy,
+                                       checkpoint=path, checkpoint_interval=0)
+    assert [next(iter_runs) for _ in range(7)] == runs[:7]
+    iter_runs.close()
+
+    random.seed(2)
+    assert synthesize_trials(block=block, samples=20, sampling_strategy=strategy, resume_from=path) == runs
+    # A finished job produces the same samples again
+    assert synthesize_trials(block=block, samples=20, sampling_strategy=strategy, resume_from=path) == runs
+
 def test_minimum_trials_repeat():
     for min_trials in [1, 2, 3, 4, 5, 6, 7, 17, 55]:
         block = Repeat(CrossBlock([color, text],
@@ -0,0 +1,37 @@
+import pytest
+
+from sweetpea import CrossBlock, CMSGen, Factor, UniGen
+from sweetpea._internal.core.generate.utility import Solution
+from sweetpea._internal.sampling_strategy import unigen
+
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue"])
+
+
+@pytest.fixture
+def solver_calls(monkeypatch):
+    # Records the number of samples requested from each solver run
+    calls = []
+    def sample_uniform(sample_count, cnf, fresh, support, requests, use_docker=False, use_cmsgen=False):
+        calls.append(sample_count)
+        return [Solution([], 1) for _ in range(sample_count)]
+    monkeypatch.setattr(unigen, 'sample_uniform', sample_uniform)
+    return calls
+
+
+def test_sample_iter_runs_the_solver_per_batch(solver_calls):
+    block = CrossBlock([color, text], [color, text], [])
+    assert len(list(UniGen.sample_iter(block, 250))) == 250
+    assert solver_calls == [100, 100, 50]
+
+    solver_calls.clear()
+    assert len(list(UniGen.sample_iter(block, 250, batch_size=250))) == 250
+    assert solver_calls == [250]
+
+    solver_calls.clear()
+    assert len(list(CMSGen.sample_iter(block, 5, batch_size=2))) == 5
+    assert solver_calls == [2, 2, 1]
+
+    with pytest.raises(ValueError):
+        list(UniGen.sample_iter(block, 5, batch_size=0))
@@ -2,7 +2,7 @@ import operator as op
 import pytest
 from typing import cast
 
-from itertools import permutations
+from itertools import permutations, product
 
 from sweetpea import CrossBlock
 from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial, Transition, Window
@@ -493,3 +493,78 @@ def test_crossing_size_with_complex_excludes():
     block        = CrossBlock(design, crossing, constraints, require_complete_crossing=False)
 
     assert block.crossing_size() == 144
+
+
+def test_is_excluded_combination():
+    block = CrossBlock([color, text, size, con_factor],
+                       [color, text],
+                       [Exclude(con_level), Exclude(size["tiny"])],
+                       require_complete_crossing=False)
+
+    def reference(di):
+        if any([t[0] in di and di[t[0]] == t[1] for t in block.exclude]):
+            return True
+        return any([all([e[f] == di.get(f, None) for f in e]) for e in block.excluded_derived])
+
+    for c in permutations([color, text, size], 2):
+        for levels in product(*[f.levels for f in c]):
+            di = dict(zip(c, levels))
+            assert block.is_excluded_combination(di) == reference(di)
+
+    assert block.is_excluded_combination({color: red_color, text: red_text})
+    assert not block.is_excluded_combination({color: red_color, text: blue_text})
+    assert block.is_excluded_combination({size: size["tiny"]})
+    assert not block.is_excluded_combination({color: red_color})
+
+
+def test_add_implied_levels_to_samples():
+    block = CrossBlock([color, text, con_factor, color_repeats_factor], [color, text], [])
+    samples = [{"color": ["red", "red", "blue", "blue"], "text": ["red", "blue", "red", "blue"]},
+               {"color": ["blue", "red", "red", "blue"], "text": ["blue", "red", "blue", "red"]}]
+    assert block.add_implied_levels_to_samples(samples) == [
+        {"color": ["red", "red", "blue", "blue"], "text": ["red", "blue", "red", "blue"],
+         "congruent?": ["con", "inc", "inc", "con"],
+         "repeated color?": ["", "yes", "no", "yes"]},
+        {"color": ["blue", "red", "red", "blue"], "text": ["blue", "red", "blue", "red"],
+         "congruent?": ["con", "con", "inc", "inc"],
+         "repeated color?": ["", "no", "yes", "no"]}
+    ]
+    single = {"color": ["red", "blue", "blue", "red"], "text": ["red", "blue", "red", "blue"]}
+    assert block.add_implied_levels(single) == {
+        "color": ["red", "blue", "blue", "red"], "text": ["red", "blue", "red", "blue"],
+        "congruent?": ["con", "con", "inc", "inc"],
+        "repeated color?": ["", "no", "yes", "no"]}
+
+
+def test_factor_major_layout_permutes_formula():
+    from sweetpea._internal.constraint import AtMostKInARow, ExactlyKInARow, Pin
+    from sweetpea._internal.layout import FactorMajorLayout
+
+    def make_block():
+        return CrossBlock([color, text, con_factor, color_repeats_factor, congruent_bookend],
+                          [color, text],
+                          [AtMostKInARow(1, (con_factor, con_level)),
+                           ExactlyKInARow(2, (color_repeats_factor, yes_color_repeats)),
+                           Pin(0, (color, red_color))])
+
+    trial_major = make_block()
+    factor_major = make_block()
+    factor_major.use_variable_layout(FactorMajorLayout())
+
+    support = factor_major.variables_per_sample()
+    mapped = [factor_major.layout_variable(v) for v in range(1, support + 1)]
+    assert sorted(mapped) == list(range(1, support + 1))
+    assert mapped != list(range(1, support + 1))
+    for v in range(1, support + 1):
+        assert factor_major.canonical_variable(mapped[v - 1]) == v
+        assert factor_major.decode_variable(mapped[v - 1]) == trial_major.decode_variable(v)
+
+    def remap(v):
+        return v if abs(v) > support else (1 if v > 0 else -1) * mapped[abs(v) - 1]
+
+    tm_request = trial_major.build_backend_request()
+    fm_request = factor_major.build_backend_request()
+    assert fm_request.fresh == tm_request.fresh
+    assert fm_request.get_cnfs_as_json() == [[remap(v) for v in clause] for clause in tm_request.get_cnfs_as_json()]
+    assert ([(r.comparison, r.k, r.variables) for r in fm_request.ll_requests]
+            == [(r.comparison, r.k, [remap(v) for v in r.variables]) for r in tm_request.ll_requests])
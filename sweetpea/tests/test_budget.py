@@ -0,0 +1,91 @@
+import pytest
+
+from sweetpea import Budget, CrossBlock, MinimumTrials, RandomGen, TransitionGen, AtMostKInARow, synthesize_trials
+from sweetpea._internal.budget import BudgetMeter
+from sweetpea._internal.sampling_strategy.base import Gen, SamplingResult
+from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial
+
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue"])
+congruent = Factor("congruent?", [DerivedLevel("yes", WithinTrial(lambda c, t: c == t, [color, text])),
+                                  DerivedLevel("no", WithinTrial(lambda c, t: c != t, [color, text]))])
+
+
+def test_budget_meter_records_why_sampling_stopped():
+    meter = BudgetMeter(Budget(candidates=3, solver_calls=2))
+    assert meter.start_solver_call(1)
+    assert meter.start_solver_call(1)
+    assert not meter.start_solver_call(1)
+    metrics = {}
+    meter.record(metrics, 2, 5)
+    assert metrics['stop_reason'] == 'solver_call_budget'
+    assert metrics['budget_used']['solver_calls'] == 2
+    assert meter.remaining().candidates == 1
+
+    meter = BudgetMeter()
+    meter.spend_candidates(100)
+    assert not meter.exhausted()
+    meter.record(metrics, 1, 5)
+    assert metrics['stop_reason'] == 'exhausted'
+    meter.record(metrics, 5, 5)
+    assert metrics['stop_reason'] == 'complete'
+
+    meter = BudgetMeter(Budget(seconds=0))
+    assert meter.exhausted()
+    assert meter.stop_reason == 'time_budget'
+
+
+@pytest.mark.parametrize('batch_size', [1, 16])
+def test_random_gen_stops_at_candidate_budget(batch_size):
+    # The constraint rejects most candidates, so the budget runs out first
+    block = CrossBlock([color, text, congruent], [color, text], [MinimumTrials(12), AtMostKInARow(1, congruent)])
+    result = RandomGen(batch_size=batch_size).sample_object(block, 1000, budget=Budget(candidates=50))
+    assert result.metrics['stop_reason'] == 'candidate_budget'
+    assert result.metrics['budget_used']['candidates'] == 50
+    assert len(result.samples) < 1000
+
+    result = RandomGen(batch_size=batch_size).sample_object(block, 2)
+    assert result.metrics['stop_reason'] == 'complete'
+
+
+def test_strategies_stop_at_time_budget():
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(8)])
+    for strategy in [RandomGen, TransitionGen]:
+        result = strategy.sample(block, 100, budget=Budget(seconds=0))
+        assert result.samples == []
+        assert result.metrics['stop_reason'] == 'time_budget'
+
+
+@pytest.mark.parametrize('strategy', [RandomGen, RandomGen(batch_size=16)])
+def test_budget_stop_is_reported_with_checkpoint(tmp_path, capsys, strategy):
+    block = CrossBlock([color, text, congruent], [color, text], [MinimumTrials(12), AtMostKInARow(1, congruent)])
+    trials = synthesize_trials(block, 1000, sampling_strategy=strategy, checkpoint=str(tmp_path / "job.ckpt"),
+                               budget=Budget(candidates=50))
+    assert len(trials) < 1000
+    assert "reached the candidate_budget" in capsys.readouterr().out
+
+
+class OldSignatureGen(Gen):
+    # A strategy written before `sample` accepted a budget
+    @staticmethod
+    def class_name():
+        return 'OldSignatureGen'
+
+    @staticmethod
+    def sample(block, sample_count):
+        return SamplingResult(TransitionGen.sample(block, sample_count).samples, {})
+
+    def sample_object(self, block, sample_count):
+        return OldSignatureGen.sample(block, sample_count)
+
+
+def test_strategies_without_budget_argument():
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(8)])
+    assert len(synthesize_trials(block, 3, sampling_strategy=OldSignatureGen)) == 3
+    assert len(synthesize_trials(block, 3, sampling_strategy=OldSignatureGen())) == 3
+    assert len(list(OldSignatureGen.sample_iter(block, 3))) == 3
+    # Most candidates are rejected, so RandomGen switches to the fallback
+    block = CrossBlock([color, text, congruent], [color, text], [MinimumTrials(12), AtMostKInARow(1, congruent)])
+    result = RandomGen(max_estimated_time=0, fallback=OldSignatureGen).sample_object(block, 3000)
+    assert result.metrics['strategy_switch']['to'] == 'OldSignatureGen'
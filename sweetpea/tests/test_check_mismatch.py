@@ -0,0 +1,29 @@
+import numpy as np
+import pytest
+import random
+
+from sweetpea._internal.primitive import Factor, SimpleLevel
+from sweetpea._internal.check_mismatch import CrossingBalance, combinations_mismatched_weights
+from sweetpea._internal.sample_coding import SampleCoding
+
+
+color = Factor("color", ["red", "blue", "green"])
+size  = Factor("size",  [SimpleLevel("small", 2), SimpleLevel("large", 1)])
+
+
+@pytest.mark.parametrize('or_less', [False, True])
+@pytest.mark.parametrize('weight', [1, 2])
+def test_crossing_balance_matches_combinations_mismatched_weights(weight, or_less):
+    balance = CrossingBalance([color, size], weight)
+    coding = SampleCoding([size, color])
+    random.seed(3)
+    samples = [{color: [random.choice(color.levels) for _ in range(12)],
+                size: [random.choice(size.levels) for _ in range(12)]}
+               for _ in range(50)]
+    codes = np.stack([coding.encode(sample, 12) for sample in samples])
+    for start, end in [(0, 12), (3, 9), (5, 5)]:
+        expected = [combinations_mismatched_weights(start, end, weight, [color, size], sample, or_less)
+                    for sample in samples]
+        assert [balance.mismatches(start, end, sample, or_less) for sample in samples] == expected
+        columns = [coding.column(color), coding.column(size)]
+        assert balance.coded_mismatches(start, end, codes, columns, or_less).tolist() == expected
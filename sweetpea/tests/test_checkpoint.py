@@ -0,0 +1,77 @@
+import os
+import pytest
+
+from sweetpea import CrossBlock, MinimumTrials, AtMostKInARow, Pin, RandomGen, synthesize_trials
+from sweetpea._internal.checkpoint import Checkpoint, design_fingerprint
+from sweetpea._internal.primitive import Factor, DerivedLevel, Level, WithinTrial, Transition
+
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue"])
+
+
+def test_checkpoint_saves_and_resumes_state(tmp_path):
+    block = CrossBlock([color, text], [color, text], [])
+    path = str(tmp_path / "job.ckpt")
+
+    assert Checkpoint(path, resume_from=path).resumed_state("RandomGen", block) is None
+    assert Checkpoint(path).resumed_state("RandomGen", block) is None
+
+    Checkpoint(path).save("RandomGen", block, {'samples': [1, 2]})
+    assert os.listdir(tmp_path) == ["job.ckpt"]
+    assert Checkpoint(path, resume_from=path).resumed_state("RandomGen", block) == {'samples': [1, 2]}
+
+
+def test_checkpoint_rejects_other_strategies_and_designs(tmp_path):
+    block = CrossBlock([color, text], [color, text], [])
+    path = str(tmp_path / "job.ckpt")
+    Checkpoint(path).save("RandomGen", block, {})
+
+    with pytest.raises(ValueError):
+        Checkpoint(path, resume_from=path).resumed_state("IterateSATGen", block)
+    with pytest.raises(ValueError):
+        Checkpoint(path, resume_from=path).resumed_state("RandomGen",
+                                                         CrossBlock([color, text], [color], [MinimumTrials(8)]))
+
+
+def test_checkpoint_saves_only_when_due(tmp_path):
+    block = CrossBlock([color, text], [color, text], [])
+    path = str(tmp_path / "job.ckpt")
+    Checkpoint(path, interval=3600).save_if_due("RandomGen", block, lambda: {})
+    assert not os.path.exists(path)
+    Checkpoint(path, interval=0).save_if_due("RandomGen", block, lambda: {})
+    assert os.path.exists(path)
+
+
+def test_design_fingerprint_includes_parameters():
+    def fingerprint(constraints, crossing=[color, text], design=[color, text]):
+        return design_fingerprint(CrossBlock(design, crossing, constraints))
+
+    base = fingerprint([AtMostKInARow(3, color["red"])])
+    assert base == fingerprint([AtMostKInARow(3, color["red"])])
+    assert base != fingerprint([AtMostKInARow(1, color["red"])])
+    assert base != fingerprint([AtMostKInARow(3, color["blue"])])
+    assert base != fingerprint([AtMostKInARow(3, color["red"])], crossing=[color])
+    assert fingerprint([Pin(0, color["red"])]) != fingerprint([Pin(-1, color["red"])])
+
+    weighted = Factor("color", [Level("red", 2), Level("blue", 1)])
+    assert base != fingerprint([AtMostKInARow(3, weighted["red"])], crossing=[weighted, text],
+                               design=[weighted, text])
+
+    def derived(window):
+        return Factor("same", [DerivedLevel("yes", window(lambda c, t: c == t, [color, text])),
+                               DerivedLevel("no", window(lambda c, t: c != t, [color, text]))])
+    within = derived(WithinTrial)
+    transition = derived(Transition)
+    assert (fingerprint([], design=[color, text, within])
+            != fingerprint([], design=[color, text, transition]))
+
+
+def test_resume_after_constraint_change_fails(tmp_path):
+    path = str(tmp_path / "job.ckpt")
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(4), AtMostKInARow(3, color["red"])])
+    synthesize_trials(block, 2, sampling_strategy=RandomGen, checkpoint=path)
+
+    changed = CrossBlock([color, text], [color, text], [MinimumTrials(4), AtMostKInARow(1, color["blue"])])
+    with pytest.raises(ValueError):
+        synthesize_trials(changed, 10, sampling_strategy=RandomGen, resume_from=path)
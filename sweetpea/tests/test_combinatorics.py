@@ -3,11 +3,12 @@ import pytest
 from math import factorial
 
 from sweetpea._internal.combinatorics import (
-    extract_components, compute_jth_inversion_sequence, construct_permutation,
+    extract_components, extract_components_batch, compute_jth_inversion_sequence, construct_permutation,
     compute_jth_combination, compute_jth_permutation_prefix,
     count_prefixes_of_permutations_with_copies, recur_count_prefixes_of_permutations_with_copies, k_prefixes_of_permutations_with_copies,
     count_permutations_with_copies, compute_jth_prefix_of_permutations_with_copies,
-    PermutationMemo
+    construct_permutation_with_varying_copies, count_remaining_permutations,
+    sum_prefix_products_of_permutations_with_copies, PermutationMemo, PermutationMemoRegistry
 )
 
 @pytest.mark.parametrize('sizes, n, expected', [
@@ -40,6 +41,19 @@ def test_extract_components(sizes, n, expected):
     assert extract_components(sizes, n) == expected
 
 
+def test_extract_components_batch():
+    sizes = [4, 2, 3]
+    assert extract_components_batch(sizes, list(range(24))).tolist() == [extract_components(sizes, n)
+                                                                         for n in range(24)]
+    # Integers that need several groups of int64 digits
+    sizes = [3, 2, 5] * 40
+    total = 1
+    for s in sizes:
+        total *= s
+    ns = [0, 1, total // 7, total - 1]
+    assert extract_components_batch(sizes, ns).tolist() == [extract_components(sizes, n) for n in ns]
+
+
 @pytest.mark.parametrize('n, j, sequence', [
     # 4! = 24 Sequences
     [4, 0,  [0, 0, 0, 0]],
@@ -207,3 +221,82 @@ def test_construct_jth_prefix_permutation_with_copies(q, m, first_n):
     assert len(p) == first_n
     assert tuple(p) not in found
     found[tuple(p)] = True
+
+@pytest.mark.parametrize('counters',
+                         [[2, 1, 3],
+                          [1, 0, 2, 2],
+                          [4, 4]])
+def test_construct_permutation_with_varying_copies_is_lexicographic(counters):
+    q = len(counters)
+    perms = [tuple(construct_permutation_with_varying_copies(j, q, counters))
+             for j in range(count_remaining_permutations(counters))]
+    assert perms == sorted(set(perms))
+    assert all([list(p).count(i) == c for p in perms for i, c in enumerate(counters)])
+
+def test_construct_permutation_skips_unused_elements():
+    n = 300
+    j = factorial(n) // 3 + 12345
+    inversion_sequence = compute_jth_inversion_sequence(n, n, j)
+    unused = list(range(n))
+    assert construct_permutation(inversion_sequence, n) == [unused.pop(skip) for skip in inversion_sequence]
+
+@pytest.mark.parametrize('q, m_or_counters, first_n, weights',
+                         [[3, 1, 2, [1, 2, 3]],
+                          [3, 2, 4, [2, 1, 5]],
+                          [4, 3, 3, [1, 1, 2, 7]],
+                          [3, [1, 3, 2], 6, [3, 1, 2]],
+                          [4, [2, 1, 3, 2], 5, [1, 4, 2, 3]]])
+def test_sum_prefix_products_of_permutations_with_copies(q, m_or_counters, first_n, weights):
+    pmemo = PermutationMemo()
+    expected = 0
+    for j in range(count_prefixes_of_permutations_with_copies(q, m_or_counters, first_n, pmemo)):
+        prod = 1
+        for p in compute_jth_prefix_of_permutations_with_copies(q, m_or_counters, first_n, j, pmemo):
+            prod *= weights[p]
+        expected += prod
+    assert sum_prefix_products_of_permutations_with_copies(q, m_or_counters, first_n, weights) == expected
+
+def test_permutation_memo_registry(tmp_path):
+    registry = PermutationMemoRegistry(tmp_path)
+    pmemo = registry.get(5, [2, 1, 3, 2, 2])
+    assert registry.get(5, [2, 1, 3, 2, 2]) is pmemo
+    assert registry.get(5, 2) is not pmemo
+    count = count_prefixes_of_permutations_with_copies(5, [2, 1, 3, 2, 2], 7, pmemo)
+    registry.save()
+
+    # A fresh registry on the same directory starts with the saved table
+    loaded = PermutationMemoRegistry(tmp_path).get(5, [2, 1, 3, 2, 2])
+    assert loaded.memo == pmemo.memo
+    assert count_prefixes_of_permutations_with_copies(5, [2, 1, 3, 2, 2], 7, loaded) == count
+    assert count_prefixes_of_permutations_with_copies(5, [2, 1, 3, 2, 2], 5, loaded) == \
+        count_prefixes_of_permutations_with_copies(5, [2, 1, 3, 2, 2], 5, PermutationMemo())
+
+    # Saving beyond the size limit discards the least recently used tables
+    small = PermutationMemoRegistry(tmp_path, max_bytes=0)
+    count_prefixes_of_permutations_with_copies(6, 3, 10, small.get(6, 3))
+    small.save()
+    assert list(tmp_path.glob("*.json")) == []
+
+
+def test_permutation_memo_registry_memory_limit(tmp_path):
+    # The limit allows about one table of this size
+    registry = PermutationMemoRegistry(tmp_path, max_bytes=6000)
+    first = registry.get(5, [2, 1, 3, 2, 2])
+    count_prefixes_of_permutations_with_copies(5, [2, 1, 3, 2, 2], 8, first)
+    assert registry.get(5, [2, 1, 3, 2, 2]) is first
+    second = registry.get(6, 3)
+    count_prefixes_of_permutations_with_copies(6, 3, 12, second)
+    third = registry.get(4, 2)
+
+    # The least recently used table was discarded from memory and saved
+    assert list(registry.memos) == [(6, 3), (4, 2)]
+    assert list(tmp_path.glob("*.json")) != []
+    again = registry.get(5, [2, 1, 3, 2, 2])
+    assert again is not first
+    assert again.memo == first.memo
+
+    # Only tables that have grown are saved
+    registry.save()
+    saved = {p: p.stat().st_mtime_ns for p in tmp_path.glob("*.json")}
+    registry.save()
+    assert {p: p.stat().st_mtime_ns for p in tmp_path.glob("*.json")} == saved
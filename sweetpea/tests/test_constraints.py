@@ -2,14 +2,15 @@
 import operator as op
 import pytest
 
-from itertools import permutations
+from itertools import permutations, product
 
-from sweetpea import CrossBlock
+from sweetpea import CrossBlock, MinimumTrials
 from sweetpea._internal.block import Block
 from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial, Transition, Window, SimpleLevel
-from sweetpea._internal.constraint import Constraint, Consistency, Cross, Derivation, AtMostKInARow, ExactlyKInARow, AtLeastKInARow, Exclude, Pin, Reify
+from sweetpea._internal.constraint import Constraint, Consistency, Cross, Derivation, AtMostKInARow, ExactlyKInARow, AtLeastKInARow, ExactlyK, Exclude, Pin, Reify
 from sweetpea._internal.backend import LowLevelRequest, BackendRequest
 from sweetpea._internal.logic import And, Or, If, Iff, Not, to_cnf_tseitin
+from sweetpea._internal.sample_coding import SampleCoding
 
 color = Factor("color", ["red", "blue"])
 text  = Factor("text",  ["red", "blue"])
@@ -761,3 +762,58 @@ def test_pin():
     backend_request = BackendRequest(0)
     f.apply(block, backend_request)
     assert backend_request.cnfs == [And([1, -1])]
+
+
+@pytest.mark.parametrize('constraint', [
+    AtMostKInARow(2, color["red"]),
+    AtLeastKInARow(2, color["red"]),
+    ExactlyKInARow(2, color["red"]),
+    ExactlyK(3, color["red"]),
+    Pin(-2, color["blue"])
+])
+@pytest.mark.parametrize('segment', [1, 2, 4])
+def test_potential_prefix_conforms(constraint, segment):
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(7)])
+    for levels in product(color.levels, repeat=7):
+        sample = {color: list(levels)}
+        # A sample conforms exactly when every prefix conforms
+        prefixes = [constraint.potential_prefix_conforms({color: list(levels[:end])}, block, start, end)
+                    for start, end in [(start, min(start + segment, 7)) for start in range(0, 7, segment)]]
+        assert all(prefixes) == constraint.potential_sample_conforms(sample, block)
+
+
+class RunsCheckedTogether(AtMostKInARow):
+    # Uses the generic batch check, which gathers each sample's runs
+    def _individual_count_check(self):
+        return None
+
+
+@pytest.mark.parametrize('constraint', [
+    AtMostKInARow(2, color["red"]),
+    AtLeastKInARow(2, color["red"]),
+    ExactlyKInARow(2, color["red"]),
+    RunsCheckedTogether(2, color["red"]),
+    ExactlyK(3, color["red"]),
+    Pin(-2, color["blue"])
+])
+def test_potential_coded_samples_conform(constraint):
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(7)])
+    samples = [{color: list(levels)} for levels in product(color.levels, repeat=7)]
+    coding = SampleCoding([color])
+    codes = coding.empty(len(samples), 7)
+    for i, sample in enumerate(samples):
+        codes[i] = coding.encode(sample, 7)
+    # Checking all samples together agrees with checking each one
+    conforms = constraint.potential_coded_samples_conform(codes, coding, block)
+    assert conforms.tolist() == [constraint.potential_sample_conforms(sample, block) for sample in samples]
+
+
+def test_samples_mismatch_constraints_with_different_shapes():
+    block = CrossBlock([color, text], [color, text], [AtMostKInARow(1, color["red"])])
+    samples = [{"color": ["red", "red", "blue", "blue"], "text": ["red", "blue", "red", "blue"]},
+               {"color": ["blue", "red", "red", "blue", "red", "blue"]},
+               {"color": ["red", "blue", "red"], "text": ["red", "red", "red"]},
+               {"color": ["blue", "red", "blue", "red"], "text": ["red", "blue", "red", "blue"]}]
+    # Checking all samples together agrees with checking each one
+    assert block.samples_mismatch_constraints(samples) == [block.sample_mismatch_constraints(s) for s in samples]
+    assert [len(mismatches) for mismatches in block.samples_mismatch_constraints(samples)] == [1, 1, 0, 0]
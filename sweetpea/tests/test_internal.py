@@ -1,7 +1,8 @@
 import operator as op
+import random
 
 from sweetpea._internal.level import get_all_levels
-from sweetpea._internal.iter import intersperse
+from sweetpea._internal.iter import intersperse, Windows, IndexShuffle
 from sweetpea._internal.primitive import Factor, DerivedLevel, Transition
 
 
@@ -31,3 +32,22 @@ def test_intersperse():
 
     assert list(intersperse('', ['yes', 'no', 'yes'], 0)) == \
         ['yes', 'no', 'yes']
+
+def test_windows():
+    windows = Windows([1, 2, 3, 4, 5], 3)
+    assert len(windows) == 3
+    assert list(windows) == [[1, 2, 3], [2, 3, 4], [3, 4, 5]]
+    assert windows[-1] == [3, 4, 5]
+    assert list(windows[:2]) == [[1, 2, 3], [2, 3, 4]]
+    assert list(Windows([1, 2], 3)) == []
+
+
+def test_index_shuffle():
+    shuffle = IndexShuffle(range(5, 25), random.Random(1))
+    drawn = shuffle.draw(7)
+    state = shuffle.get_state()
+    rest = shuffle.draw(100)
+    assert sorted(drawn + rest) == list(range(5, 25))
+    assert shuffle.remaining == 0
+    shuffle.set_state(state)
+    assert shuffle.draw(100) == rest
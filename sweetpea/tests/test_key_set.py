@@ -0,0 +1,94 @@
+import pytest
+
+from sweetpea import CrossBlock, Factor, RandomGen, synthesize_trials
+from sweetpea._internal.key_set import HashedKeySet, BloomKeySet, make_key_set
+from sweetpea._internal.sampling_strategy import random as random_strategy
+
+
+def test_hashed_key_set():
+    keys = HashedKeySet()
+    for i in range(1000):
+        assert keys.add((i, (i % 7, (i, i + 1)), ()))
+    assert len(keys) == 1000
+    for i in range(1000):
+        assert (i, (i % 7, (i, i + 1)), ()) in keys
+        assert not keys.add((i, (i % 7, (i, i + 1)), ()))
+    assert (1000, (6, (1000, 1001)), ()) not in keys
+    assert keys.nbytes >= 1000 * 16
+    assert keys.metrics()['keys'] == 1000
+
+
+def test_bloom_key_set():
+    keys = BloomKeySet(capacity=100, error_rate=1e-4)
+    for i in range(1000):
+        keys.add((i, i * i))
+    assert len(keys) <= 1000
+    assert all((i, i * i) in keys for i in range(1000))
+    false_positives = sum(((i, i * i) in keys) for i in range(1000, 11000))
+    assert false_positives <= 5
+    hashed = HashedKeySet()
+    for i in range(1000):
+        hashed.add((i, i * i))
+    assert keys.nbytes < hashed.nbytes
+
+
+def test_key_digests_are_canonical():
+    # Digests are saved in checkpoints, so they must not depend on the
+    # Python version
+    keys = HashedKeySet()
+    assert keys._digest((1, (2, -3), 'red', 1 << 100)).hex() == '14575db6716e229129f6a5aeec6f411a'
+    assert keys._digest((1, (2,))) != keys._digest(((1, 2),))
+    assert keys._digest((256,)) != keys._digest((1, 0))
+    assert keys._digest(('ab', 'c')) != keys._digest(('a', 'bc'))
+    assert keys._digest([1, 2]) == keys._digest((1, 2))
+    with pytest.raises(TypeError):
+        keys._digest((1.5,))
+
+
+def test_bloom_key_set_saturation():
+    keys = BloomKeySet(max_repeats=3)
+    assert keys.add((1,))
+    assert not keys.add((1,))
+    assert not keys.add((1,))
+    assert keys.add((2,))
+    assert not keys.saturated()
+    for _ in range(3):
+        keys.add((2,))
+    assert keys.saturated()
+    assert keys.metrics()['saturated']
+    assert not HashedKeySet().saturated()
+
+
+def test_make_key_set():
+    assert isinstance(make_key_set('hashed'), HashedKeySet)
+    assert isinstance(make_key_set('bloom'), BloomKeySet)
+    with pytest.raises(ValueError):
+        make_key_set('other')
+
+
+@pytest.mark.parametrize('dedup', ['hashed', 'bloom'])
+def test_random_gen_dedup(dedup):
+    color = Factor("color", ["red", "blue"])
+    text  = Factor("text",  ["red", "blue"])
+    block = CrossBlock([color, text], [color, text], [])
+    result = RandomGen(dedup=dedup).sample_object(block, 30)
+    assert len(result.samples) == 24
+    assert len(set([str(run) for run in result.samples])) == 24
+    assert result.metrics['dedup']['kind'] == dedup
+    assert result.metrics['dedup']['keys'] == 24
+
+
+@pytest.mark.parametrize('batch_size', [1, 8])
+def test_random_gen_stops_when_bloom_saturates(monkeypatch, batch_size):
+    # A filter this small reports some undrawn sequences as drawn, so they
+    # can never be sampled
+    monkeypatch.setattr(random_strategy, 'make_key_set',
+                        lambda kind: BloomKeySet(capacity=1, error_rate=0.9, max_repeats=1000))
+    color = Factor("color", ["red", "blue"])
+    text  = Factor("text",  ["red", "blue"])
+    block = CrossBlock([color, text], [color, text], [])
+    result = RandomGen(dedup='bloom', batch_size=batch_size).sample_object(block, 30)
+    assert len(result.samples) < 24
+    assert len(set([str(run) for run in result.samples])) == len(result.samples)
+    assert result.metrics['dedup']['keys'] == len(result.samples)
+    assert result.metrics['dedup']['saturated']
@@ -101,6 +101,20 @@ def test_factor_applies_to_trial():
     assert color3.applies_to_trial(1) == True
 
 
+def test_factor_applicable_trials_through():
+    f = Factor('f', [DerivedLevel('l', Window(op.eq, [color], 2, 2))])
+    g = Factor('g', [DerivedLevel('l', Window(op.eq, [color], 3, 2, 4))])
+    for factor in [color, color_repeats_factor, color3_repeats_factor, f, g]:
+        count = 0
+        assert factor.applicable_trials_through(0) == 0
+        assert factor.nth_applicable_trial(0) == 0
+        for t in range(1, 30):
+            if factor.applies_to_trial(t):
+                count += 1
+                assert factor.nth_applicable_trial(count) == t
+            assert factor.applicable_trials_through(t) == count
+
+
 def test_derived_level_validation():
     DerivedLevel(42, WithinTrial(op.eq, [color, text]))
     DerivedLevel("name", WithinTrial(lambda x: x, [color]))
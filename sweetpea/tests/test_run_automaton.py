@@ -0,0 +1,46 @@
+import operator as op
+import pytest
+import random
+
+from sweetpea import CrossBlock, MinimumTrials
+from sweetpea._internal.primitive import Factor, DerivedLevel, WithinTrial
+from sweetpea._internal.constraint import AtMostKInARow, AtLeastKInARow, ExactlyKInARow
+from sweetpea._internal.sampling_strategy.random import UCSolutionEnumerator
+
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue", "green"])
+congruency = Factor("congruency", [
+    DerivedLevel("congruent",   WithinTrial(op.eq, [color, text])),
+    DerivedLevel("incongruent", WithinTrial(op.ne, [color, text]))
+])
+
+
+@pytest.mark.parametrize('design, crossing, constraints', [
+    [[color, text], [color, text], [AtMostKInARow(1, color)]],
+    [[color, text], [color], [AtMostKInARow(1, (color, "red")), MinimumTrials(5)]],
+    [[color, text, congruency], [color, congruency], [ExactlyKInARow(2, color)]],
+    [[color, text], [color, text], [AtLeastKInARow(2, (color, "red"))]]
+])
+def test_run_length_sampler_counts_valid_sequences(design, crossing, constraints):
+    block = CrossBlock(design, crossing, constraints)
+    enumerator = UCSolutionEnumerator(block)
+    assert enumerator.run_length_sampler() is not None
+
+    valid = []
+    for j in range(enumerator.sequence_count()):
+        run = enumerator.unrank_run(j)
+        if all(c.potential_sample_conforms(run, block) for c in block.constraints):
+            valid.append(enumerator.factors_and_levels_to_names(run))
+    assert enumerator.run_length_sequence_count() == len(valid)
+
+    random.seed(11)
+    for _ in range(20):
+        _, run = enumerator.generate_run_length_sample()
+        assert enumerator.factors_and_levels_to_names(run) in valid
+
+
+def test_run_length_sampler_requires_crossed_level():
+    shape = Factor("shape", ["circle", "square"])
+    block = CrossBlock([color, text, shape], [color, text], [AtMostKInARow(1, shape)])
+    assert UCSolutionEnumerator(block).run_length_sampler() is None
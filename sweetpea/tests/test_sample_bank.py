@@ -0,0 +1,57 @@
+import pytest
+
+from sweetpea import (
+    CrossBlock, Factor, Level, DerivedLevel, Transition, MinimumTrials, AtMostKInARow, RandomGen,
+    SampleBank, save_sample_bank, synthesize_trials
+)
+
+
+color = Factor("color", ["red", "blue"])
+text  = Factor("text",  ["red", "blue"])
+repeated = Factor("repeated?", [DerivedLevel("yes", Transition(lambda c: c[-1] == c[0], [color])),
+                                DerivedLevel("no", Transition(lambda c: c[-1] != c[0], [color]))])
+
+
+def test_sample_bank_draws_each_sequence_once(tmp_path):
+    block = CrossBlock([color, text, repeated], [color, text], [])
+    path = str(tmp_path / "stroop.bank")
+    assert save_sample_bank(block, path, 100, RandomGen(seed=1)) == 24
+
+    bank = SampleBank(path, block, seed=2)
+    assert len(bank) == 24
+    drawn = bank.draw(10) + bank.draw(20)
+    assert len(drawn) == 24
+    assert bank.remaining == 0
+    assert bank.draw() == []
+    assert sorted(map(str, drawn)) == sorted(map(str, synthesize_trials(block, 100, RandomGen)))
+    assert drawn[0]['repeated?'][0] == ""
+
+    again = SampleBank(path, block, seed=2).draw(24)
+    assert again == drawn
+    assert SampleBank(path, block, order='sequential').draw(24) == [bank[i] for i in range(24)]
+
+
+def test_sample_bank_rejects_other_designs(tmp_path):
+    block = CrossBlock([color, text], [color, text], [])
+    path = str(tmp_path / "stroop.bank")
+    save_sample_bank(block, path, 3, RandomGen)
+    assert len(SampleBank(path, block).draw(5)) == 3
+
+    with pytest.raises(ValueError):
+        SampleBank(path, CrossBlock([color, text], [color, text], [MinimumTrials(8)]))
+    with pytest.raises(ValueError):
+        SampleBank(path, block, order='backward')
+
+
+def test_sample_bank_rejects_changed_constraints_and_weights(tmp_path):
+    block = CrossBlock([color, text], [color, text], [MinimumTrials(4), AtMostKInARow(3, color["red"])])
+    path = str(tmp_path / "stroop.bank")
+    save_sample_bank(block, path, 10, RandomGen)
+
+    with pytest.raises(ValueError):
+        SampleBank(path, CrossBlock([color, text], [color, text],
+                                    [MinimumTrials(4), AtMostKInARow(1, color["blue"])]))
+    weighted = Factor("color", [Level("red", 2), Level("blue", 1)])
+    with pytest.raises(ValueError):
+        SampleBank(path, CrossBlock([weighted, text], [weighted, text],
+                                    [MinimumTrials(4), AtMostKInARow(3, weighted["red"])]))